@@ -0,0 +1,7 @@
+from pathlib import Path
+import sys
+
+# the benchmarks reuse the schemas and messages of the unit tests
+_TESTS_DIR = str(Path(__file__).resolve().parent.parent / 'tests')
+if _TESTS_DIR not in sys.path:
+    sys.path.append(_TESTS_DIR)
@@ -0,0 +1,71 @@
+"""Benchmarks of the transforms over the test message shapes.
+
+Run from the protobuf_utility_module directory:
+
+    python -m benchmarks run --sizes 1000 100000 --output results.json
+    python -m benchmarks compare results.json --threshold 0.1
+    python -m benchmarks run --output benchmarks/baseline.json
+
+compare exits with status 1 when a benchmark regressed against the baseline.
+"""
+import argparse
+from pathlib import Path
+import sys
+from typing import List, Optional
+
+from benchmarks.suite import BASELINE_PATH
+from benchmarks.suite import DEFAULT_REPEAT
+from benchmarks.suite import DEFAULT_SIZES
+from benchmarks.suite import DEFAULT_THRESHOLD
+from benchmarks.suite import SHAPES
+from benchmarks.suite import STAGES
+from benchmarks.suite import compare_results
+from benchmarks.suite import format_result
+from benchmarks.suite import load_results
+from benchmarks.suite import run_benchmarks
+from benchmarks.suite import save_results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks', description=__doc__.split('\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    run_parser.add_argument('--shapes', nargs='+', choices=list(SHAPES))
+    run_parser.add_argument('--stages', nargs='+', choices=list(STAGES))
+    run_parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    run_parser.add_argument('--output', type=Path, help='json file to save the results to')
+
+    compare_parser = commands.add_parser(
+        'compare', help='compare results with a baseline, fail on regressions')
+    compare_parser.add_argument('results', type=Path)
+    compare_parser.add_argument('--baseline', type=Path, default=BASELINE_PATH)
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        results = run_benchmarks(
+            args.sizes, args.shapes, args.stages, args.repeat,
+            report=lambda result: print(format_result(result), flush=True))
+        if args.output is not None:
+            save_results(results, args.output)
+        return 0
+
+    regressions = compare_results(
+        load_results(args.baseline), load_results(args.results), args.threshold)
+    for regression in regressions:
+        print(
+            f'{regression.shape:<14}{regression.stage:<12}{regression.size:>10} '
+            f'{regression.metric:<12}{regression.baseline:>14.0f} -> {regression.current:<14.0f}'
+            f'{regression.change:+.1%}')
+    if regressions:
+        print(f'{len(regressions)} regressions beyond {args.threshold:.0%}')
+        return 1
+    print(f'no regressions beyond {args.threshold:.0%}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
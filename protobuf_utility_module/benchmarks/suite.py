@@ -0,0 +1,358 @@
+from datetime import datetime, timezone
+import gc
+import itertools
+import json
+from pathlib import Path
+import platform
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import google.protobuf
+from google.protobuf.any_pb2 import Any as ProtoAny
+
+import test_data as td
+
+from protobuf_utility.transforms.csv_transformer import flatten_proto_to_csv
+from protobuf_utility.transforms.csv_transformer import flatten_same_proto_stream_to_csv
+from protobuf_utility.transforms.graphql_transformer import proto_definition_to_graphql_query
+from protobuf_utility.transforms.list_transformer import flatten_proto_to_list
+
+
+# Message counts of a default run.
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+
+# Number of timed runs of each benchmark, the fastest is kept.
+DEFAULT_REPEAT = 3
+
+# Relative throughput loss or peak memory growth reported as a regression by compare_results.
+DEFAULT_THRESHOLD = 0.1
+
+# Maximum number of messages of the run traced for peak memory, tracing slows the transforms
+# down about tenfold and the streaming stages reach their peak long before.
+MEMORY_SAMPLE_SIZE = 10_000
+
+# Results compared with by default.
+BASELINE_PATH = Path(__file__).resolve().parent / 'baseline.json'
+
+# Number of distinct messages each shape cycles through, so the input stream does not grow with
+# the benchmark size and memory measures the transform.
+_POOL_SIZE = 16
+
+# Number of elements of the wide map and long repeated shapes.
+_WIDE = 64
+
+
+class BenchmarkResult(NamedTuple):
+    """Measurements of one stage of one shape at one size.
+    Attributes:
+        shape (str): name of the message shape.
+        message (str): full name of the message type of the shape.
+        stage (str): name of the transform stage.
+        size (int): number of messages processed.
+        seconds (float): fastest wall time of the stage.
+        throughput (float): messages processed per second.
+        peak_memory (int): bytes of python memory allocated at the peak of the stage, over at most
+            MEMORY_SAMPLE_SIZE messages.
+    """
+    shape: str
+    message: str
+    stage: str
+    size: int
+    seconds: float
+    throughput: float
+    peak_memory: int
+
+
+class Regression(NamedTuple):
+    """A benchmark that got slower or bigger than its baseline by more than the threshold.
+    Attributes:
+        shape (str): name of the message shape.
+        stage (str): name of the transform stage.
+        size (int): number of messages processed.
+        metric (str): 'throughput' or 'peak_memory'.
+        baseline (float): value of the metric in the baseline.
+        current (float): value of the metric in the compared results.
+        change (float): relative change of the metric, negative when it decreased.
+    """
+    shape: str
+    stage: str
+    size: int
+    metric: str
+    baseline: float
+    current: float
+    change: float
+
+
+# region Public Methods
+def run_benchmarks(
+        sizes: Iterable[int] = DEFAULT_SIZES,
+        shapes: Optional[Iterable[str]] = None,
+        stages: Optional[Iterable[str]] = None,
+        repeat: int = DEFAULT_REPEAT,
+        report: Optional[Callable[[BenchmarkResult], None]] = None) -> List[BenchmarkResult]:
+    """Runs every stage over every message shape at every size. Each benchmark is timed repeat
+    times without tracing and the fastest run is kept, then run once more over at most
+    MEMORY_SAMPLE_SIZE messages under tracemalloc for its peak memory so tracing does not slow
+    down the timed runs. Memory held by the protobuf runtime outside of python objects is not
+    traced.
+    Args:
+        sizes (Iterable[int]): numbers of messages to process.
+        shapes (Optional[Iterable[str]]): names of the shapes to run, all when None.
+        stages (Optional[Iterable[str]]): names of the stages to run, all when None.
+        repeat (int): number of timed runs of each benchmark.
+        report (Optional[Callable[[BenchmarkResult], None]]): called with each result as soon as
+            it is measured.
+    Returns:
+        List[BenchmarkResult]: measurements ordered by shape, stage and size.
+    """
+    shape_names = _select(SHAPES, shapes, 'shape')
+    stage_names = _select(STAGES, stages, 'stage')
+    results = []
+    for shape in shape_names:
+        pool = SHAPES[shape]()
+        for stage in stage_names:
+            for size in sizes:
+                result = _run_benchmark(shape, pool, stage, size, repeat)
+                results.append(result)
+                if report is not None:
+                    report(result)
+    return results
+
+
+def save_results(results: Iterable[BenchmarkResult], path: Path) -> None:
+    """Writes benchmark results and the environment they were measured in to a json file.
+    Args:
+        results (Iterable[BenchmarkResult]): measurements to save.
+        path (Path): json file to write.
+    """
+    document = {
+        'environment': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'protobuf': google.protobuf.__version__,
+            'machine': platform.machine(),
+            'system': platform.system(),
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        },
+        'results': [result._asdict() for result in results],
+    }
+    with open(path, 'w') as json_f:
+        json.dump(document, json_f, indent=2)
+        json_f.write('\n')
+
+
+def load_results(path: Path) -> List[BenchmarkResult]:
+    """Reads the benchmark results of a json file written by save_results.
+    Args:
+        path (Path): json file to read.
+    Returns:
+        List[BenchmarkResult]: saved measurements.
+    """
+    with open(path) as json_f:
+        document = json.load(json_f)
+    return [BenchmarkResult(**result) for result in document['results']]
+
+
+def compare_results(
+        baseline: Iterable[BenchmarkResult],
+        current: Iterable[BenchmarkResult],
+        threshold: float = DEFAULT_THRESHOLD) -> List[Regression]:
+    """Compares results with a baseline. A benchmark regressed when its throughput dropped or its
+    peak memory grew by more than threshold relative to the baseline. Benchmarks missing from
+    either side are ignored.
+    Args:
+        baseline (Iterable[BenchmarkResult]): reference measurements.
+        current (Iterable[BenchmarkResult]): measurements to check.
+        threshold (float): tolerated relative change, 0.1 allows 10%.
+    Returns:
+        List[Regression]: regressions in the order of the current results.
+    """
+    reference = {_result_key(result): result for result in baseline}
+    regressions = []
+    for result in current:
+        base = reference.get(_result_key(result))
+        if base is None:
+            continue
+        throughput_change = _relative_change(base.throughput, result.throughput)
+        if throughput_change < -threshold:
+            regressions.append(Regression(
+                result.shape, result.stage, result.size, 'throughput',
+                base.throughput, result.throughput, throughput_change))
+        memory_change = _relative_change(base.peak_memory, result.peak_memory)
+        if memory_change > threshold:
+            regressions.append(Regression(
+                result.shape, result.stage, result.size, 'peak_memory',
+                base.peak_memory, result.peak_memory, memory_change))
+    return regressions
+
+
+def format_result(result: BenchmarkResult) -> str:
+    """Formats a result as a single aligned line.
+    Args:
+        result (BenchmarkResult): measurement to format.
+    Returns:
+        str: line with the shape, stage, size, time, throughput and peak memory.
+    """
+    return (
+        f'{result.shape:<14}{result.stage:<12}{result.size:>10} '
+        f'{result.seconds:>10.4f}s {result.throughput:>12.0f} msg/s '
+        f'{result.peak_memory / (1 << 20):>9.2f} MiB')
+# endregion
+
+
+# region Shapes
+def _scalar_shape() -> List[ProtoAny]:
+    # every scalar type and no repeated fields
+    pool = []
+    for idx in range(_POOL_SIZE):
+        obj = td.TestTypes()
+        obj.CopyFrom(td.test_types)
+        obj.ClearField('val18')
+        obj.ClearField('val19')
+        obj.val3 += idx
+        obj.val14 = f'hello world {idx}'
+        pool.append(obj)
+    return pool
+
+
+def _nested_shape() -> List[ProtoAny]:
+    # messages of messages, in repeated and map fields
+    pool = []
+    for idx in range(_POOL_SIZE):
+        obj = td.ComplexMessage()
+        obj.CopyFrom(td.complex_msg)
+        obj.n4s[0].id = idx
+        pool.append(obj)
+    return pool
+
+
+def _wide_map_shape() -> List[ProtoAny]:
+    # one map with _WIDE keys, the same in every message
+    pool = []
+    for idx in range(_POOL_SIZE):
+        obj = td.TestSpecials()
+        for key in range(_WIDE):
+            obj.map1[f'key{key}'] = f'value{key + idx}'
+        obj.fault2 = True
+        pool.append(obj)
+    return pool
+
+
+def _long_repeated_shape() -> List[ProtoAny]:
+    # up to _WIDE repeated messages, of varying length so rows are padded
+    pool = []
+    for idx in range(_POOL_SIZE):
+        obj = td.N4()
+        obj.id = idx
+        for element in range(_WIDE - idx):
+            td.set_raw(obj.raw_msgs.add(), id=element)
+        pool.append(obj)
+    return pool
+
+
+def _nested_small_shape() -> List[ProtoAny]:
+    # singular nested messages only
+    pool = []
+    for idx in range(_POOL_SIZE):
+        obj = td.TestNested()
+        obj.CopyFrom(td.test_nested)
+        obj.val2.val2 = f'this is a nested n2 {idx}'
+        pool.append(obj)
+    return pool
+
+
+SHAPES: Dict[str, Callable[[], List[ProtoAny]]] = {
+    'scalar': _scalar_shape,
+    'nested': _nested_shape,
+    'nested_small': _nested_small_shape,
+    'wide_map': _wide_map_shape,
+    'long_repeated': _long_repeated_shape,
+}
+# endregion
+
+
+# region Stages
+def _stage_list(objs: Iterator[ProtoAny], work_dir: Path) -> None:
+    for obj in objs:
+        flatten_proto_to_list(obj)
+
+
+def _stage_csv(objs: Iterator[ProtoAny], work_dir: Path) -> None:
+    for obj in objs:
+        flatten_proto_to_csv(obj)
+
+
+def _stage_csv_stream(objs: Iterator[ProtoAny], work_dir: Path) -> None:
+    flatten_same_proto_stream_to_csv(objs, work_dir / 'stream.csv')
+
+
+def _stage_graphql(objs: Iterator[ProtoAny], work_dir: Path) -> None:
+    # one query per message, as a server would build it per request
+    for obj in objs:
+        proto_definition_to_graphql_query(type(obj))
+
+
+STAGES: Dict[str, Callable[[Iterator[ProtoAny], Path], None]] = {
+    'list': _stage_list,
+    'csv': _stage_csv,
+    'csv_stream': _stage_csv_stream,
+    'graphql': _stage_graphql,
+}
+# endregion
+
+
+# region Private Methods
+def _run_benchmark(
+        shape: str, pool: List[ProtoAny], stage: str, size: int, repeat: int) -> BenchmarkResult:
+    run = STAGES[stage]
+    with tempfile.TemporaryDirectory() as work_dir:
+        seconds = min(
+            _time_stage(run, pool, size, Path(work_dir)) for _ in range(max(repeat, 1)))
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run(_message_stream(pool, min(size, MEMORY_SAMPLE_SIZE)), Path(work_dir))
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return BenchmarkResult(
+        shape, pool[0].DESCRIPTOR.full_name, stage, size, seconds,
+        size / seconds if seconds else float('inf'), peak_memory)
+
+
+def _time_stage(
+        run: Callable[[Iterator[ProtoAny], Path], None],
+        pool: List[ProtoAny],
+        size: int,
+        work_dir: Path) -> float:
+    gc.collect()
+    start = time.perf_counter()
+    run(_message_stream(pool, size), work_dir)
+    return time.perf_counter() - start
+
+
+def _message_stream(pool: List[ProtoAny], size: int) -> Iterator[ProtoAny]:
+    return itertools.islice(itertools.cycle(pool), size)
+
+
+def _select(options: Dict[str, Any], names: Optional[Iterable[str]], kind: str) -> List[str]:
+    if names is None:
+        return list(options)
+    names = list(names)
+    for name in names:
+        if name not in options:
+            raise ValueError(f'Unknown {kind} {name!r}, expected one of {", ".join(options)}')
+    return names
+
+
+def _result_key(result: BenchmarkResult) -> Tuple[str, str, int]:
+    return result.shape, result.stage, result.size
+
+
+def _relative_change(baseline: float, current: float) -> float:
+    if not baseline:
+        return 0.0
+    return (current - baseline) / baseline
+# endregion
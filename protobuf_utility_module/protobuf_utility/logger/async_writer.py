@@ -0,0 +1,204 @@
+from collections import deque
+import threading
+import time
+from typing import Any, NamedTuple, Optional
+
+from google.protobuf.any_pb2 import Any as ProtoAny
+
+from protobuf_utility.logger.segment import SegmentWriter
+
+
+# Policies for a log call made while the queue is full.
+BLOCK = 'block'
+DROP = 'drop'
+
+DEFAULT_CAPACITY = 1 << 16
+
+# How long the background thread sleeps when there is nothing to write.
+_IDLE_TIMEOUT = 0.1
+
+
+class AsyncWriterStats(NamedTuple):
+    """Counters reported by AsyncSegmentWriter.
+    Attributes:
+        queue_depth (int): records waiting to be written.
+        written (int): records written to the segment.
+        dropped (int): records dropped because the queue was full.
+        flushes (int): number of batches flushed to the operating system.
+        fsyncs (int): number of times the segment was synced to disk.
+        last_flush_latency (float): seconds spent writing and flushing the last batch.
+        max_flush_latency (float): longest time spent writing and flushing a batch in seconds.
+    """
+    queue_depth: int
+    written: int
+    dropped: int
+    flushes: int
+    fsyncs: int
+    last_flush_latency: float
+    max_flush_latency: float
+
+
+class AsyncSegmentWriter:
+    """Logs protobufs to a segment from a background thread. Logging a protobuf only serializes
+    it and appends it to a bounded queue. The background thread drains everything queued at once,
+    writes it through the segment's write buffer so records are coalesced into large writes and
+    then applies the fsync policy. By default records are never synced to disk explicitly, they
+    can be synced every fsync_interval milliseconds and/or every fsync_every records.
+    Args:
+        writer (SegmentWriter): segment to write to, it is closed with this writer.
+        capacity (int): maximum number of records waiting in the queue.
+        on_full (str): BLOCK to wait for space when the queue is full or DROP to drop the record.
+        fsync_interval (Optional[float]): milliseconds between syncs of unsynced records.
+        fsync_every (Optional[int]): number of records written between syncs.
+    """
+
+    def __init__(
+            self,
+            writer: SegmentWriter,
+            capacity: int = DEFAULT_CAPACITY,
+            on_full: str = BLOCK,
+            fsync_interval: Optional[float] = None,
+            fsync_every: Optional[int] = None) -> None:
+        if on_full not in (BLOCK, DROP):
+            raise ValueError(f'on_full must be {BLOCK!r} or {DROP!r}, not {on_full!r}')
+        self.writer = writer
+        self.capacity = capacity
+        self.on_full = on_full
+        self.fsync_interval = None if fsync_interval is None else fsync_interval / 1000
+        self.fsync_every = fsync_every
+
+        self._queue: deque = deque()
+        self._ready = threading.Event()
+        self._space = threading.Condition()
+        self._closing = False
+        self._error: Optional[BaseException] = None
+
+        self._written = 0
+        self._dropped = 0
+        self._flushes = 0
+        self._fsyncs = 0
+        self._last_flush_latency = 0.0
+        self._max_flush_latency = 0.0
+
+        self._thread = threading.Thread(target=self._run, name='AsyncSegmentWriter', daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> 'AsyncSegmentWriter':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def log(self, obj: ProtoAny, timestamp: Optional[int] = None) -> bool:
+        """Serializes a protobuf and queues it to be written.
+        Args:
+            obj (ProtoAny): protobuf object to log.
+            timestamp (Optional[int]): nanoseconds since the epoch, the current time when None.
+        Returns:
+            bool: False when the record was dropped because the queue was full.
+        """
+        return self.write(obj.DESCRIPTOR.full_name, obj.SerializeToString(), timestamp)
+
+    def write(self, type_name: str, payload: bytes, timestamp: Optional[int] = None) -> bool:
+        """Queues an already serialized protobuf to be written.
+        Args:
+            type_name (str): DESCRIPTOR.full_name of the serialized protobuf.
+            payload (bytes): serialized protobuf.
+            timestamp (Optional[int]): nanoseconds since the epoch, the current time when None.
+        Returns:
+            bool: False when the record was dropped because the queue was full.
+        """
+        if self._error is not None:
+            raise RuntimeError('AsyncSegmentWriter background thread failed') from self._error
+        if self._closing:
+            raise ValueError('AsyncSegmentWriter is closed')
+        if timestamp is None:
+            timestamp = time.time_ns()
+
+        queue = self._queue
+        # producers check for space and append under one lock so the capacity holds with several
+        # producer threads, the background thread only removes records
+        with self._space:
+            while len(queue) >= self.capacity:
+                if self.on_full == DROP:
+                    self._dropped += 1
+                    return False
+                if self._error is not None:
+                    raise RuntimeError(
+                        'AsyncSegmentWriter background thread failed') from self._error
+                self._space.wait(_IDLE_TIMEOUT)
+            queue.append((type_name, payload, timestamp))
+        if not self._ready.is_set():
+            self._ready.set()
+        return True
+
+    @property
+    def stats(self) -> AsyncWriterStats:
+        """AsyncWriterStats: current queue depth and counters."""
+        return AsyncWriterStats(
+            len(self._queue),
+            self._written,
+            self._dropped,
+            self._flushes,
+            self._fsyncs,
+            self._last_flush_latency,
+            self._max_flush_latency)
+
+    def close(self) -> None:
+        """Writes every queued record, syncs the segment unless fsync is disabled and closes it."""
+        if self._closing:
+            return
+        self._closing = True
+        self._ready.set()
+        self._thread.join()
+        try:
+            if self._error is None and (
+                    self.fsync_interval is not None or self.fsync_every is not None):
+                self.writer.sync()
+                self._fsyncs += 1
+        finally:
+            self.writer.close()
+        if self._error is not None:
+            raise RuntimeError('AsyncSegmentWriter background thread failed') from self._error
+
+    def _run(self) -> None:
+        queue = self._queue
+        writer = self.writer
+        last_sync = time.monotonic()
+        unsynced = 0
+        try:
+            while True:
+                timeout = self.fsync_interval if unsynced and self.fsync_interval else _IDLE_TIMEOUT
+                self._ready.wait(timeout)
+                self._ready.clear()
+
+                count = len(queue)
+                if count:
+                    started = time.perf_counter()
+                    for _ in range(count):
+                        writer.write(*queue.popleft())
+                    writer.flush()
+                    latency = time.perf_counter() - started
+                    with self._space:
+                        self._space.notify_all()
+                    self._written += count
+                    self._flushes += 1
+                    self._last_flush_latency = latency
+                    self._max_flush_latency = max(self._max_flush_latency, latency)
+                    unsynced += count
+
+                if unsynced and (
+                        (self.fsync_every is not None and unsynced >= self.fsync_every) or
+                        (self.fsync_interval is not None and
+                         time.monotonic() - last_sync >= self.fsync_interval)):
+                    writer.sync()
+                    self._fsyncs += 1
+                    unsynced = 0
+                    last_sync = time.monotonic()
+
+                if self._closing and not queue:
+                    return
+        except BaseException as error:
+            self._error = error
+            with self._space:
+                self._space.notify_all()
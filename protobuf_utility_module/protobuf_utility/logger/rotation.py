@@ -0,0 +1,214 @@
+from pathlib import Path
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from google.protobuf.any_pb2 import Any as ProtoAny
+
+from protobuf_utility.logger.segment import LogRecord
+from protobuf_utility.logger.segment import SegmentWriter
+from protobuf_utility.logger.segment import parse_records
+from protobuf_utility.logger.type_index import TypeIndex
+from protobuf_utility.logger.type_index import select_records
+from protobuf_utility.logger.type_index import update_index
+
+
+SEGMENT_SUFFIX = '.pblog'
+DEFAULT_PREFIX = 'segment'
+
+
+class RotatingSegmentWriter:
+    """Writes protobufs to a directory of log segments, closing the current segment and starting
+    a new one once it holds max_bytes or was opened max_seconds ago. Segments are named
+    <prefix>-<sequence>.pblog so they sort in the order they were written and every type seen so
+    far is stored in the header of the next segment. It has the same interface as SegmentWriter
+    so it can be wrapped by AsyncSegmentWriter.
+    Args:
+        directory (Path): directory to write the segments to, created if missing.
+        prefix (str): name of the segments before their sequence number.
+        max_bytes (Optional[int]): size of the segment file, compressed when compression is set,
+            at which the writer rotates.
+        max_seconds (Optional[float]): age of the segment at which the writer rotates.
+        segment_options (Any): keyword arguments passed to every SegmentWriter, e.g. compression.
+    """
+
+    def __init__(
+            self,
+            directory: Path,
+            prefix: str = DEFAULT_PREFIX,
+            max_bytes: Optional[int] = None,
+            max_seconds: Optional[float] = None,
+            **segment_options: Any) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.paths: List[Path] = []
+        self._segment_options = segment_options
+        self._types: Dict[str, None] = dict.fromkeys(segment_options.pop('types', ()))
+        self._writer: Optional[SegmentWriter] = None
+        self._opened = 0.0
+        self._closed = False
+        self._sequence = _next_sequence(self.directory, prefix)
+
+    def __enter__(self) -> 'RotatingSegmentWriter':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    @property
+    def offset(self) -> int:
+        """int: number of bytes written to the current segment file so far."""
+        return 0 if self._writer is None else self._writer.offset
+
+    def log(self, obj: ProtoAny, timestamp: Optional[int] = None) -> int:
+        """Serializes and writes a protobuf to the current segment.
+        Args:
+            obj (ProtoAny): protobuf object to log.
+            timestamp (Optional[int]): nanoseconds since the epoch, the current time when None.
+        Returns:
+            int: offset of the record in the current segment.
+        """
+        return self.write(obj.DESCRIPTOR.full_name, obj.SerializeToString(), timestamp)
+
+    def write(self, type_name: str, payload: bytes, timestamp: Optional[int] = None) -> int:
+        """Writes an already serialized protobuf to the current segment, rotating it first when
+        it is full or too old.
+        Args:
+            type_name (str): DESCRIPTOR.full_name of the serialized protobuf.
+            payload (bytes): serialized protobuf.
+            timestamp (Optional[int]): nanoseconds since the epoch, the current time when None.
+        Returns:
+            int: offset of the record in the current segment.
+        """
+        if self._closed:
+            raise ValueError('RotatingSegmentWriter is closed')
+        writer = self._writer
+        if writer is None or (
+                (self.max_bytes is not None and writer.offset >= self.max_bytes) or
+                (self.max_seconds is not None and
+                 time.monotonic() - self._opened >= self.max_seconds)):
+            writer = self.rotate()
+        self._types[type_name] = None
+        return writer.write(type_name, payload, timestamp)
+
+    def rotate(self) -> SegmentWriter:
+        """Closes the current segment and starts a new one.
+        Returns:
+            SegmentWriter: writer of the new segment.
+        """
+        if self._writer is not None:
+            self._writer.close()
+        path = self.directory / f'{self.prefix}-{self._sequence:08d}{SEGMENT_SUFFIX}'
+        self._sequence += 1
+        self._writer = SegmentWriter(path, types=self._types, **self._segment_options)
+        self._opened = time.monotonic()
+        self.paths.append(path)
+        return self._writer
+
+    def flush(self) -> None:
+        """Flushes buffered records of the current segment to the operating system."""
+        if self._writer is not None:
+            self._writer.flush()
+
+    def sync(self) -> None:
+        """Flushes the current segment and waits for the operating system to write it to disk."""
+        if self._writer is not None:
+            self._writer.sync()
+
+    def close(self) -> None:
+        """Closes the current segment."""
+        self._closed = True
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+# region Public Methods
+def list_segments(directory: Path, prefix: str = DEFAULT_PREFIX) -> List[Path]:
+    """Lists the segments written by RotatingSegmentWriter in the order they were written.
+    Args:
+        directory (Path): directory holding the segments.
+        prefix (str): name of the segments before their sequence number.
+    Returns:
+        List[Path]: paths of the segments.
+    """
+    return sorted(Path(directory).glob(f'{prefix}-*{SEGMENT_SUFFIX}'))
+
+
+def index_segments(directory: Path, prefix: str = DEFAULT_PREFIX) -> List[TypeIndex]:
+    """Updates the type index of every segment of a directory, only the segments that were
+    added or grew since the last update are read.
+    Args:
+        directory (Path): directory holding the segments.
+        prefix (str): name of the segments before their sequence number.
+    Returns:
+        List[TypeIndex]: index of each segment in the order they were written.
+    """
+    return [update_index(path) for path in list_segments(directory, prefix)]
+
+
+def read_segments(
+        directory: Path,
+        prefix: str = DEFAULT_PREFIX,
+        start_timestamp: Optional[int] = None,
+        end_timestamp: Optional[int] = None,
+        type_names: Optional[Iterable[str]] = None) -> Iterator[LogRecord]:
+    """Iterates over the records of every segment of a directory in the order they were written,
+    see select_records for how the filters seek to the matching records.
+    Args:
+        directory (Path): directory holding the segments.
+        prefix (str): name of the segments before their sequence number.
+        start_timestamp (Optional[int]): skip the records logged before this time in nanoseconds
+            since the epoch.
+        end_timestamp (Optional[int]): skip the records logged at or after this time in
+            nanoseconds since the epoch.
+        type_names (Optional[Iterable[str]]): DESCRIPTOR.full_name of the types to read, every
+            type when None.
+    Returns:
+        Iterator[LogRecord]: records of all segments.
+    """
+    if type_names is not None:
+        type_names = list(type_names)
+    for path in list_segments(directory, prefix):
+        yield from select_records(path, type_names, start_timestamp, end_timestamp)
+
+
+def read_segment_messages(
+        directory: Path,
+        prefix: str = DEFAULT_PREFIX,
+        message_classes: Optional[Dict[str, type]] = None,
+        start_timestamp: Optional[int] = None,
+        end_timestamp: Optional[int] = None,
+        type_names: Optional[Iterable[str]] = None) -> Iterator[ProtoAny]:
+    """Iterates over the records of every segment of a directory parsed into protobuf objects,
+    e.g. to feed flatten_mixed_proto_stream_to_csv.
+    Args:
+        directory (Path): directory holding the segments.
+        prefix (str): name of the segments before their sequence number.
+        message_classes (Optional[Dict[str, type]]): protobuf class of each type name. Types not
+            listed are looked up in the default symbol database.
+        start_timestamp (Optional[int]): skip the records logged before this time in nanoseconds
+            since the epoch.
+        end_timestamp (Optional[int]): skip the records logged at or after this time in
+            nanoseconds since the epoch.
+        type_names (Optional[Iterable[str]]): DESCRIPTOR.full_name of the types to read, every
+            type when None.
+    Returns:
+        Iterator[ProtoAny]: parsed protobuf objects.
+    """
+    records = read_segments(directory, prefix, start_timestamp, end_timestamp, type_names)
+    return parse_records(records, message_classes)
+# endregion
+
+
+# region Private Methods
+def _next_sequence(directory: Path, prefix: str) -> int:
+    # one past the highest sequence number in the directory, segments deleted by retention leave
+    # gaps so the number of segments may be the number of one that still exists
+    sequences = [
+        path.name[len(prefix) + 1:-len(SEGMENT_SUFFIX)]
+        for path in list_segments(directory, prefix)]
+    return max((int(sequence) for sequence in sequences if sequence.isdigit()), default=-1) + 1
+# endregion
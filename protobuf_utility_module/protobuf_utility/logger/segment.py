@@ -0,0 +1,591 @@
+from bisect import bisect_left, bisect_right
+import lzma
+import mmap
+import os
+from pathlib import Path
+import struct
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import zlib
+
+from google.protobuf import symbol_database
+from google.protobuf.any_pb2 import Any as ProtoAny
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Segment layout:
+#   header:  MAGIC, u8 version, u8 flags, [u8 codec id], varint type count, type names (varint
+#            length + utf-8)
+#   records: varint length of the rest of the record, varint type id, i64 timestamp (ns), payload
+#   footer:  type names, sparse index of (record offset, timestamp) pairs, [block offsets]
+#   trailer: u64 footer offset, TRAILER_MAGIC
+# Type ids start at 1 in the order types are defined. Type id 0 marks a control record whose
+# payload is the name of a type seen for the first time after the header was written. The
+# footer and trailer are only present once the writer was closed, readers of a segment without
+# them scan it up to the last complete record.
+#
+# When FLAG_COMPRESSED is set the header holds the id of the codec and records are grouped into
+# blocks that are compressed independently, each block is stored as u32 compressed length, u32
+# uncompressed length and the compressed records. Record offsets are then offsets in the
+# uncompressed record stream, which starts right after the header like in an uncompressed
+# segment. The sparse index has one entry per block with the offset and timestamp of its first
+# record and the footer ends with the varint count and u64 file offsets of the blocks.
+MAGIC = b'PBSG'
+TRAILER_MAGIC = b'PBSE'
+VERSION = 1
+
+FLAG_COMPRESSED = 0x01
+
+DEFAULT_INDEX_INTERVAL = 1024
+DEFAULT_WRITE_BUFFER_SIZE = 1 << 20
+DEFAULT_BLOCK_SIZE = 1 << 16
+
+_TYPE_DEFINITION_ID = 0
+_TIMESTAMP = struct.Struct('<q')
+_TRAILER = struct.Struct('<Q4s')
+_INDEX_ENTRY = struct.Struct('<Qq')
+_BLOCK_HEADER = struct.Struct('<II')
+_BLOCK_OFFSET = struct.Struct('<Q')
+
+# Codec ids stored in the header of compressed segments.
+_CODEC_IDS = {'zlib': 1, 'lzma': 2, 'zstd': 3}
+
+
+class LogRecord(NamedTuple):
+    """A record read from a log segment.
+    Attributes:
+        type_name (str): DESCRIPTOR.full_name of the logged protobuf.
+        timestamp (int): time the protobuf was logged in nanoseconds since the epoch.
+        payload (memoryview): serialized protobuf, a view into the segment.
+        offset (int): offset of the record in the segment.
+    """
+    type_name: str
+    timestamp: int
+    payload: memoryview
+    offset: int
+
+
+class SegmentWriter:
+    """Writes protobufs to an append only log segment. Records are framed with their type and
+    timestamp and every index_interval records the offset and timestamp of a record is added to
+    a sparse index that is stored in the footer when the writer is closed.
+    When compression is set records are buffered into blocks of about block_size bytes that are
+    compressed independently and indexed by the offset and timestamp of their first record, so
+    readers only decompress the blocks they read. A partial block is written by sync and close.
+    Args:
+        path (Path): segment file to create.
+        types (Iterable[str]): type names stored in the header, other types are defined inline the
+            first time they are written.
+        index_interval (int): number of records between sparse index entries of an uncompressed
+            segment.
+        buffer_size (int): size of the write buffer, records are coalesced into writes this big.
+        compression (Optional[str]): 'zlib', 'lzma' or 'zstd' (requires zstandard) to compress
+            the segment in blocks, None to write records as is.
+        block_size (int): uncompressed size a block is compressed at.
+        compression_level (Optional[int]): level passed to the codec, its default when None.
+    """
+
+    def __init__(
+            self,
+            path: Path,
+            types: Iterable[str] = (),
+            index_interval: int = DEFAULT_INDEX_INTERVAL,
+            buffer_size: int = DEFAULT_WRITE_BUFFER_SIZE,
+            compression: Optional[str] = None,
+            block_size: int = DEFAULT_BLOCK_SIZE,
+            compression_level: Optional[int] = None) -> None:
+        self.path = Path(path)
+        self.index_interval = index_interval
+        self.compression = compression
+        self.block_size = block_size
+        self.record_count = 0
+        self._compress = None if compression is None else _get_compressor(
+            compression, compression_level)
+        self._type_names: List[str] = []
+        self._type_prefixes: Dict[str, bytes] = {}
+        self._index: List[Tuple[int, int]] = []
+        self._block = bytearray()
+        self._block_offsets: List[int] = []
+        self._block_indexed = False
+        self._last_timestamp = 0
+
+        types = list(dict.fromkeys(types))
+        header = bytearray(MAGIC)
+        if compression is None:
+            header += bytes((VERSION, 0))
+        else:
+            header += bytes((VERSION, FLAG_COMPRESSED, _CODEC_IDS[compression]))
+        header += _encode_type_names(types)
+        for type_name in types:
+            self._add_type(type_name)
+        self._file = open(self.path, 'wb', buffering=buffer_size)
+        self._file.write(header)
+        self._offset = len(header)
+        self._record_offset = len(header)
+        self._block_start = len(header)
+
+    def __enter__(self) -> 'SegmentWriter':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    @property
+    def offset(self) -> int:
+        """int: number of bytes written to the segment file so far."""
+        return self._offset
+
+    def log(self, obj: ProtoAny, timestamp: Optional[int] = None) -> int:
+        """Serializes and writes a protobuf to the segment.
+        Args:
+            obj (ProtoAny): protobuf object to log.
+            timestamp (Optional[int]): nanoseconds since the epoch, the current time when None.
+        Returns:
+            int: offset of the record in the segment.
+        """
+        return self.write(obj.DESCRIPTOR.full_name, obj.SerializeToString(), timestamp)
+
+    def write(self, type_name: str, payload: bytes, timestamp: Optional[int] = None) -> int:
+        """Writes an already serialized protobuf to the segment.
+        Args:
+            type_name (str): DESCRIPTOR.full_name of the serialized protobuf.
+            payload (bytes): serialized protobuf.
+            timestamp (Optional[int]): nanoseconds since the epoch, the current time when None.
+        Returns:
+            int: offset of the record in the segment.
+        """
+        if timestamp is None:
+            timestamp = time.time_ns()
+        prefix = self._type_prefixes.get(type_name)
+        if prefix is None:
+            self._write_record(_TYPE_DEFINITION_ID, 0, type_name.encode())
+            prefix = self._add_type(type_name)
+
+        offset = self._record_offset
+        if self._compress is None:
+            if self.record_count % self.index_interval == 0:
+                self._index.append((offset, timestamp))
+        elif not self._block_indexed:
+            self._index.append((self._block_start, timestamp))
+            self._block_indexed = True
+        body_length = len(prefix) + _TIMESTAMP.size + len(payload)
+        record = b''.join((
+            encode_varint(body_length), prefix, _TIMESTAMP.pack(timestamp), payload))
+        self._append(record)
+        self.record_count += 1
+        self._last_timestamp = timestamp
+        if len(self._block) >= self.block_size:
+            self._write_block()
+        return offset
+
+    def flush(self) -> None:
+        """Flushes buffered records to the operating system. Records of a compressed segment are
+        only flushed once their block is complete."""
+        self._file.flush()
+
+    def sync(self) -> None:
+        """Writes the current block, flushes buffered records and waits for the operating system
+        to write them to disk."""
+        self._write_block()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        """Writes the current block, the footer and trailer and closes the segment."""
+        if self._file.closed:
+            return
+        self._write_block()
+        footer_offset = self._offset
+        footer = bytearray(_encode_type_names(self._type_names))
+        footer += encode_varint(len(self._index))
+        for offset, timestamp in self._index:
+            footer += _INDEX_ENTRY.pack(offset, timestamp)
+        if self._compress is not None:
+            footer += encode_varint(len(self._block_offsets))
+            for offset in self._block_offsets:
+                footer += _BLOCK_OFFSET.pack(offset)
+        footer += _TRAILER.pack(footer_offset, TRAILER_MAGIC)
+        self._file.write(footer)
+        self._file.close()
+
+    def _add_type(self, type_name: str) -> bytes:
+        self._type_names.append(type_name)
+        prefix = self._type_prefixes[type_name] = encode_varint(len(self._type_names))
+        return prefix
+
+    def _write_record(self, type_id: int, timestamp: int, payload: bytes) -> None:
+        prefix = encode_varint(type_id)
+        self._append(b''.join((
+            encode_varint(len(prefix) + _TIMESTAMP.size + len(payload)),
+            prefix,
+            _TIMESTAMP.pack(timestamp),
+            payload)))
+
+    def _append(self, record: bytes) -> None:
+        # records of a compressed segment are written when their block is complete
+        if self._compress is None:
+            self._file.write(record)
+            self._offset += len(record)
+        else:
+            self._block += record
+        self._record_offset += len(record)
+
+    def _write_block(self) -> None:
+        if not self._block:
+            return
+        if not self._block_indexed:
+            # a block holding only type definitions still needs an entry to keep the index and
+            # block offsets aligned
+            self._index.append((self._block_start, self._last_timestamp))
+        compressed = self._compress(bytes(self._block))
+        self._block_offsets.append(self._offset)
+        self._file.write(_BLOCK_HEADER.pack(len(compressed), len(self._block)))
+        self._file.write(compressed)
+        self._offset += _BLOCK_HEADER.size + len(compressed)
+        self._block = bytearray()
+        self._block_start = self._record_offset
+        self._block_indexed = False
+
+
+class SegmentReader:
+    """Reads a log segment through a memory map. Records are returned as views into the map so
+    payloads are never copied, they must not be used after the reader is closed. Blocks of a
+    compressed segment are decompressed one at a time when they are read and records are views
+    into the decompressed block.
+    Args:
+        path (Path): segment file to read.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size == 0:
+            self._file.close()
+            raise ValueError(f'{self.path} is not a log segment')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        if self._view[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f'{self.path} is not a log segment')
+        self.version = self._view[len(MAGIC)]
+        self.flags = self._view[len(MAGIC) + 1]
+        pos = len(MAGIC) + 2
+        self.compression: Optional[str] = None
+        self._decompress: Optional[Callable[[bytes], bytes]] = None
+        if self.flags & FLAG_COMPRESSED:
+            self.compression = _get_codec_name(self._view[pos])
+            self._decompress = _get_decompressor(self.compression)
+            pos += 1
+        self.header_types, self._data_start = _decode_type_names(self._view, pos)
+
+        # the footer is only available once the writer closed the segment
+        self.type_names: List[str] = list(self.header_types)
+        self.index: List[Tuple[int, int]] = []
+        self._index_timestamps: List[int] = []
+        self._data_end = size
+        block_offsets = None
+        if size >= self._data_start + _TRAILER.size:
+            footer_offset, magic = _TRAILER.unpack_from(self._view, size - _TRAILER.size)
+            if magic == TRAILER_MAGIC:
+                self._data_end = footer_offset
+                self.type_names, pos = _decode_type_names(self._view, footer_offset)
+                count, pos = decode_varint(self._view, pos)
+                self.index = [
+                    _INDEX_ENTRY.unpack_from(self._view, pos + idx * _INDEX_ENTRY.size)
+                    for idx in range(count)
+                ]
+                self._index_timestamps = [timestamp for _, timestamp in self.index]
+                if self._decompress is not None:
+                    count, pos = decode_varint(self._view, pos + count * _INDEX_ENTRY.size)
+                    block_offsets = [
+                        _BLOCK_OFFSET.unpack_from(self._view, pos + idx * _BLOCK_OFFSET.size)[0]
+                        for idx in range(count)
+                    ]
+        self.complete = self._data_end != size
+
+        # (file offset, record offset) of each block, found by walking the block headers when
+        # the footer is missing
+        self._blocks: List[Tuple[int, int]] = []
+        if block_offsets is not None:
+            self._blocks = [
+                (file_offset, record_offset)
+                for file_offset, (record_offset, _) in zip(block_offsets, self.index)
+            ]
+        elif self._decompress is not None:
+            self._blocks = self._scan_blocks()
+        self._block_starts = [record_offset for _, record_offset in self._blocks]
+        self._records_end = self._data_end
+        if self._blocks:
+            file_offset, record_offset = self._blocks[-1]
+            self._records_end = record_offset + _BLOCK_HEADER.unpack_from(
+                self._view, file_offset)[1]
+        elif self._decompress is not None:
+            self._records_end = self._data_start
+        self._cached_block: Tuple[int, Optional[memoryview]] = (-1, None)
+
+    def __enter__(self) -> 'SegmentReader':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def __iter__(self) -> Iterator[LogRecord]:
+        return self.records()
+
+    def records(self, start_offset: Optional[int] = None) -> Iterator[LogRecord]:
+        """Iterates over the records of the segment.
+        Args:
+            start_offset (Optional[int]): offset of the first record to read, a record offset from
+                the index or a previous LogRecord. Reads from the first record when None.
+        Returns:
+            Iterator[LogRecord]: records in the order they were written.
+        """
+        if start_offset is None or start_offset < self._data_start:
+            start_offset = self._data_start
+        # type names defined inline are only known up front when the footer is present,
+        # otherwise they are collected while reading
+        type_names = [''] + (self.type_names if self.complete else list(self.header_types))
+        if not self.complete:
+            for _, type_id, _, payload in self._frames(self._data_start, start_offset):
+                if type_id == _TYPE_DEFINITION_ID:
+                    type_names.append(str(payload, 'utf-8'))
+
+        for offset, type_id, timestamp, payload in self._frames(start_offset, self._records_end):
+            if type_id != _TYPE_DEFINITION_ID:
+                yield LogRecord(type_names[type_id], timestamp, payload, offset)
+            elif not self.complete:
+                type_names.append(str(payload, 'utf-8'))
+
+    def find_offset(self, timestamp: int) -> int:
+        """Finds where to start reading to get the records logged at or after a timestamp using
+        the sparse index. Records are logged with non-decreasing timestamps so every record
+        before the returned offset was logged before the timestamp.
+        Args:
+            timestamp (int): nanoseconds since the epoch.
+        Returns:
+            int: record offset to pass to records.
+        """
+        # every record before the last entry logged before the timestamp is too old
+        idx = bisect_left(self._index_timestamps, timestamp)
+        return self.index[idx - 1][0] if idx > 0 else self._data_start
+
+    def payload_at(self, offset: int) -> memoryview:
+        """Reads the payload of a single record, e.g. a record offset found in a TypeIndex. The
+        last decompressed block is kept so reading records of the same block in order only
+        decompresses it once.
+        Args:
+            offset (int): offset of the record.
+        Returns:
+            memoryview: serialized protobuf.
+        """
+        if self._decompress is None:
+            view, pos, end, base = self._view, offset, self._records_end, 0
+        else:
+            idx = bisect_right(self._block_starts, offset) - 1
+            if idx < 0:
+                raise ValueError(f'No record at offset {offset}')
+            file_offset, base = self._blocks[idx]
+            if self._cached_block[0] != file_offset:
+                self._cached_block = (file_offset, memoryview(self._read_block(file_offset)))
+            view = self._cached_block[1]
+            pos, end = offset - base, len(view)
+        for frame_offset, _, _, payload in _iter_frames(view, pos, end, base):
+            if frame_offset == offset:
+                return payload
+        raise ValueError(f'No record at offset {offset}')
+
+    def messages(self, message_classes: Optional[Dict[str, type]] = None) -> Iterator[ProtoAny]:
+        """Iterates over the records of the segment parsed into protobuf objects, e.g. to feed
+        flatten_mixed_proto_stream_to_csv.
+        Args:
+            message_classes (Optional[Dict[str, type]]): protobuf class of each type name. Types
+                not listed are looked up in the default symbol database.
+        Returns:
+            Iterator[ProtoAny]: parsed protobuf objects.
+        """
+        return parse_records(self.records(), message_classes)
+
+    def _frames(self, pos: int, end: int) -> Iterator[Tuple[int, int, int, memoryview]]:
+        # yields (offset, type id, timestamp, payload) of every complete record in the range
+        if self._decompress is None:
+            yield from _iter_frames(self._view, pos, end, 0)
+            return
+        # only the blocks overlapping the range are decompressed
+        first = max(bisect_right(self._block_starts, pos) - 1, 0)
+        for file_offset, block_start in self._blocks[first:]:
+            if block_start >= end:
+                return
+            block = memoryview(self._read_block(file_offset))
+            for frame in _iter_frames(block, 0, min(len(block), end - block_start), block_start):
+                if frame[0] >= pos:
+                    yield frame
+
+    def _read_block(self, file_offset: int) -> bytes:
+        compressed_length, _ = _BLOCK_HEADER.unpack_from(self._view, file_offset)
+        start = file_offset + _BLOCK_HEADER.size
+        return self._decompress(self._view[start:start + compressed_length])
+
+    def _scan_blocks(self) -> List[Tuple[int, int]]:
+        # lists the complete blocks of a segment that has no footer
+        blocks = []
+        file_offset = record_offset = self._data_start
+        while file_offset + _BLOCK_HEADER.size <= self._data_end:
+            compressed_length, length = _BLOCK_HEADER.unpack_from(self._view, file_offset)
+            block_end = file_offset + _BLOCK_HEADER.size + compressed_length
+            if block_end > self._data_end:
+                break
+            blocks.append((file_offset, record_offset))
+            file_offset = block_end
+            record_offset += length
+        return blocks
+
+    def close(self) -> None:
+        """Closes the memory map and file."""
+        self._cached_block = (-1, None)
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # record payloads are still referenced, the map is closed once they are released
+            pass
+        self._file.close()
+
+
+# region Public Methods
+def parse_records(
+        records: Iterable[LogRecord],
+        message_classes: Optional[Dict[str, type]] = None) -> Iterator[ProtoAny]:
+    """Parses log records into protobuf objects.
+    Args:
+        records (Iterable[LogRecord]): records to parse.
+        message_classes (Optional[Dict[str, type]]): protobuf class of each type name. Types not
+            listed are looked up in the default symbol database.
+    Returns:
+        Iterator[ProtoAny]: parsed protobuf objects.
+    """
+    classes = dict(message_classes or {})
+    database = symbol_database.Default()
+    for record in records:
+        message_class = classes.get(record.type_name)
+        if message_class is None:
+            message_class = classes[record.type_name] = database.GetSymbol(record.type_name)
+        yield message_class.FromString(record.payload)
+
+
+def encode_varint(value: int) -> bytes:
+    """Encodes a non negative integer as a protobuf base 128 varint.
+    Args:
+        value (int): integer to encode.
+    Returns:
+        bytes: 1 byte per 7 bits of the value.
+    """
+    if value < 0x80:
+        return bytes((value,))
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def decode_varint(buf: memoryview, pos: int) -> Tuple[int, int]:
+    """Decodes a protobuf base 128 varint.
+    Args:
+        buf (memoryview): buffer holding the varint, or bytes.
+        pos (int): offset of the varint in buf.
+    Returns:
+        Tuple[int, int]: decoded integer and the offset after the varint.
+    """
+    byte = buf[pos]
+    if byte < 0x80:
+        return byte, pos + 1
+    result = byte & 0x7F
+    shift = 7
+    while True:
+        pos += 1
+        byte = buf[pos]
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos + 1
+        shift += 7
+# endregion
+
+
+# region Private Methods
+def _encode_type_names(type_names: List[str]) -> bytes:
+    encoded = bytearray(encode_varint(len(type_names)))
+    for type_name in type_names:
+        name = type_name.encode()
+        encoded += encode_varint(len(name))
+        encoded += name
+    return bytes(encoded)
+
+
+def _decode_type_names(buf: memoryview, pos: int) -> Tuple[List[str], int]:
+    count, pos = decode_varint(buf, pos)
+    type_names = []
+    for _ in range(count):
+        length, pos = decode_varint(buf, pos)
+        type_names.append(str(buf[pos:pos + length], 'utf-8'))
+        pos += length
+    return type_names, pos
+
+
+def _iter_frames(
+        view: memoryview,
+        pos: int,
+        end: int,
+        base: int) -> Iterator[Tuple[int, int, int, memoryview]]:
+    # yields (base + offset, type id, timestamp, payload) of every complete record in the range
+    while pos < end:
+        try:
+            length, body = decode_varint(view, pos)
+            type_id, timestamp_pos = decode_varint(view, body)
+        except IndexError:
+            return
+        record_end = body + length
+        if record_end > end:
+            return
+        timestamp = _TIMESTAMP.unpack_from(view, timestamp_pos)[0]
+        yield base + pos, type_id, timestamp, view[timestamp_pos + _TIMESTAMP.size:record_end]
+        pos = record_end
+
+
+def _get_compressor(codec: str, level: Optional[int]) -> Callable[[bytes], bytes]:
+    if codec == 'zlib':
+        level = -1 if level is None else level
+        return lambda data: zlib.compress(data, level)
+    if codec == 'lzma':
+        preset = lzma.PRESET_DEFAULT if level is None else level
+        return lambda data: lzma.compress(data, preset=preset)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError('zstd compression requires the zstandard package')
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        return compressor.compress
+    raise ValueError(f'Unknown compression {codec!r}, expected one of {sorted(_CODEC_IDS)}')
+
+
+def _get_decompressor(codec: str) -> Callable[[bytes], bytes]:
+    if codec == 'zlib':
+        return zlib.decompress
+    if codec == 'lzma':
+        return lzma.decompress
+    if zstandard is None:
+        raise ValueError('Reading zstd compressed segments requires the zstandard package')
+    return zstandard.ZstdDecompressor().decompress
+
+
+def _get_codec_name(codec_id: int) -> str:
+    for codec, known_id in _CODEC_IDS.items():
+        if known_id == codec_id:
+            return codec
+    raise ValueError(f'Unknown segment codec id {codec_id}')
+# endregion
@@ -0,0 +1,266 @@
+from array import array
+from bisect import bisect_left
+import heapq
+from itertools import repeat
+import os
+from pathlib import Path
+import struct
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from protobuf_utility.logger.segment import LogRecord
+from protobuf_utility.logger.segment import SegmentReader
+from protobuf_utility.logger.segment import decode_varint
+from protobuf_utility.logger.segment import encode_varint
+
+
+# Index layout, stored next to the segment as <segment>.idx:
+#   header: INDEX_MAGIC, u8 version, u8 complete flag, u64 indexed segment size, u64 offset of
+#           the last indexed record (0 when empty)
+#   types:  varint type count, then per type: varint name length, utf-8 name, varint record
+#           count, i64 timestamps, u64 record offsets
+# Records of a type are stored in the order they were logged, which is sorted by timestamp.
+INDEX_MAGIC = b'PBIX'
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.idx'
+
+_INDEX_HEADER = struct.Struct('<4sBBQQ')
+
+
+class TypeIndex:
+    """Persisted index of the timestamps and offsets of the records of each type in a segment,
+    used to seek straight to the records of a type logged in a time range. The index of a
+    segment that is still being written can be updated incrementally, only the records logged
+    after the last indexed record are read.
+    Args:
+        segment_path (Path): indexed segment.
+    """
+
+    def __init__(self, segment_path: Path) -> None:
+        self.segment_path = Path(segment_path)
+        self.path = index_path(self.segment_path)
+        self.segment_size = 0
+        self.complete = False
+        self.last_offset = 0
+        self._timestamps: Dict[str, array] = {}
+        self._offsets: Dict[str, array] = {}
+
+    @classmethod
+    def load(cls, segment_path: Path) -> 'TypeIndex':
+        """Loads the index of a segment.
+        Args:
+            segment_path (Path): indexed segment.
+        Returns:
+            TypeIndex: the stored index, an empty index when it is missing or invalid.
+        """
+        index = cls(segment_path)
+        try:
+            data = index.path.read_bytes()
+        except FileNotFoundError:
+            return index
+        if len(data) < _INDEX_HEADER.size:
+            return index
+        magic, version, complete, segment_size, last_offset = _INDEX_HEADER.unpack_from(data)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            return index
+
+        view = memoryview(data)
+        count, pos = decode_varint(view, _INDEX_HEADER.size)
+        for _ in range(count):
+            length, pos = decode_varint(view, pos)
+            type_name = str(view[pos:pos + length], 'utf-8')
+            records, pos = decode_varint(view, pos + length)
+            timestamps = _load_array('q', view[pos:pos + records * 8])
+            offsets = _load_array('Q', view[pos + records * 8:pos + records * 16])
+            pos += records * 16
+            index._timestamps[type_name] = timestamps
+            index._offsets[type_name] = offsets
+        index.segment_size = segment_size
+        index.complete = bool(complete)
+        index.last_offset = last_offset
+        return index
+
+    @property
+    def type_names(self) -> List[str]:
+        """List[str]: indexed types in the order they were first logged."""
+        return list(self._timestamps)
+
+    def __len__(self) -> int:
+        return sum(len(timestamps) for timestamps in self._timestamps.values())
+
+    def update(self) -> bool:
+        """Indexes the records logged since the last update. The index is rebuilt when the
+        segment shrank, i.e. it was replaced.
+        Returns:
+            bool: True when the index changed.
+        """
+        size = os.path.getsize(self.segment_path)
+        if size == self.segment_size:
+            return False
+        if size < self.segment_size:
+            self.segment_size = 0
+            self.complete = False
+            self.last_offset = 0
+            self._timestamps.clear()
+            self._offsets.clear()
+
+        timestamps = self._timestamps
+        offsets = self._offsets
+        with SegmentReader(self.segment_path) as reader:
+            last_offset = self.last_offset
+            records = reader.records(last_offset or None)
+            for record in records:
+                if record.offset == last_offset:
+                    # the last indexed record is read again to resume after it
+                    continue
+                type_name = record.type_name
+                if type_name not in timestamps:
+                    timestamps[type_name] = array('q')
+                    offsets[type_name] = array('Q')
+                timestamps[type_name].append(record.timestamp)
+                offsets[type_name].append(record.offset)
+                last_offset = record.offset
+            self.complete = reader.complete
+        changed = last_offset != self.last_offset or size != self.segment_size
+        self.last_offset = last_offset
+        self.segment_size = size
+        return changed
+
+    def save(self) -> None:
+        """Writes the index next to the segment."""
+        data = bytearray(_INDEX_HEADER.pack(
+            INDEX_MAGIC, INDEX_VERSION, self.complete, self.segment_size, self.last_offset))
+        data += encode_varint(len(self._timestamps))
+        for type_name, timestamps in self._timestamps.items():
+            name = type_name.encode()
+            data += encode_varint(len(name))
+            data += name
+            data += encode_varint(len(timestamps))
+            data += _dump_array(timestamps)
+            data += _dump_array(self._offsets[type_name])
+        # replace the index atomically so readers never see a partial index
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        temp_path.write_bytes(data)
+        os.replace(temp_path, self.path)
+
+    def time_range(self, type_name: str) -> Optional[Tuple[int, int]]:
+        """Gets the timestamps of the first and last record of a type.
+        Args:
+            type_name (str): DESCRIPTOR.full_name of the type.
+        Returns:
+            Optional[Tuple[int, int]]: first and last timestamp, None when the type was not logged.
+        """
+        timestamps = self._timestamps.get(type_name)
+        return (timestamps[0], timestamps[-1]) if timestamps else None
+
+    def find(
+            self,
+            type_name: str,
+            start_timestamp: Optional[int] = None,
+            end_timestamp: Optional[int] = None) -> Tuple[array, array]:
+        """Finds the records of a type logged in a time range with a binary search.
+        Args:
+            type_name (str): DESCRIPTOR.full_name of the type.
+            start_timestamp (Optional[int]): first timestamp included, from the first record when
+                None.
+            end_timestamp (Optional[int]): first timestamp excluded, up to the last record when
+                None.
+        Returns:
+            Tuple[array, array]: timestamps and offsets of the records in the order they were
+                logged.
+        """
+        timestamps = self._timestamps.get(type_name)
+        if timestamps is None:
+            return array('q'), array('Q')
+        start = 0 if start_timestamp is None else bisect_left(timestamps, start_timestamp)
+        end = len(timestamps) if end_timestamp is None else bisect_left(timestamps, end_timestamp)
+        return timestamps[start:end], self._offsets[type_name][start:end]
+
+
+# region Public Methods
+def index_path(segment_path: Path) -> Path:
+    """Gets the path of the index of a segment.
+    Args:
+        segment_path (Path): indexed segment.
+    Returns:
+        Path: <segment>.idx next to the segment.
+    """
+    segment_path = Path(segment_path)
+    return segment_path.with_name(segment_path.name + INDEX_SUFFIX)
+
+
+def update_index(segment_path: Path, save: bool = True) -> TypeIndex:
+    """Loads the index of a segment, indexes the records logged since it was saved and saves it.
+    Args:
+        segment_path (Path): indexed segment.
+        save (bool): save the updated index next to the segment, the index is only updated in
+            memory when False so read only segments can be indexed.
+    Returns:
+        TypeIndex: up to date index.
+    """
+    index = TypeIndex.load(segment_path)
+    if (index.update() or not index.path.exists()) and save:
+        index.save()
+    return index
+
+
+def select_records(
+        segment_path: Path,
+        type_names: Optional[Iterable[str]] = None,
+        start_timestamp: Optional[int] = None,
+        end_timestamp: Optional[int] = None,
+        persist: bool = False) -> Iterator[LogRecord]:
+    """Iterates over the records of a segment of some types logged in a time range. The records
+    of the types are located with the segment's index, which is updated first, and read directly
+    without scanning the rest of the segment. Without type filter the segment is read from the
+    sparse index entry before the start of the time range. The updated index is only kept in
+    memory unless persist is set, so segments in read only directories can be read; saving it
+    with update_index or index_segments beforehand makes later reads only index new records.
+    Args:
+        segment_path (Path): segment to read.
+        type_names (Optional[Iterable[str]]): DESCRIPTOR.full_name of the types to read, every
+            type when None.
+        start_timestamp (Optional[int]): first timestamp included, from the first record when
+            None.
+        end_timestamp (Optional[int]): first timestamp excluded, up to the last record when None.
+        persist (bool): save the updated index next to the segment.
+    Returns:
+        Iterator[LogRecord]: records in the order they were written.
+    """
+    with SegmentReader(segment_path) as reader:
+        if type_names is None:
+            start_offset = None if start_timestamp is None else reader.find_offset(start_timestamp)
+            for record in reader.records(start_offset):
+                if end_timestamp is not None and record.timestamp >= end_timestamp:
+                    return
+                if start_timestamp is None or record.timestamp >= start_timestamp:
+                    yield record
+            return
+
+        index = update_index(segment_path, persist)
+        selections = []
+        for type_name in dict.fromkeys(type_names):
+            timestamps, offsets = index.find(type_name, start_timestamp, end_timestamp)
+            if offsets:
+                selections.append(zip(offsets, timestamps, repeat(type_name)))
+        # offsets of each type are increasing so merging them restores the logged order
+        for offset, timestamp, type_name in heapq.merge(*selections):
+            yield LogRecord(type_name, timestamp, reader.payload_at(offset), offset)
+# endregion
+
+
+# region Private Methods
+def _load_array(typecode: str, data: memoryview) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def _dump_array(values: array) -> bytes:
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+# endregion
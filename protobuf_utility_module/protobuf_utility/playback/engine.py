@@ -0,0 +1,181 @@
+import asyncio
+from pathlib import Path
+from typing import Iterable, List, NamedTuple, Optional, Sequence
+
+from protobuf_utility.logger.rotation import DEFAULT_PREFIX
+from protobuf_utility.logger.rotation import read_segments
+from protobuf_utility.logger.segment import LogRecord
+from protobuf_utility.playback.sinks import Sink
+
+
+DEFAULT_BATCH_SIZE = 1024
+
+
+class PlaybackStats(NamedTuple):
+    """Counters reported by PlaybackEngine.
+    Attributes:
+        published (int): records published to the sinks.
+        skipped (int): records skipped by the type filter.
+        elapsed (float): seconds spent playing back.
+        max_lag (float): longest time a record was published after it was due in seconds.
+    """
+    published: int
+    skipped: int
+    elapsed: float
+    max_lag: float
+
+
+class PlaybackEngine:
+    """Replays logged records to sinks at the pace they were logged. Every record is due at the
+    start of the playback plus the time elapsed since the first record was logged divided by the
+    rate. Due times are computed from the monotonic start of the playback instead of the previous
+    record so sleeping late never accumulates into drift. Records that are already due are
+    published together in batches of up to batch_size records.
+    Args:
+        records (Iterable[LogRecord]): records to replay ordered by timestamp, e.g. a
+            SegmentReader or read_segments.
+        sinks (Sequence[Sink]): destinations every record is published to.
+        rate (Optional[float]): playback speed, 2.0 replays twice as fast as the records were
+            logged. Records are replayed as fast as possible when None.
+        type_names (Optional[Iterable[str]]): DESCRIPTOR.full_name of the types to replay, every
+            type when None.
+        batch_size (int): maximum number of records published at once.
+    """
+
+    def __init__(
+            self,
+            records: Iterable[LogRecord],
+            sinks: Sequence[Sink],
+            rate: Optional[float] = 1.0,
+            type_names: Optional[Iterable[str]] = None,
+            batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        if rate is not None and rate <= 0:
+            raise ValueError(f'rate must be positive, not {rate}')
+        self.records = records
+        self.sinks = list(sinks)
+        self.rate = rate
+        self.type_names = None if type_names is None else frozenset(type_names)
+        self.batch_size = batch_size
+        self._stopped = False
+
+    def stop(self) -> None:
+        """Stops the playback after the current batch."""
+        self._stopped = True
+
+    async def run(self) -> PlaybackStats:
+        """Replays the records, opening the sinks first and closing them at the end.
+        Returns:
+            PlaybackStats: counters of the playback.
+        """
+        loop = asyncio.get_running_loop()
+        clock = loop.time
+        for sink in self.sinks:
+            await sink.open()
+        started = clock()
+        published = skipped = 0
+        max_lag = 0.0
+        try:
+            wanted = self.type_names
+            batch_size = self.batch_size
+            scale = None if self.rate is None else 1e-9 / self.rate
+            start = first_timestamp = None
+            batch: List[LogRecord] = []
+            for record in self.records:
+                if wanted is not None and record.type_name not in wanted:
+                    skipped += 1
+                    continue
+                if scale is not None:
+                    if start is None:
+                        start = clock()
+                        first_timestamp = record.timestamp
+                    due = start + (record.timestamp - first_timestamp) * scale
+                    now = clock()
+                    if due > now:
+                        # publish what is due before waiting for the next record
+                        if batch:
+                            await self._publish(batch)
+                            published += len(batch)
+                            batch = []
+                            if self._stopped:
+                                break
+                            now = clock()
+                        if due > now:
+                            await asyncio.sleep(due - now)
+                            now = clock()
+                    if now - due > max_lag:
+                        max_lag = now - due
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    await self._publish(batch)
+                    published += len(batch)
+                    batch = []
+                    if self._stopped:
+                        break
+            if batch and not self._stopped:
+                await self._publish(batch)
+                published += len(batch)
+        finally:
+            for sink in self.sinks:
+                await sink.close()
+        return PlaybackStats(published, skipped, clock() - started, max_lag)
+
+    async def _publish(self, batch: List[LogRecord]) -> None:
+        for sink in self.sinks:
+            await sink.publish(batch)
+        if not self.sinks or self.rate is None:
+            # let consumers run between batches when nothing else yields to the event loop
+            await asyncio.sleep(0)
+
+
+# region Public Methods
+def play(
+        records: Iterable[LogRecord],
+        sinks: Sequence[Sink],
+        rate: Optional[float] = 1.0,
+        type_names: Optional[Iterable[str]] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE) -> PlaybackStats:
+    """Replays records to sinks in a new event loop, see PlaybackEngine.
+    Args:
+        records (Iterable[LogRecord]): records to replay ordered by timestamp.
+        sinks (Sequence[Sink]): destinations every record is published to.
+        rate (Optional[float]): playback speed, as fast as possible when None.
+        type_names (Optional[Iterable[str]]): DESCRIPTOR.full_name of the types to replay, every
+            type when None.
+        batch_size (int): maximum number of records published at once.
+    Returns:
+        PlaybackStats: counters of the playback.
+    """
+    engine = PlaybackEngine(records, sinks, rate, type_names, batch_size)
+    return asyncio.run(engine.run())
+
+
+def play_log(
+        log_dir: Path,
+        sinks: Sequence[Sink],
+        rate: Optional[float] = 1.0,
+        type_names: Optional[Iterable[str]] = None,
+        start_timestamp: Optional[int] = None,
+        end_timestamp: Optional[int] = None,
+        prefix: str = DEFAULT_PREFIX,
+        batch_size: int = DEFAULT_BATCH_SIZE) -> PlaybackStats:
+    """Replays the records of some types logged in a time range to sinks in a new event loop.
+    The records are located with the type index of each segment instead of being filtered by
+    the engine.
+    Args:
+        log_dir (Path): directory of segments written by RotatingSegmentWriter.
+        sinks (Sequence[Sink]): destinations every record is published to.
+        rate (Optional[float]): playback speed, as fast as possible when None.
+        type_names (Optional[Iterable[str]]): DESCRIPTOR.full_name of the types to replay, every
+            type when None.
+        start_timestamp (Optional[int]): skip the records logged before this time in nanoseconds
+            since the epoch.
+        end_timestamp (Optional[int]): skip the records logged at or after this time in
+            nanoseconds since the epoch.
+        prefix (str): name of the segments before their sequence number.
+        batch_size (int): maximum number of records published at once.
+    Returns:
+        PlaybackStats: counters of the playback.
+    """
+    records = read_segments(log_dir, prefix, start_timestamp, end_timestamp, type_names)
+    return play(records, sinks, rate, batch_size=batch_size)
+# endregion
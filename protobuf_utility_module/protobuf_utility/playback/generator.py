@@ -0,0 +1,413 @@
+import itertools
+import multiprocessing
+import random
+import string
+import time
+from typing import Any, Callable, Dict, Iterator, List, Mapping, NamedTuple, Optional, Tuple, Union
+
+from google.protobuf import descriptor_pb2
+from google.protobuf import descriptor_pool
+from google.protobuf import message_factory
+from google.protobuf.any_pb2 import Any as ProtoAny
+from google.protobuf.descriptor import Descriptor, FieldDescriptor
+
+
+# Number of messages generated from one random stream. Streams are seeded from the seed and
+# their position so the generated messages do not depend on the number of workers.
+CHUNK_SIZE = 1024
+
+# Chunk generator of a worker process, set by the pool initializer.
+_worker_chunks = None
+
+# Characters of generated strings.
+_ALPHABET = string.ascii_letters + string.digits + ' '
+
+# Bits of the random integers of each integer type and whether they are signed.
+_INTEGER_BITS = {
+    FieldDescriptor.TYPE_INT32: (32, True),
+    FieldDescriptor.TYPE_SINT32: (32, True),
+    FieldDescriptor.TYPE_SFIXED32: (32, True),
+    FieldDescriptor.TYPE_UINT32: (32, False),
+    FieldDescriptor.TYPE_FIXED32: (32, False),
+    FieldDescriptor.TYPE_INT64: (64, True),
+    FieldDescriptor.TYPE_SINT64: (64, True),
+    FieldDescriptor.TYPE_SFIXED64: (64, True),
+    FieldDescriptor.TYPE_UINT64: (64, False),
+    FieldDescriptor.TYPE_FIXED64: (64, False),
+}
+
+
+class GeneratorOptions(NamedTuple):
+    """Shape of generated messages. Length ranges are inclusive (minimum, maximum) pairs.
+    Attributes:
+        repeated_length (Tuple[int, int]): number of elements of repeated fields.
+        map_size (Tuple[int, int]): number of entries of map fields.
+        string_length (Tuple[int, int]): number of characters of strings and map keys.
+        bytes_length (Tuple[int, int]): number of bytes of bytes fields.
+        lengths (Mapping[str, Tuple[int, int]]): ranges of specific fields by
+            FieldDescriptor.full_name, replacing the range of their kind.
+        oneof_weights (Mapping[str, Mapping[str, float]]): relative weights of the fields of a
+            oneof by OneofDescriptor.full_name, then field name. Fields left out of a mapping are
+            never selected and fields of oneofs left out are selected uniformly.
+        unset_oneof_probability (float): probability of leaving a oneof unset.
+        max_depth (int): number of levels of nested messages that are filled, deeper message
+            fields are left empty so recursive messages end.
+    """
+    repeated_length: Tuple[int, int] = (0, 4)
+    map_size: Tuple[int, int] = (0, 4)
+    string_length: Tuple[int, int] = (4, 16)
+    bytes_length: Tuple[int, int] = (4, 16)
+    lengths: Mapping[str, Tuple[int, int]] = {}
+    oneof_weights: Mapping[str, Mapping[str, float]] = {}
+    unset_oneof_probability: float = 0.0
+    max_depth: int = 4
+
+
+# region Public Methods
+def generate_messages(
+        message: Union[type, Descriptor],
+        count: int,
+        seed: int = 0,
+        options: Optional[GeneratorOptions] = None) -> Iterator[ProtoAny]:
+    """Generates a deterministic stream of random protobuf objects of a message. Every field is
+    filled from a random stream seeded by seed, so the same arguments always generate the same
+    messages.
+    Args:
+        message (Union[type, Descriptor]): protobuf class or descriptor of the message.
+        count (int): number of objects to generate.
+        seed (int): seed of the random streams.
+        options (Optional[GeneratorOptions]): shape of the objects, GeneratorOptions() when None.
+    Returns:
+        Iterator[ProtoAny]: generated protobuf objects.
+    """
+    message_class = _get_message_class(message)
+    generator = MessageGenerator(message_class.DESCRIPTOR, options)
+    for chunk, chunk_count in _iter_chunks(count):
+        rng = _chunk_random(seed, chunk)
+        for _ in range(chunk_count):
+            obj = message_class()
+            generator.fill(obj, rng)
+            yield obj
+
+
+def generate_serialized_messages(
+        message: Union[type, Descriptor],
+        count: int,
+        seed: int = 0,
+        options: Optional[GeneratorOptions] = None,
+        workers: int = 1) -> Iterator[bytes]:
+    """Generates the serialized bytes of the objects of generate_messages. With more than one
+    worker chunks of CHUNK_SIZE objects are generated and serialized by a pool of processes and
+    yielded in order, the output does not depend on the number of workers. Map entries are
+    serialized in key order so equal objects always have equal bytes.
+    Args:
+        message (Union[type, Descriptor]): protobuf class or descriptor of the message.
+        count (int): number of objects to generate.
+        seed (int): seed of the random streams.
+        options (Optional[GeneratorOptions]): shape of the objects, GeneratorOptions() when None.
+        workers (int): number of worker processes, 1 generates in the current process.
+    Returns:
+        Iterator[bytes]: serialized protobuf objects.
+    """
+    message_class = _get_message_class(message)
+    if options is None:
+        options = GeneratorOptions()
+    tasks = ((seed, chunk, chunk_count) for chunk, chunk_count in _iter_chunks(count))
+    if workers <= 1:
+        chunks = _ChunkGenerator(message_class, options)
+        for task in tasks:
+            yield from chunks(task)
+        return
+
+    # workers rebuild the message from its file descriptors once, tasks only carry positions
+    descriptor = message_class.DESCRIPTOR
+    initargs = (_serialize_file_set(descriptor.file), descriptor.full_name, options)
+    with multiprocessing.get_context().Pool(workers, _init_worker, initargs) as pool:
+        for payloads in pool.imap(_generate_in_worker, tasks):
+            yield from payloads
+
+
+def log_generated_messages(
+        writer: Any,
+        message: Union[type, Descriptor],
+        count: int,
+        seed: int = 0,
+        options: Optional[GeneratorOptions] = None,
+        workers: int = 1,
+        start_timestamp: Optional[int] = None,
+        interval: int = 1_000_000) -> int:
+    """Writes generated objects straight from their serialized bytes to a log writer, e.g. a
+    SegmentWriter or RotatingSegmentWriter, so the logs can be replayed by play_log or converted
+    by flatten_log_to_csv. Records are timestamped interval nanoseconds apart.
+    Args:
+        writer (Any): log writer with a write(type_name, payload, timestamp) method.
+        message (Union[type, Descriptor]): protobuf class or descriptor of the message.
+        count (int): number of objects to generate.
+        seed (int): seed of the random streams.
+        options (Optional[GeneratorOptions]): shape of the objects, GeneratorOptions() when None.
+        workers (int): number of worker processes, 1 generates in the current process.
+        start_timestamp (Optional[int]): nanoseconds since the epoch of the first record, the
+            current time when None.
+        interval (int): nanoseconds between records.
+    Returns:
+        int: number of records written.
+    """
+    type_name = _get_message_class(message).DESCRIPTOR.full_name
+    timestamp = time.time_ns() if start_timestamp is None else start_timestamp
+    written = 0
+    write = writer.write
+    for payload in generate_serialized_messages(message, count, seed, options, workers):
+        write(type_name, payload, timestamp)
+        timestamp += interval
+        written += 1
+    return written
+
+
+class MessageGenerator:
+    """Fills protobuf objects of a message with random values. The fields of each message are
+    compiled once into a list of setters chosen from their type and the options, so filling an
+    object only draws values and sets them.
+    Args:
+        descriptor (Descriptor): descriptor of the message.
+        options (Optional[GeneratorOptions]): shape of the objects, GeneratorOptions() when None.
+    """
+
+    def __init__(
+            self, descriptor: Descriptor, options: Optional[GeneratorOptions] = None) -> None:
+        self.descriptor = descriptor
+        self.options = GeneratorOptions() if options is None else options
+        self._plans: Dict[Tuple[Descriptor, int], List[Callable[[Any, random.Random], None]]] = {}
+
+    def fill(self, obj: ProtoAny, rng: random.Random) -> None:
+        """Sets random values on the fields of an empty protobuf object.
+        Args:
+            obj (ProtoAny): protobuf object of the message.
+            rng (random.Random): random stream to draw the values from.
+        """
+        self._fill(obj, rng, self.descriptor, 0)
+
+    def _fill(self, obj: ProtoAny, rng: random.Random, descriptor: Descriptor, depth: int) -> None:
+        plan = self._plans.get((descriptor, depth))
+        if plan is None:
+            plan = self._plans[(descriptor, depth)] = self._compile(descriptor, depth)
+        for setter in plan:
+            setter(obj, rng)
+
+    def _compile(
+            self,
+            descriptor: Descriptor,
+            depth: int) -> List[Callable[[Any, random.Random], None]]:
+        # one setter per field outside of oneofs and one per oneof, in field number order
+        plan = []
+        oneofs_done = set()
+        for field in sorted(descriptor.fields, key=lambda field: field.number):
+            oneof = field.containing_oneof
+            if oneof is None:
+                setter = self._field_setter(field, depth)
+            elif oneof.name not in oneofs_done:
+                oneofs_done.add(oneof.name)
+                setter = self._oneof_setter(oneof, depth)
+            else:
+                continue
+            if setter is not None:
+                plan.append(setter)
+        return plan
+
+    def _field_setter(
+            self,
+            field: FieldDescriptor,
+            depth: int) -> Optional[Callable[[Any, random.Random], None]]:
+        name = field.name
+        options = self.options
+        is_message = field.cpp_type == FieldDescriptor.CPPTYPE_MESSAGE
+        # messages below max_depth are left empty
+        too_deep = depth + 1 >= options.max_depth
+
+        if is_message and field.message_type.GetOptions().map_entry:
+            key_value = _value_generator(field.message_type.fields_by_name['key'], options)
+            value_field = field.message_type.fields_by_name['value']
+            low, high = options.lengths.get(field.full_name, options.map_size)
+            if value_field.cpp_type == FieldDescriptor.CPPTYPE_MESSAGE:
+                if too_deep:
+                    return None
+                value_type = value_field.message_type
+                fill = self._fill
+
+                def set_message_map(obj: Any, rng: random.Random) -> None:
+                    container = getattr(obj, name)
+                    for _ in range(rng.randint(low, high)):
+                        fill(container[key_value(rng)], rng, value_type, depth + 1)
+                return set_message_map
+
+            value = _value_generator(value_field, options)
+
+            def set_scalar_map(obj: Any, rng: random.Random) -> None:
+                container = getattr(obj, name)
+                for _ in range(rng.randint(low, high)):
+                    container[key_value(rng)] = value(rng)
+            return set_scalar_map
+
+        if is_message and too_deep:
+            return None
+
+        if field.label == FieldDescriptor.LABEL_REPEATED:
+            low, high = options.lengths.get(field.full_name, options.repeated_length)
+            if is_message:
+                message_type = field.message_type
+                fill = self._fill
+
+                def set_repeated_message(obj: Any, rng: random.Random) -> None:
+                    container = getattr(obj, name)
+                    for _ in range(rng.randint(low, high)):
+                        fill(container.add(), rng, message_type, depth + 1)
+                return set_repeated_message
+
+            value = _value_generator(field, options)
+
+            def set_repeated_scalar(obj: Any, rng: random.Random) -> None:
+                getattr(obj, name).extend([value(rng) for _ in range(rng.randint(low, high))])
+            return set_repeated_scalar
+
+        if is_message:
+            message_type = field.message_type
+            fill = self._fill
+
+            def set_message(obj: Any, rng: random.Random) -> None:
+                child = getattr(obj, name)
+                child.SetInParent()
+                fill(child, rng, message_type, depth + 1)
+            return set_message
+
+        value = _value_generator(field, options)
+        return lambda obj, rng: setattr(obj, name, value(rng))
+
+    def _oneof_setter(self, oneof: Any, depth: int) -> Callable[[Any, random.Random], None]:
+        weights = self.options.oneof_weights.get(oneof.full_name)
+        members = []
+        member_weights = []
+        for field in oneof.fields:
+            weight = 1.0 if weights is None else weights.get(field.name, 0.0)
+            setter = self._field_setter(field, depth)
+            if setter is not None and weight > 0:
+                members.append(setter)
+                member_weights.append(weight)
+        unset = self.options.unset_oneof_probability
+        if not members:
+            return lambda obj, rng: None
+        cumulative = list(itertools.accumulate(member_weights))
+
+        def set_oneof(obj: Any, rng: random.Random) -> None:
+            if unset and rng.random() < unset:
+                return
+            rng.choices(members, cum_weights=cumulative)[0](obj, rng)
+        return set_oneof
+# endregion
+
+
+# region Private Classes
+class _ChunkGenerator:
+    # generates and serializes the messages of one chunk of a stream
+    __slots__ = ('message_class', 'generator')
+
+    def __init__(self, message_class: type, options: GeneratorOptions) -> None:
+        self.message_class = message_class
+        self.generator = MessageGenerator(message_class.DESCRIPTOR, options)
+
+    def __call__(self, task: Tuple[int, int, int]) -> List[bytes]:
+        seed, chunk, count = task
+        message_class = self.message_class
+        fill = self.generator.fill
+        rng = _chunk_random(seed, chunk)
+        payloads = []
+        for _ in range(count):
+            obj = message_class()
+            fill(obj, rng)
+            payloads.append(obj.SerializeToString(deterministic=True))
+        return payloads
+# endregion
+
+
+# region Private Methods
+def _value_generator(
+        field: FieldDescriptor,
+        options: GeneratorOptions) -> Callable[[random.Random], Any]:
+    # draws a random value of a scalar field
+    field_type = field.type
+    if field_type in _INTEGER_BITS:
+        bits, signed = _INTEGER_BITS[field_type]
+        if signed:
+            offset = 1 << (bits - 1)
+            return lambda rng: rng.getrandbits(bits) - offset
+        return lambda rng: rng.getrandbits(bits)
+    if field_type in (FieldDescriptor.TYPE_DOUBLE, FieldDescriptor.TYPE_FLOAT):
+        return lambda rng: rng.uniform(-1e6, 1e6)
+    if field_type == FieldDescriptor.TYPE_BOOL:
+        return lambda rng: bool(rng.getrandbits(1))
+    if field_type == FieldDescriptor.TYPE_ENUM:
+        numbers = [value.number for value in field.enum_type.values]
+        return lambda rng: rng.choice(numbers)
+    if field_type == FieldDescriptor.TYPE_BYTES:
+        low, high = options.lengths.get(field.full_name, options.bytes_length)
+        return lambda rng: _random_bytes(rng, rng.randint(low, high))
+    low, high = options.lengths.get(field.full_name, options.string_length)
+    return lambda rng: ''.join(rng.choices(_ALPHABET, k=rng.randint(low, high)))
+
+
+def _random_bytes(rng: random.Random, length: int) -> bytes:
+    # same bytes as Random.randbytes, which needs python 3.9, getrandbits(0) fails before 3.9
+    if not length:
+        return b''
+    return rng.getrandbits(8 * length).to_bytes(length, 'little')
+
+
+def _iter_chunks(count: int) -> Iterator[Tuple[int, int]]:
+    # (chunk index, number of messages) of the chunks of a stream of count messages
+    for chunk, start in enumerate(range(0, count, CHUNK_SIZE)):
+        yield chunk, min(CHUNK_SIZE, count - start)
+
+
+def _chunk_random(seed: int, chunk: int) -> random.Random:
+    # string seeds are hashed with sha512, so streams are the same in every process
+    return random.Random(f'{seed}:{chunk}')
+
+
+def _get_message_class(message: Union[type, Descriptor]) -> type:
+    if isinstance(message, Descriptor):
+        return message_factory.MessageFactory(message.file.pool).GetPrototype(message)
+    return message
+
+
+def _serialize_file_set(file: Any) -> Tuple[bytes, ...]:
+    # serialized file descriptors of a proto file and its dependencies, dependencies first
+    files = []
+    seen = set()
+
+    def visit(file: Any) -> None:
+        if file.name in seen:
+            return
+        seen.add(file.name)
+        for dependency in file.dependencies:
+            visit(dependency)
+        files.append(file.serialized_pb)
+
+    visit(file)
+    return tuple(files)
+
+
+def _load_message_class(file_set: Tuple[bytes, ...], full_name: str) -> type:
+    # rebuilds a message in a private pool, so workers do not need the generated modules
+    pool = descriptor_pool.DescriptorPool()
+    for serialized in file_set:
+        pool.Add(descriptor_pb2.FileDescriptorProto.FromString(serialized))
+    descriptor = pool.FindMessageTypeByName(full_name)
+    return message_factory.MessageFactory(pool).GetPrototype(descriptor)
+
+
+def _init_worker(file_set: Tuple[bytes, ...], full_name: str, options: GeneratorOptions) -> None:
+    global _worker_chunks
+    _worker_chunks = _ChunkGenerator(_load_message_class(file_set, full_name), options)
+
+
+def _generate_in_worker(task: Tuple[int, int, int]) -> List[bytes]:
+    return _worker_chunks(task)
+# endregion
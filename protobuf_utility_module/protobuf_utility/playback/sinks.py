@@ -0,0 +1,166 @@
+from abc import ABC, abstractmethod
+import asyncio
+import struct
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from protobuf_utility.logger.segment import LogRecord
+
+
+# Frame sent by the socket sinks: u16 type name length, i64 timestamp (ns), type name, payload.
+# Frames sent over TCP are prefixed with their u32 length.
+_FRAME_HEADER = struct.Struct('<Hq')
+_FRAME_LENGTH = struct.Struct('<I')
+
+
+class Sink(ABC):
+    """Destination the playback engine publishes records to. Records are published in batches
+    so a sink can coalesce them into a single write.
+    """
+
+    async def open(self) -> None:
+        """Called once before the first batch is published."""
+
+    @abstractmethod
+    async def publish(self, records: List[LogRecord]) -> None:
+        """Publishes a batch of records.
+        Args:
+            records (List[LogRecord]): records in playback order, the sink may keep the list.
+        """
+
+    async def close(self) -> None:
+        """Called once after the last batch was published."""
+
+
+class QueueSink(Sink):
+    """Publishes records to an asyncio queue consumed in the same process. None is put on the
+    queue when the playback ends.
+    Args:
+        queue (Optional[asyncio.Queue]): queue to publish to, one is created when the sink is
+            opened when None.
+        maxsize (int): size of the created queue, unbounded when 0.
+    """
+
+    def __init__(self, queue: Optional[asyncio.Queue] = None, maxsize: int = 0) -> None:
+        self.queue = queue
+        self.maxsize = maxsize
+
+    async def open(self) -> None:
+        if self.queue is None:
+            self.queue = asyncio.Queue(self.maxsize)
+
+    async def publish(self, records: List[LogRecord]) -> None:
+        queue = self.queue
+        put = queue.put_nowait
+        for record in records:
+            try:
+                put(record)
+            except asyncio.QueueFull:
+                await queue.put(record)
+
+    async def close(self) -> None:
+        await self.queue.put(None)
+
+
+class UdpSink(Sink):
+    """Publishes every record as a datagram, records must fit in a datagram.
+    Args:
+        host (str): host to send the datagrams to.
+        port (int): port to send the datagrams to.
+    """
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._names: Dict[str, bytes] = {}
+
+    async def open(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, remote_addr=(self.host, self.port))
+
+    async def publish(self, records: List[LogRecord]) -> None:
+        sendto = self._transport.sendto
+        for record in records:
+            sendto(encode_frame(record, self._names))
+
+    async def close(self) -> None:
+        self._transport.close()
+
+
+class TcpSink(Sink):
+    """Publishes length prefixed records over a TCP connection, see read_frames.
+    Args:
+        host (str): host to connect to.
+        port (int): port to connect to.
+    """
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._names: Dict[str, bytes] = {}
+
+    async def open(self) -> None:
+        _, self._writer = await asyncio.open_connection(self.host, self.port)
+
+    async def publish(self, records: List[LogRecord]) -> None:
+        frames = []
+        for record in records:
+            frame = encode_frame(record, self._names)
+            frames.append(_FRAME_LENGTH.pack(len(frame)))
+            frames.append(frame)
+        self._writer.writelines(frames)
+        await self._writer.drain()
+
+    async def close(self) -> None:
+        self._writer.close()
+        await self._writer.wait_closed()
+
+
+# region Public Methods
+def encode_frame(record: LogRecord, names: Optional[Dict[str, bytes]] = None) -> bytes:
+    """Encodes a record into the frame sent by the socket sinks.
+    Args:
+        record (LogRecord): record to encode.
+        names (Optional[Dict[str, bytes]]): cache of encoded type names.
+    Returns:
+        bytes: encoded frame.
+    """
+    name = None if names is None else names.get(record.type_name)
+    if name is None:
+        name = record.type_name.encode()
+        if names is not None:
+            names[record.type_name] = name
+    return b''.join((
+        _FRAME_HEADER.pack(len(name), record.timestamp), name, record.payload))
+
+
+def decode_frame(frame: bytes) -> Tuple[str, int, bytes]:
+    """Decodes a frame sent by the socket sinks.
+    Args:
+        frame (bytes): datagram or frame read from a TCP stream without its length prefix.
+    Returns:
+        Tuple[str, int, bytes]: type name, timestamp and serialized protobuf.
+    """
+    name_length, timestamp = _FRAME_HEADER.unpack_from(frame)
+    payload_start = _FRAME_HEADER.size + name_length
+    return str(frame[_FRAME_HEADER.size:payload_start], 'utf-8'), timestamp, frame[payload_start:]
+
+
+async def read_frames(reader: asyncio.StreamReader) -> AsyncIterator[Tuple[str, int, bytes]]:
+    """Reads the frames published by a TcpSink until the connection is closed.
+    Args:
+        reader (asyncio.StreamReader): reader of the accepted connection.
+    Returns:
+        AsyncIterator[Tuple[str, int, bytes]]: type name, timestamp and serialized protobuf of
+            each frame.
+    """
+    while True:
+        try:
+            length = _FRAME_LENGTH.unpack(await reader.readexactly(_FRAME_LENGTH.size))[0]
+            frame = await reader.readexactly(length)
+        except asyncio.IncompleteReadError:
+            return
+        yield decode_frame(frame)
+# endregion
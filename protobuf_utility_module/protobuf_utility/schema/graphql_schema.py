@@ -0,0 +1,188 @@
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from google.protobuf import descriptor_pb2
+from google.protobuf import descriptor_pool
+from google.protobuf.descriptor import Descriptor, EnumDescriptor, FieldDescriptor, FileDescriptor
+
+from protobuf_utility.transforms.graphql_transformer import GRAPHQL_CACHE_SIZE
+from protobuf_utility.transforms.graphql_transformer import graphql_type_name
+
+
+# Custom scalars of the protobuf types graphql has no scalar for. 64 bit integers and unsigned
+# 32 bit integers do not fit the signed 32 bit Int, bytes are base64 strings like in json.
+SCALAR_INT64 = 'Int64'
+SCALAR_UINT64 = 'UInt64'
+SCALAR_UINT32 = 'UInt32'
+SCALAR_BYTES = 'Bytes'
+
+# Field of the object type of a message without fields, graphql types need at least one field.
+EMPTY_FIELD = '_empty: Boolean'
+
+_GRAPHQL_SCALARS = {
+    FieldDescriptor.TYPE_DOUBLE: 'Float',
+    FieldDescriptor.TYPE_FLOAT: 'Float',
+    FieldDescriptor.TYPE_INT32: 'Int',
+    FieldDescriptor.TYPE_SINT32: 'Int',
+    FieldDescriptor.TYPE_SFIXED32: 'Int',
+    FieldDescriptor.TYPE_UINT32: SCALAR_UINT32,
+    FieldDescriptor.TYPE_FIXED32: SCALAR_UINT32,
+    FieldDescriptor.TYPE_INT64: SCALAR_INT64,
+    FieldDescriptor.TYPE_SINT64: SCALAR_INT64,
+    FieldDescriptor.TYPE_SFIXED64: SCALAR_INT64,
+    FieldDescriptor.TYPE_UINT64: SCALAR_UINT64,
+    FieldDescriptor.TYPE_FIXED64: SCALAR_UINT64,
+    FieldDescriptor.TYPE_BOOL: 'Boolean',
+    FieldDescriptor.TYPE_STRING: 'String',
+    FieldDescriptor.TYPE_BYTES: SCALAR_BYTES,
+}
+_CUSTOM_SCALARS = (SCALAR_INT64, SCALAR_UINT64, SCALAR_UINT32, SCALAR_BYTES)
+
+
+# region Public Methods
+def generate_graphql_sdl(
+        files: Iterable[Union[FileDescriptor, str]],
+        pool: Optional[Any] = None) -> str:
+    """Generates the graphql schema definition of every message and enum of some proto files.
+    Messages become object types, enums become enums, repeated fields become lists and map
+    fields lists of their entry type (key and value). Types are named by graphql_type_name and
+    defined once each, after the types they reference, together with the types of other files
+    they reference. Type definitions are cached per descriptor so schemas sharing files do not
+    generate them again.
+    Scalars without a protobuf counterpart are custom scalars: Int64, UInt64, UInt32 and Bytes.
+    Singular scalars are non null unless the field tracks presence (oneof or optional), singular
+    messages are nullable.
+    Args:
+        files (Iterable[Union[FileDescriptor, str]]): proto files, or their names in pool.
+        pool (Optional[Any]): descriptor pool file names are looked up in, the default pool when
+            None. Descriptor pools cannot list their files so they are always named.
+    Returns:
+        str: graphql schema definition.
+    """
+    if pool is None:
+        pool = descriptor_pool.Default()
+    ordered: Dict[Any, None] = {}
+    for file in files:
+        if isinstance(file, str):
+            file = pool.FindFileByName(file)
+        for enum_type in file.enum_types_by_name.values():
+            ordered[enum_type] = None
+        for message_type in file.message_types_by_name.values():
+            _add_message(ordered, message_type)
+
+    names: Dict[str, Any] = {}
+    scalars = set()
+    definitions = []
+    for descriptor in ordered:
+        name = graphql_type_name(descriptor)
+        other = names.setdefault(name, descriptor)
+        if other is not descriptor:
+            raise ValueError(
+                f'{descriptor.full_name} and {other.full_name} have the same graphql name {name}')
+        if isinstance(descriptor, EnumDescriptor):
+            definitions.append(_enum_definition(descriptor))
+        else:
+            definition, used_scalars = _type_definition(descriptor)
+            definitions.append(definition)
+            scalars.update(used_scalars)
+    definitions[:0] = [f'scalar {scalar}' for scalar in _CUSTOM_SCALARS if scalar in scalars]
+    return '\n\n'.join(definitions) + '\n' if definitions else ''
+
+
+def generate_graphql_sdl_from_file_set(
+        file_set: Union[descriptor_pb2.FileDescriptorSet, bytes]) -> str:
+    """Generates the graphql schema definition of the files of a FileDescriptorSet, such as the
+    output of protoc --descriptor_set_out. The files are loaded into a new descriptor pool, the
+    set must contain the dependencies of its files (protoc --include_imports).
+    Args:
+        file_set (Union[descriptor_pb2.FileDescriptorSet, bytes]): file descriptor set or its
+            serialized bytes.
+    Returns:
+        str: graphql schema definition.
+    """
+    if isinstance(file_set, bytes):
+        file_set = descriptor_pb2.FileDescriptorSet.FromString(file_set)
+    pool = descriptor_pool.DescriptorPool()
+    for file_proto in file_set.file:
+        pool.Add(file_proto)
+    return generate_graphql_sdl([file_proto.name for file_proto in file_set.file], pool)
+# endregion
+
+
+# region Private Methods
+def _add_message(ordered: Dict[Any, None], descriptor: Descriptor) -> None:
+    # adds a message after the enums and messages its fields reference and its nested types,
+    # depth first so every type follows its dependencies (recursive types follow the types of
+    # the cycle seen first)
+    if descriptor in ordered:
+        return
+    stack: List[Tuple[Descriptor, List[Any]]] = [(descriptor, list(_dependencies(descriptor)))]
+    visiting = {descriptor}
+    while stack:
+        current, dependencies = stack[-1]
+        if not dependencies:
+            stack.pop()
+            ordered[current] = None
+            continue
+        dependency = dependencies.pop(0)
+        if dependency in ordered or dependency in visiting:
+            continue
+        if isinstance(dependency, EnumDescriptor):
+            ordered[dependency] = None
+            continue
+        visiting.add(dependency)
+        stack.append((dependency, list(_dependencies(dependency))))
+
+
+@lru_cache(maxsize=GRAPHQL_CACHE_SIZE)
+def _dependencies(descriptor: Descriptor) -> Tuple[Any, ...]:
+    # enums and messages of the fields of a message in field number order, then its nested types
+    dependencies: Dict[Any, None] = {}
+    for field in sorted(descriptor.fields, key=lambda field: field.number):
+        if field.enum_type is not None:
+            dependencies[field.enum_type] = None
+        elif field.message_type is not None:
+            dependencies[field.message_type] = None
+    for enum_type in descriptor.enum_types:
+        dependencies[enum_type] = None
+    for nested_type in descriptor.nested_types:
+        dependencies[nested_type] = None
+    return tuple(dependencies)
+
+
+@lru_cache(maxsize=GRAPHQL_CACHE_SIZE)
+def _type_definition(descriptor: Descriptor) -> Tuple[str, Tuple[str, ...]]:
+    # object type of a message and the custom scalars it uses
+    lines = [f'type {graphql_type_name(descriptor)} {{']
+    scalars = []
+    for field in sorted(descriptor.fields, key=lambda field: field.number):
+        field_type = _field_type(field)
+        if field.type in _GRAPHQL_SCALARS:
+            scalars.append(_GRAPHQL_SCALARS[field.type])
+        lines.append(f'\t{field.name}: {field_type}')
+    if not descriptor.fields:
+        lines.append(f'\t{EMPTY_FIELD}')
+    lines.append('}')
+    return '\n'.join(lines), tuple(scalar for scalar in scalars if scalar in _CUSTOM_SCALARS)
+
+
+@lru_cache(maxsize=GRAPHQL_CACHE_SIZE)
+def _enum_definition(descriptor: EnumDescriptor) -> str:
+    values = ''.join(f'\t{value.name}\n' for value in descriptor.values)
+    return f'enum {graphql_type_name(descriptor)} {{\n{values}}}'
+
+
+def _field_type(field: FieldDescriptor) -> str:
+    # graphql type of a field, lists and fields without presence are non null
+    if field.enum_type is not None:
+        element = graphql_type_name(field.enum_type)
+    elif field.message_type is not None:
+        element = graphql_type_name(field.message_type)
+    else:
+        element = _GRAPHQL_SCALARS[field.type]
+    if field.label == FieldDescriptor.LABEL_REPEATED:
+        return f'[{element}!]!'
+    if field.message_type is not None or field.has_presence:
+        return element
+    return f'{element}!'
+# endregion
@@ -0,0 +1,461 @@
+from functools import lru_cache
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from google.protobuf.descriptor import Descriptor, FieldDescriptor, FileDescriptor
+
+from protobuf_utility.schema.sqlite_schema import PARENT_ID_COLUMN
+from protobuf_utility.schema.sqlite_schema import TABLE_MESSAGE
+from protobuf_utility.schema.sqlite_schema import ColumnSchema
+from protobuf_utility.schema.sqlite_schema import TableSchema
+from protobuf_utility.schema.sqlite_schema import create_index_statements
+from protobuf_utility.schema.sqlite_schema import create_table_statement
+from protobuf_utility.schema.sqlite_schema import get_table_schemas
+from protobuf_utility.schema.sqlite_schema import quote_identifier
+from protobuf_utility.transforms.list_transformer import PLAN_CACHE_SIZE
+
+
+# Kinds of field changes, fields are matched by number.
+FIELD_ADDED = 'added'
+FIELD_REMOVED = 'removed'
+FIELD_RENAMED = 'renamed'
+FIELD_TYPE_CHANGED = 'type_changed'
+FIELD_LABEL_CHANGED = 'label_changed'
+FIELD_MOVED_INTO_MAP = 'moved_into_map'
+FIELD_MOVED_OUT_OF_MAP = 'moved_out_of_map'
+
+# Suffix of the temporary table a table is copied to when its columns can not be altered.
+_REBUILD_SUFFIX = '__migration'
+
+_LABELS = {
+    FieldDescriptor.LABEL_OPTIONAL: 'optional',
+    FieldDescriptor.LABEL_REQUIRED: 'required',
+    FieldDescriptor.LABEL_REPEATED: 'repeated',
+}
+
+
+class FieldChange(NamedTuple):
+    """A difference between two versions of a field of a message.
+    Attributes:
+        message (str): full name of the message.
+        number (int): number of the field.
+        change (str): one of the FIELD_* constants.
+        old (Optional[FieldDescriptor]): field before the change, None when it was added.
+        new (Optional[FieldDescriptor]): field after the change, None when it was removed.
+    """
+    message: str
+    number: int
+    change: str
+    old: Optional[FieldDescriptor]
+    new: Optional[FieldDescriptor]
+
+
+class SchemaDiff(NamedTuple):
+    """Differences between two sets of message descriptors.
+    Attributes:
+        added (List[str]): full names of the messages only in the new set.
+        removed (List[str]): full names of the messages only in the old set.
+        changed (List[str]): full names of the messages whose fingerprint changed, including
+            messages that only changed through a nested message.
+        fields (List[FieldChange]): field changes of the changed messages.
+        unchanged (int): number of messages skipped because their fingerprint is unchanged.
+    """
+    added: List[str]
+    removed: List[str]
+    changed: List[str]
+    fields: List[FieldChange]
+    unchanged: int
+
+
+class FingerprintCache:
+    """Fingerprints of the messages of proto files stored in a JSON file. A file is identified by
+    the hash of its serialized descriptor and of the files it depends on, so the fingerprints of
+    a file are reused until it or one of its dependencies changes.
+    Args:
+        path (Optional[Path]): JSON file to load from and save to, the cache is only kept in
+            memory when None.
+    """
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        self.path = None if path is None else Path(path)
+        self._files: Dict[str, Dict[str, str]] = {}
+        self._changed = False
+        if self.path is not None and self.path.exists():
+            with open(self.path, 'r') as f:
+                self._files = json.load(f)
+
+    def get(self, descriptor: Descriptor) -> str:
+        """Gets the fingerprint of a message, computing the fingerprints of its file on a miss.
+        Args:
+            descriptor (Descriptor): DESCRIPTOR of the protobuf message.
+        Returns:
+            str: hex sha256 fingerprint, see descriptor_fingerprint.
+        """
+        key = _file_key(descriptor.file)
+        fingerprints = self._files.get(key)
+        if fingerprints is None:
+            fingerprints = self._files[key] = {
+                message.full_name: descriptor_fingerprint(message)
+                for message in _file_messages(descriptor.file)
+            }
+            self._changed = True
+        fingerprint = fingerprints.get(descriptor.full_name)
+        if fingerprint is None:
+            # messages built outside of a proto file are cached on their own
+            fingerprint = fingerprints[descriptor.full_name] = descriptor_fingerprint(descriptor)
+            self._changed = True
+        return fingerprint
+
+    def save(self) -> None:
+        """Writes the cache to its JSON file when it changed."""
+        if self.path is None or not self._changed:
+            return
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump(self._files, f, sort_keys=True)
+        os.replace(temp_path, self.path)
+        self._changed = False
+
+
+# region Public Methods
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def descriptor_fingerprint(descriptor: Descriptor) -> str:
+    """Computes a stable fingerprint of the fields of a message and of every message it contains,
+    so two messages with the same fingerprint are stored in the same tables. Field order,
+    comments, options and enum values do not change the fingerprint.
+    Args:
+        descriptor (Descriptor): DESCRIPTOR of the protobuf message.
+    Returns:
+        str: hex sha256 fingerprint.
+    """
+    reachable = _reachable_messages(descriptor)
+    canonical = [_shallow_signature(reachable[name]) for name in sorted(reachable)]
+    return hashlib.sha256(json.dumps([descriptor.full_name, canonical]).encode()).hexdigest()
+
+
+def diff_descriptors(
+        old: Iterable[Descriptor],
+        new: Iterable[Descriptor],
+        cache: Optional[FingerprintCache] = None) -> SchemaDiff:
+    """Computes the field level differences between two sets of message descriptors. Messages
+    are matched by full name and messages with the same fingerprint are skipped without looking
+    at their fields.
+    Args:
+        old (Iterable[Descriptor]): messages of the current schema.
+        new (Iterable[Descriptor]): messages of the new schema.
+        cache (Optional[FingerprintCache]): cache of the fingerprints.
+    Returns:
+        SchemaDiff: added, removed and changed messages and the field changes.
+    """
+    fingerprint = descriptor_fingerprint if cache is None else cache.get
+    old_messages = {descriptor.full_name: descriptor for descriptor in old}
+    new_messages = {descriptor.full_name: descriptor for descriptor in new}
+
+    changed = []
+    fields: List[FieldChange] = []
+    unchanged = 0
+    diffed = set()
+    for name, new_descriptor in new_messages.items():
+        old_descriptor = old_messages.get(name)
+        if old_descriptor is None:
+            continue
+        if fingerprint(old_descriptor) == fingerprint(new_descriptor):
+            unchanged += 1
+            continue
+        changed.append(name)
+        # the change may be in a nested message, each message type is compared once
+        old_reachable = _reachable_messages(old_descriptor)
+        for nested_name, new_nested in _reachable_messages(new_descriptor).items():
+            old_nested = old_reachable.get(nested_name)
+            if old_nested is None or nested_name in diffed:
+                continue
+            diffed.add(nested_name)
+            if _shallow_signature(old_nested) != _shallow_signature(new_nested):
+                fields.extend(_diff_fields(nested_name, old_nested, new_nested))
+    return SchemaDiff(
+        [name for name in new_messages if name not in old_messages],
+        [name for name in old_messages if name not in new_messages],
+        changed,
+        fields,
+        unchanged)
+
+
+def generate_migration_statements(
+        old: Iterable[Descriptor],
+        new: Iterable[Descriptor],
+        cache: Optional[FingerprintCache] = None) -> List[str]:
+    """Generates the SQLite statements migrating the tables of get_table_schemas from one set of
+    message descriptors to another. Tables and columns are matched by the field numbers leading
+    to them so renamed fields keep their data. Statements are ordered so new tables are created
+    before they are referenced, renames come before additions, tables whose columns can not be
+    altered in place are copied into a new table, dropped tables are dropped children first and
+    indexes are created last.
+    Args:
+        old (Iterable[Descriptor]): messages of the current schema.
+        new (Iterable[Descriptor]): messages of the new schema.
+        cache (Optional[FingerprintCache]): cache of the fingerprints.
+    Returns:
+        List[str]: SQLite statements.
+    """
+    fingerprint = descriptor_fingerprint if cache is None else cache.get
+    old_messages = {descriptor.full_name: descriptor for descriptor in old}
+    new_messages = {descriptor.full_name: descriptor for descriptor in new}
+
+    replaced: List[str] = []
+    creates: List[str] = []
+    renames: List[str] = []
+    additions: List[str] = []
+    rebuilds: List[str] = []
+    drops: List[str] = []
+    indexes: List[str] = []
+    for name in dict.fromkeys(list(old_messages) + list(new_messages)):
+        old_descriptor = old_messages.get(name)
+        new_descriptor = new_messages.get(name)
+        if old_descriptor is not None and new_descriptor is not None and (
+                fingerprint(old_descriptor) == fingerprint(new_descriptor)):
+            continue
+        old_tables = {} if old_descriptor is None else _keyed_tables(old_descriptor)
+        new_tables = {} if new_descriptor is None else _keyed_tables(new_descriptor)
+        new_names = {table.name for table in new_tables.values()}
+
+        for key, new_table in new_tables.items():
+            old_table = old_tables.get(key)
+            if old_table is None:
+                creates.append(create_table_statement(new_table))
+                indexes.extend(create_index_statements(new_table))
+                continue
+            if old_table.name != new_table.name:
+                renames.extend(_rename_table(old_table, new_table))
+                indexes.extend(create_index_statements(new_table))
+            if _migrate_columns(old_table, new_table, renames, additions, rebuilds):
+                indexes.extend(create_index_statements(new_table))
+        for key, old_table in reversed(list(old_tables.items())):
+            if key in new_tables:
+                continue
+            # a table whose name is taken by a new table, e.g. a repeated field turned into a
+            # map, is dropped before the new table is created
+            if old_table.name in new_names:
+                replaced.append(_drop_table(old_table))
+            else:
+                drops.append(_drop_table(old_table))
+    return replaced + creates + renames + additions + rebuilds + drops + list(
+        dict.fromkeys(indexes))
+
+
+def generate_migration_script(
+        old: Iterable[Descriptor],
+        new: Iterable[Descriptor],
+        cache: Optional[FingerprintCache] = None) -> str:
+    """Generates a SQL script migrating the tables of get_table_schemas from one set of message
+    descriptors to another in a single transaction, see generate_migration_statements.
+    Args:
+        old (Iterable[Descriptor]): messages of the current schema.
+        new (Iterable[Descriptor]): messages of the new schema.
+        cache (Optional[FingerprintCache]): cache of the fingerprints.
+    Returns:
+        str: SQLite script, empty when nothing changed.
+    """
+    statements = generate_migration_statements(old, new, cache)
+    if not statements:
+        return ''
+    # foreign keys would cascade deletes while tables are copied and dropped
+    lines = ['PRAGMA foreign_keys = OFF;', 'BEGIN;']
+    lines.extend(f'{statement};' for statement in statements)
+    lines.append('COMMIT;')
+    return '\n'.join(lines) + '\n'
+# endregion
+
+
+# region Private Methods
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _shallow_signature(descriptor: Descriptor) -> list:
+    # fields of a message sorted by number, nested messages are referenced by name
+    return [descriptor.full_name, [
+        [field.number, field.name, field.type, field.label, _is_map(field), _type_name(field)]
+        for field in sorted(descriptor.fields, key=lambda field: field.number)
+    ]]
+
+
+def _reachable_messages(descriptor: Descriptor) -> Dict[str, Descriptor]:
+    # the message and every message type of its fields, recursively, by full name
+    reachable: Dict[str, Descriptor] = {}
+    pending = [descriptor]
+    while pending:
+        message = pending.pop()
+        if message.full_name in reachable:
+            continue
+        reachable[message.full_name] = message
+        pending.extend(
+            field.message_type for field in message.fields if field.message_type is not None)
+    return reachable
+
+
+def _type_name(field: FieldDescriptor) -> str:
+    if field.message_type is not None:
+        return field.message_type.full_name
+    if field.enum_type is not None:
+        return field.enum_type.full_name
+    return ''
+
+
+def _is_map(field: Optional[FieldDescriptor]) -> bool:
+    return (
+        field is not None and
+        field.message_type is not None and
+        field.message_type.GetOptions().map_entry)
+
+
+def _diff_fields(
+        name: str, old: Descriptor, new: Descriptor) -> Iterator[FieldChange]:
+    # field changes of a message matched by number
+    numbers = sorted(set(old.fields_by_number) | set(new.fields_by_number))
+    for number in numbers:
+        old_field = old.fields_by_number.get(number)
+        new_field = new.fields_by_number.get(number)
+        if old_field is None:
+            yield FieldChange(name, number, FIELD_ADDED, None, new_field)
+        elif new_field is None:
+            yield FieldChange(name, number, FIELD_REMOVED, old_field, None)
+        elif _is_map(old_field) != _is_map(new_field):
+            change = FIELD_MOVED_INTO_MAP if _is_map(new_field) else FIELD_MOVED_OUT_OF_MAP
+            yield FieldChange(name, number, change, old_field, new_field)
+        else:
+            if old_field.name != new_field.name:
+                yield FieldChange(name, number, FIELD_RENAMED, old_field, new_field)
+            if _is_map(old_field):
+                old_entry = old_field.message_type.fields_by_name
+                new_entry = new_field.message_type.fields_by_name
+                type_changed = any(
+                    (old_entry[entry].type, _type_name(old_entry[entry])) !=
+                    (new_entry[entry].type, _type_name(new_entry[entry]))
+                    for entry in ('key', 'value'))
+            else:
+                type_changed = (old_field.type, _type_name(old_field)) != (
+                    new_field.type, _type_name(new_field))
+            if type_changed:
+                yield FieldChange(name, number, FIELD_TYPE_CHANGED, old_field, new_field)
+            if _LABELS[old_field.label] != _LABELS[new_field.label]:
+                yield FieldChange(name, number, FIELD_LABEL_CHANGED, old_field, new_field)
+
+
+def _keyed_tables(descriptor: Descriptor) -> Dict[tuple, TableSchema]:
+    # tables of a message keyed by the field numbers leading to them
+    keys: Dict[str, tuple] = {}
+    tables = {}
+    descriptors: Dict[str, Descriptor] = {}
+    for table in get_table_schemas(descriptor):
+        if table.parent is None:
+            key: tuple = ()
+        else:
+            key = keys[table.parent] + (table.kind,) + _field_numbers(
+                descriptors[table.parent], table.path)
+        keys[table.name] = key
+        descriptors[table.name] = table.descriptor
+        tables[key] = table
+    return tables
+
+
+def _field_numbers(descriptor: Optional[Descriptor], path: Tuple[str, ...]) -> Tuple[int, ...]:
+    numbers = []
+    for name in path:
+        field = descriptor.fields_by_name[name]
+        numbers.append(field.number)
+        descriptor = field.message_type
+    return tuple(numbers)
+
+
+def _keyed_columns(table: TableSchema) -> Dict[tuple, ColumnSchema]:
+    # columns of a table keyed by the field numbers leading to them
+    return {
+        (column.name,) if not column.path else _field_numbers(table.descriptor, column.path):
+            column
+        for column in table.columns
+    }
+
+
+def _migrate_columns(
+        old: TableSchema,
+        new: TableSchema,
+        renames: List[str],
+        additions: List[str],
+        rebuilds: List[str]) -> bool:
+    # columns are renamed and added in place, removed or retyped columns need a copy of the
+    # table, returns whether the table was copied and lost its indexes
+    old_columns = _keyed_columns(old)
+    new_columns = _keyed_columns(new)
+    table = quote_identifier(new.name)
+    if any(
+            key not in new_columns or new_columns[key].sql_type != old_column.sql_type
+            for key, old_column in old_columns.items()):
+        rebuilds.extend(_rebuild_table(old_columns, new))
+        return True
+    for key, new_column in new_columns.items():
+        old_column = old_columns.get(key)
+        if old_column is None:
+            additions.append(
+                f'ALTER TABLE {table} ADD COLUMN '
+                f'{quote_identifier(new_column.name)} {new_column.sql_type}')
+        elif old_column.name != new_column.name:
+            renames.append(
+                f'ALTER TABLE {table} RENAME COLUMN {quote_identifier(old_column.name)} '
+                f'TO {quote_identifier(new_column.name)}')
+    return False
+
+
+def _rebuild_table(old_columns: Dict[tuple, ColumnSchema], new: TableSchema) -> List[str]:
+    # copies the kept columns into a table created with the new layout
+    temp = new._replace(name=new.name + _REBUILD_SUFFIX)
+    targets = []
+    sources = []
+    for key, new_column in _keyed_columns(new).items():
+        old_column = old_columns.get(key)
+        if old_column is None:
+            continue
+        targets.append(quote_identifier(new_column.name))
+        source = quote_identifier(old_column.name)
+        if old_column.sql_type != new_column.sql_type:
+            source = f'CAST({source} AS {new_column.sql_type})'
+        sources.append(source)
+    return [
+        create_table_statement(temp),
+        f'INSERT INTO {quote_identifier(temp.name)} ({", ".join(targets)}) '
+        f'SELECT {", ".join(sources)} FROM {quote_identifier(new.name)}',
+        f'DROP TABLE {quote_identifier(new.name)}',
+        f'ALTER TABLE {quote_identifier(temp.name)} RENAME TO {quote_identifier(new.name)}',
+    ]
+
+
+def _rename_table(old: TableSchema, new: TableSchema) -> List[str]:
+    statements = [
+        f'ALTER TABLE {quote_identifier(old.name)} RENAME TO {quote_identifier(new.name)}'
+    ]
+    # indexes follow the table but keep the name they were created with
+    if old.kind != TABLE_MESSAGE:
+        statements.append(
+            f'DROP INDEX IF EXISTS {quote_identifier(old.name + "." + PARENT_ID_COLUMN)}')
+    return statements
+
+
+def _drop_table(table: TableSchema) -> str:
+    return f'DROP TABLE IF EXISTS {quote_identifier(table.name)}'
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _file_key(file: FileDescriptor) -> str:
+    # hash of a proto file and of the files it depends on
+    digest = hashlib.sha256(file.serialized_pb)
+    for dependency in file.dependencies:
+        digest.update(_file_key(dependency).encode())
+    return digest.hexdigest()
+
+
+def _file_messages(file: FileDescriptor) -> Iterator[Descriptor]:
+    pending = list(file.message_types_by_name.values())
+    while pending:
+        message = pending.pop()
+        yield message
+        pending.extend(message.nested_types)
+# endregion
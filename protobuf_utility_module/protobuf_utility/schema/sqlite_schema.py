@@ -0,0 +1,270 @@
+from functools import lru_cache
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+from google.protobuf.descriptor import Descriptor, FieldDescriptor
+
+from protobuf_utility.transforms.list_transformer import PLAN_CACHE_SIZE
+from protobuf_utility.transforms.list_transformer import STEP_MESSAGE_MAP
+from protobuf_utility.transforms.list_transformer import STEP_NESTED_MESSAGE
+from protobuf_utility.transforms.list_transformer import STEP_REPEATED_MESSAGE
+from protobuf_utility.transforms.list_transformer import STEP_REPEATED_SCALAR
+from protobuf_utility.transforms.list_transformer import STEP_SCALAR
+from protobuf_utility.transforms.list_transformer import get_flatten_plan
+
+
+# Kinds of tables, the message table of a descriptor and the child tables of its repeated and
+# map fields.
+TABLE_MESSAGE = 'message'
+TABLE_REPEATED = 'repeated'
+TABLE_MAP = 'map'
+
+# Columns every table or child table has in addition to the field columns.
+ID_COLUMN = '_id'
+PARENT_ID_COLUMN = '_parent_id'
+INDEX_COLUMN = '_index'
+KEY_COLUMN = '_key'
+VALUE_COLUMN = 'value'
+
+_INTEGER = 'INTEGER'
+_SQL_TYPES = {
+    FieldDescriptor.CPPTYPE_INT32: _INTEGER,
+    FieldDescriptor.CPPTYPE_INT64: _INTEGER,
+    FieldDescriptor.CPPTYPE_UINT32: _INTEGER,
+    FieldDescriptor.CPPTYPE_UINT64: _INTEGER,
+    FieldDescriptor.CPPTYPE_DOUBLE: 'REAL',
+    FieldDescriptor.CPPTYPE_FLOAT: 'REAL',
+    FieldDescriptor.CPPTYPE_BOOL: _INTEGER,
+    FieldDescriptor.CPPTYPE_ENUM: _INTEGER,
+    FieldDescriptor.CPPTYPE_MESSAGE: 'BLOB',
+}
+
+
+class ColumnSchema(NamedTuple):
+    """A column of a table generated from a protobuf descriptor.
+    Attributes:
+        name (str): column name, the dotted attribute path of the field in the table's message.
+        sql_type (str): SQLite type of the column.
+        path (Optional[Tuple[str, ...]]): names of the fields leading from the table's message to
+            the value, empty when the value is the element of a repeated or map field itself and
+            None for the _id, _parent_id, _index and _key columns.
+        field (Optional[FieldDescriptor]): field holding the value. Messages that recurse into a
+            message type already being flattened are stored serialized in a BLOB column.
+    """
+    name: str
+    sql_type: str
+    path: Optional[Tuple[str, ...]]
+    field: Optional[FieldDescriptor]
+
+
+class TableSchema(NamedTuple):
+    """A table generated from a protobuf descriptor.
+    Attributes:
+        name (str): table name, the full name of the message for message tables and the name of
+            the parent table and the attribute path of the field for child tables.
+        kind (str): TABLE_MESSAGE, TABLE_REPEATED or TABLE_MAP.
+        descriptor (Optional[Descriptor]): message stored in each row, None when the rows hold
+            scalars.
+        parent (Optional[str]): name of the parent table of a child table.
+        path (Tuple[str, ...]): names of the fields leading from the parent table's message to
+            the repeated or map field of a child table.
+        field (Optional[FieldDescriptor]): repeated or map field of a child table.
+        columns (Tuple[ColumnSchema, ...]): columns of the table, starting with _id.
+    """
+    name: str
+    kind: str
+    descriptor: Optional[Descriptor]
+    parent: Optional[str]
+    path: Tuple[str, ...]
+    field: Optional[FieldDescriptor]
+    columns: Tuple[ColumnSchema, ...]
+
+
+# region Public Methods
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def get_table_schemas(descriptor: Descriptor) -> Tuple[TableSchema, ...]:
+    """Gets the tables storing a protobuf message. Scalars and singular nested messages become
+    columns of the message table named like the attributes of flatten_proto_to_list. Repeated
+    and map fields become child tables with a foreign key to the row holding the field and the
+    position (_index) or key (_key) of each element. Child tables are normalized the same way so
+    repeated fields of repeated messages become grandchild tables.
+    Args:
+        descriptor (Descriptor): DESCRIPTOR of the protobuf message.
+    Returns:
+        Tuple[TableSchema, ...]: the message table followed by its child tables, every table
+            comes before its children.
+    """
+    tables: List[TableSchema] = []
+    _add_table(
+        tables, descriptor.full_name, TABLE_MESSAGE, descriptor, None, (), None, None, None, ())
+    return tuple(tables)
+
+
+def create_table_statement(table: TableSchema) -> str:
+    """Generates the CREATE TABLE statement of a table.
+    Args:
+        table (TableSchema): table to create.
+    Returns:
+        str: SQLite statement.
+    """
+    lines = []
+    for column in table.columns:
+        line = f'{quote_identifier(column.name)} {column.sql_type}'
+        if column.name == ID_COLUMN and column.path is None:
+            line += ' PRIMARY KEY'
+        elif column.name == PARENT_ID_COLUMN and column.path is None:
+            line += (f' NOT NULL REFERENCES {quote_identifier(table.parent)}'
+                     f'({quote_identifier(ID_COLUMN)}) ON DELETE CASCADE')
+        elif column.path is None:
+            line += ' NOT NULL'
+        lines.append(line)
+    columns = ',\n    '.join(lines)
+    return f'CREATE TABLE IF NOT EXISTS {quote_identifier(table.name)} (\n    {columns}\n)'
+
+
+def create_index_statements(table: TableSchema) -> List[str]:
+    """Generates the CREATE INDEX statements of a table. Child tables are indexed by parent row
+    and position or key so the elements of a row are found without a table scan.
+    Args:
+        table (TableSchema): indexed table.
+    Returns:
+        List[str]: SQLite statements.
+    """
+    if table.kind == TABLE_MESSAGE:
+        return []
+    position = INDEX_COLUMN if table.kind == TABLE_REPEATED else KEY_COLUMN
+    return [
+        f'CREATE INDEX IF NOT EXISTS {quote_identifier(table.name + "." + PARENT_ID_COLUMN)} '
+        f'ON {quote_identifier(table.name)} '
+        f'({quote_identifier(PARENT_ID_COLUMN)}, {quote_identifier(position)})'
+    ]
+
+
+def generate_sqlite_ddl(descriptors: Iterable[Descriptor]) -> Tuple[List[str], List[str]]:
+    """Generates the DDL of the tables storing protobuf messages. Indexes are returned separately
+    so they can be created after bulk loading the tables.
+    Args:
+        descriptors (Iterable[Descriptor]): DESCRIPTOR of each protobuf message to store.
+    Returns:
+        Tuple[List[str], List[str]]: CREATE TABLE and CREATE INDEX statements.
+    """
+    table_statements = []
+    index_statements = []
+    for descriptor in dict.fromkeys(descriptors):
+        for table in get_table_schemas(descriptor):
+            table_statements.append(create_table_statement(table))
+            index_statements.extend(create_index_statements(table))
+    return table_statements, index_statements
+
+
+def generate_sqlite_script(descriptors: Iterable[Descriptor]) -> str:
+    """Generates a SQL script creating the tables and indexes storing protobuf messages.
+    Args:
+        descriptors (Iterable[Descriptor]): DESCRIPTOR of each protobuf message to store.
+    Returns:
+        str: SQLite script.
+    """
+    table_statements, index_statements = generate_sqlite_ddl(descriptors)
+    return ''.join(f'{statement};\n' for statement in table_statements + index_statements)
+
+
+def quote_identifier(name: str) -> str:
+    """Quotes a table or column name, names contain dots so they are always quoted.
+    Args:
+        name (str): identifier to quote.
+    Returns:
+        str: quoted identifier.
+    """
+    return '"' + name.replace('"', '""') + '"'
+# endregion
+
+
+# region Private Methods
+def _add_table(
+        tables: List[TableSchema],
+        name: str,
+        kind: str,
+        descriptor: Optional[Descriptor],
+        parent: Optional[str],
+        path: Tuple[str, ...],
+        field: Optional[FieldDescriptor],
+        key_field: Optional[FieldDescriptor],
+        element_field: Optional[FieldDescriptor],
+        ancestors: Tuple[str, ...]) -> None:
+    # adds a table followed by its child tables
+    columns = [ColumnSchema(ID_COLUMN, _INTEGER, None, None)]
+    if parent is not None:
+        columns.append(ColumnSchema(PARENT_ID_COLUMN, _INTEGER, None, None))
+    if kind == TABLE_REPEATED:
+        columns.append(ColumnSchema(INDEX_COLUMN, _INTEGER, None, None))
+    elif kind == TABLE_MAP:
+        columns.append(ColumnSchema(KEY_COLUMN, _sql_type(key_field), None, None))
+
+    children: List[tuple] = []
+    if descriptor is None or descriptor.full_name in ancestors:
+        # scalar elements and recursive messages are stored in a single column
+        columns.append(ColumnSchema(VALUE_COLUMN, _sql_type(element_field), (), element_field))
+        descriptor = None
+    else:
+        _add_columns(columns, children, descriptor, (), ancestors + (descriptor.full_name,))
+
+    names = [column.name for column in columns]
+    if len(set(names)) != len(names):
+        raise ValueError(f'Column names of table {name} collide: {names}')
+    tables.append(TableSchema(name, kind, descriptor, parent, path, field, tuple(columns)))
+    for child_kind, child_descriptor, child_path, *child_fields, child_ancestors in children:
+        _add_table(
+            tables,
+            f'{name}.{".".join(child_path)}',
+            child_kind,
+            child_descriptor,
+            name,
+            child_path,
+            *child_fields,
+            child_ancestors)
+
+
+def _add_columns(
+        columns: List[ColumnSchema],
+        children: List[tuple],
+        descriptor: Descriptor,
+        path: Tuple[str, ...],
+        ancestors: Tuple[str, ...]) -> None:
+    # adds the columns of a message and collects the child tables of its repeated and map fields
+    # as (kind, descriptor, path, field, key field, element field, ancestors)
+    for step in get_flatten_plan(descriptor):
+        field = step.field
+        field_path = path + (step.name,)
+        kind = step.kind
+        if kind == STEP_SCALAR:
+            columns.append(ColumnSchema('.'.join(field_path), _sql_type(field), field_path, field))
+        elif kind == STEP_NESTED_MESSAGE:
+            if step.message_type.full_name in ancestors:
+                columns.append(
+                    ColumnSchema('.'.join(field_path), _sql_type(field), field_path, field))
+            else:
+                _add_columns(
+                    columns,
+                    children,
+                    step.message_type,
+                    field_path,
+                    ancestors + (step.message_type.full_name,))
+        elif kind in (STEP_REPEATED_SCALAR, STEP_REPEATED_MESSAGE):
+            children.append(
+                (TABLE_REPEATED, step.message_type, field_path, field, None, field, ancestors))
+        else:
+            entry_fields = field.message_type.fields_by_name
+            children.append((
+                TABLE_MAP,
+                step.message_type if kind == STEP_MESSAGE_MAP else None,
+                field_path,
+                field,
+                entry_fields['key'],
+                entry_fields['value'],
+                ancestors))
+
+
+def _sql_type(field: FieldDescriptor) -> str:
+    if field.cpp_type == FieldDescriptor.CPPTYPE_STRING:
+        return 'BLOB' if field.type == FieldDescriptor.TYPE_BYTES else 'TEXT'
+    return _SQL_TYPES[field.cpp_type]
+# endregion
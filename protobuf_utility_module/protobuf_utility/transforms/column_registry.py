@@ -0,0 +1,62 @@
+from typing import Dict, Iterable, List
+
+
+class ColumnRegistry:
+    """Tracks the columns of a stream of flattened protobuf objects. Each attribute path is
+    assigned a stable integer slot the first time it is seen and the registry keeps a row buffer
+    with one entry per slot. Filling a row only resets the slots the previous row touched, so the
+    cost of a row scales with the attributes it contains rather than with the number of columns
+    seen so far.
+    Attributes:
+        names (List[str]): attribute path of each slot in slot order.
+        slots (Dict[str, int]): slot assigned to each attribute path.
+        row (List[str]): current row buffer, one string per slot with '' for missing attributes.
+    """
+
+    def __init__(self) -> None:
+        self.names: List[str] = []
+        self.slots: Dict[str, int] = {}
+        self.row: List[str] = []
+        self._touched: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, attr: str) -> int:
+        """Registers an attribute path and returns its slot. Registering an existing attribute
+        path returns the slot it already has.
+        Args:
+            attr (str): attribute path to register.
+        Returns:
+            int: slot of the attribute path.
+        """
+        slot = self.slots.get(attr)
+        if slot is None:
+            slot = self.slots[attr] = len(self.names)
+            self.names.append(attr)
+            self.row.append('')
+        return slot
+
+    def fill_row(self, attrs: Iterable[str], values: Iterable) -> List[str]:
+        """Fills the row buffer with a flattened object. Values are converted to strings and any
+        attribute path that has not been seen before is registered as a new column.
+        Args:
+            attrs (Iterable[str]): attribute paths of the object.
+            values (Iterable): values matching the attribute paths.
+        Returns:
+            List[str]: the row buffer. It is reused by the next call so it must be consumed
+                before filling the next row.
+        """
+        row = self.row
+        slots = self.slots
+        for slot in self._touched:
+            row[slot] = ''
+        touched = []
+        for attr, value in zip(attrs, values):
+            slot = slots.get(attr)
+            if slot is None:
+                slot = self.add(attr)
+            row[slot] = str(value)
+            touched.append(slot)
+        self._touched = touched
+        return row
@@ -0,0 +1,566 @@
+from array import array
+from itertools import compress, groupby, repeat
+import json
+import os
+from pathlib import Path
+import struct
+import sys
+import tempfile
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from google.protobuf.any_pb2 import Any as ProtoAny
+
+from protobuf_utility.logger.segment import decode_varint
+from protobuf_utility.logger.segment import encode_varint
+from protobuf_utility.transforms.list_transformer import finish_column
+from protobuf_utility.transforms.list_transformer import flatten_protos_to_columns
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# File layout:
+#   header:     MAGIC, u8 version
+#   row groups: the column chunks of each row group one after the other
+#   footer:     utf-8 JSON with the type name, the row count, the type of every column and the
+#               offset, length, encoding, counts and min/max statistics of every column chunk
+#   trailer:    u64 footer offset, MAGIC
+# A column chunk starts with the validity of its rows as a varint run count and u32 run lengths
+# alternating between missing and present rows, starting with missing. Only the present values
+# follow, so the sparse columns of repeated and map fields take a few bytes per row group.
+# Values are stored with one of the ENCODING_* encodings:
+#   plain:       numerics as a packed little-endian array, strings and bytes as u32 lengths
+#                followed by the concatenated data
+#   dictionary:  varint dictionary size, the dictionary values (plain) and u8 or u16 indices
+#   rle:         varint run count, the value of each run (plain) and u32 run lengths
+MAGIC = b'PBCF'
+VERSION = 1
+
+# Suffix of the files written by flatten_mixed_proto_stream_to_columnar.
+COLUMNAR_SUFFIX = '.pbcol'
+
+# Number of protobuf objects flattened and written together as a row group.
+DEFAULT_ROW_GROUP_SIZE = 1 << 16
+
+ENCODING_PLAIN = 'plain'
+ENCODING_DICTIONARY = 'dictionary'
+ENCODING_RLE = 'rle'
+
+# Column types besides the array typecodes used by flatten_protos_to_columns.
+_TYPE_STR = 'str'
+_TYPE_BYTES = 'bytes'
+_FLOAT_TYPECODES = ('f', 'd')
+_MAX_DICTIONARY_SIZE = 1 << 16
+
+_TRAILER = struct.Struct('<Q4s')
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+_ARROW_TYPES = {} if pyarrow is None else {
+    'i': pyarrow.int32(),
+    'q': pyarrow.int64(),
+    'I': pyarrow.uint32(),
+    'Q': pyarrow.uint64(),
+    'd': pyarrow.float64(),
+    'f': pyarrow.float32(),
+    'b': pyarrow.bool_(),
+    _TYPE_STR: pyarrow.string(),
+    _TYPE_BYTES: pyarrow.binary(),
+}
+
+
+class ColumnChunk(NamedTuple):
+    """The values of a column in a row group of a columnar file.
+    Attributes:
+        offset (int): offset of the chunk in the file.
+        length (int): size of the chunk in bytes.
+        encoding (str): ENCODING_PLAIN, ENCODING_DICTIONARY or ENCODING_RLE.
+        value_count (int): number of rows holding a value.
+        null_count (int): number of rows missing the attribute.
+        min (Any): smallest value of the chunk.
+        max (Any): largest value of the chunk.
+    """
+    offset: int
+    length: int
+    encoding: str
+    value_count: int
+    null_count: int
+    min: Any
+    max: Any
+
+
+class RowGroup(NamedTuple):
+    """A row group of a columnar file.
+    Attributes:
+        row_count (int): number of rows of the row group.
+        chunks (Dict[str, ColumnChunk]): chunk of each column that has a value in the row group,
+            rows of the other columns are all missing.
+    """
+    row_count: int
+    chunks: Dict[str, ColumnChunk]
+
+
+class ColumnarWriter:
+    """Writes protobuf objects of the same type to a columnar file. Objects are buffered until
+    row_group_size of them are flattened at once with flatten_protos_to_columns and each column
+    of the row group is written with the smallest fitting encoding: run lengths for columns made
+    of long runs, a dictionary for columns with few distinct values and packed arrays otherwise.
+    Args:
+        path (Path): file to create.
+        row_group_size (int): number of objects written together as a row group.
+        projection (Optional[Iterable[str]]): attribute path patterns to keep, all when None. See
+            flatten_proto_to_list for the pattern syntax.
+    """
+
+    def __init__(
+            self,
+            path: Path,
+            row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+            projection: Optional[Iterable[str]] = None) -> None:
+        self.path = Path(path)
+        self.row_group_size = row_group_size
+        self.projection = None if projection is None else tuple(projection)
+        self.type_name: Optional[str] = None
+        self.row_count = 0
+        self.column_types: Dict[str, str] = {}
+        self.row_groups: List[RowGroup] = []
+        self._objs: List[ProtoAny] = []
+        self._file = open(self.path, 'wb')
+        self._file.write(MAGIC + bytes((VERSION,)))
+        self._offset = len(MAGIC) + 1
+
+    def __enter__(self) -> 'ColumnarWriter':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def write(self, obj: ProtoAny) -> None:
+        """Adds a protobuf object to the current row group.
+        Args:
+            obj (ProtoAny): protobuf object, of the same type as the previous ones.
+        """
+        if self.type_name is None:
+            self.type_name = obj.DESCRIPTOR.full_name
+        elif obj.DESCRIPTOR.full_name != self.type_name:
+            raise ValueError(
+                f'Cannot write {obj.DESCRIPTOR.full_name} to a columnar file of {self.type_name}')
+        self._objs.append(obj)
+        if len(self._objs) >= self.row_group_size:
+            self._write_row_group()
+
+    def close(self) -> None:
+        """Writes the buffered objects, the footer and closes the file."""
+        if self._file.closed:
+            return
+        self._write_row_group()
+        metadata = {
+            'type_name': self.type_name,
+            'row_count': self.row_count,
+            'columns': self.column_types,
+            'row_groups': [
+                {
+                    'row_count': row_group.row_count,
+                    'chunks': {
+                        name: _encode_statistics(self.column_types[name], chunk)
+                        for name, chunk in row_group.chunks.items()
+                    },
+                }
+                for row_group in self.row_groups
+            ],
+        }
+        self._file.write(json.dumps(metadata).encode())
+        self._file.write(_TRAILER.pack(self._offset, MAGIC))
+        self._file.close()
+
+    def _write_row_group(self) -> None:
+        if not self._objs:
+            return
+        data, validity = flatten_protos_to_columns(self._objs, self.projection)
+        row_count = len(self._objs)
+        self._objs = []
+        chunks = {}
+        for name, values in data.items():
+            column_type = self.column_types.get(name)
+            if column_type is None:
+                column_type = self.column_types[name] = _column_type(values)
+            chunk, encoded = _encode_chunk(
+                column_type, _to_list(values), _to_list(validity[name]), self._offset)
+            self._file.write(encoded)
+            self._offset += len(encoded)
+            chunks[name] = chunk
+        self.row_groups.append(RowGroup(row_count, chunks))
+        self.row_count += row_count
+
+
+class ColumnarReader:
+    """Reads the columns of a file written by ColumnarWriter. Only the chunks of the selected
+    columns and row groups are read and decoded.
+    Args:
+        path (Path): columnar file to read.
+    Attributes:
+        type_name (str): DESCRIPTOR.full_name of the objects stored in the file.
+        row_count (int): number of objects stored in the file.
+        columns (Dict[str, str]): type of each column, an array typecode, 'str' or 'bytes'.
+        row_groups (List[RowGroup]): row groups with the statistics of their chunks.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < len(MAGIC) + 1 + _TRAILER.size or self._file.read(len(MAGIC)) != MAGIC:
+            self._file.close()
+            raise ValueError(f'{self.path} is not a columnar file')
+        self.version = self._file.read(1)[0]
+        self._file.seek(size - _TRAILER.size)
+        footer_offset, magic = _TRAILER.unpack(self._file.read(_TRAILER.size))
+        if magic != MAGIC:
+            self._file.close()
+            raise ValueError(f'{self.path} is not a complete columnar file')
+        self._file.seek(footer_offset)
+        metadata = json.loads(self._file.read(size - _TRAILER.size - footer_offset))
+        self.type_name: str = metadata['type_name']
+        self.row_count: int = metadata['row_count']
+        self.columns: Dict[str, str] = metadata['columns']
+        self.row_groups = [
+            RowGroup(row_group['row_count'], {
+                name: _decode_statistics(self.columns[name], chunk)
+                for name, chunk in row_group['chunks'].items()
+            })
+            for row_group in metadata['row_groups']
+        ]
+
+    def __enter__(self) -> 'ColumnarReader':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def read(
+            self,
+            columns: Optional[Iterable[str]] = None,
+            row_groups: Optional[Iterable[int]] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Reads columns in the format returned by flatten_protos_to_columns.
+        Args:
+            columns (Optional[Iterable[str]]): attribute paths of the columns to read, all when
+                None.
+            row_groups (Optional[Iterable[int]]): positions of the row groups to read, all when
+                None. The statistics in row_groups can be used to skip row groups.
+        Returns:
+            Tuple[Dict[str, Any], Dict[str, Any]]: columns and validity masks keyed by attribute
+                path.
+        """
+        names = list(self.columns) if columns is None else list(dict.fromkeys(columns))
+        unknown = [name for name in names if name not in self.columns]
+        if unknown:
+            raise ValueError(f'{self.path} has no columns {unknown}')
+        groups = (
+            self.row_groups if row_groups is None
+            else [self.row_groups[position] for position in row_groups])
+
+        data = {}
+        validity = {}
+        for name in names:
+            column_type = self.columns[name]
+            column = _new_column(column_type)
+            for row_group in groups:
+                chunk = row_group.chunks.get(name)
+                if chunk is None:
+                    column[0].extend(repeat(column[2], row_group.row_count))
+                    column[1].frombytes(bytes(row_group.row_count))
+                    continue
+                self._file.seek(chunk.offset)
+                _decode_chunk(column_type, chunk, self._file.read(chunk.length), column)
+            data[name], validity[name] = finish_column(column)
+        return data, validity
+
+    def close(self) -> None:
+        """Closes the file."""
+        self._file.close()
+
+
+# region Public Methods
+def flatten_same_proto_stream_to_columnar(
+        objs: Iterable[ProtoAny],
+        file_path: Path,
+        projection: Optional[Iterable[str]] = None,
+        row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+        backend: str = 'native') -> Path:
+    """Writes a stream of protobuf objects of the same type to a columnar file. Unlike csv the
+    values keep their types, missing attributes take no space and the columns can be read back
+    selectively.
+    Args:
+        objs (Iterable[ProtoAny]): iterable of same type protobuf objects.
+        file_path (Path): file to write.
+        projection (Optional[Iterable[str]]): attribute path patterns to keep, all when None. See
+            flatten_proto_to_list for the pattern syntax.
+        row_group_size (int): number of objects written together as a row group.
+        backend (str): 'native' for the format of ColumnarWriter or 'parquet' (requires pyarrow)
+            for a Parquet file with dictionary encoding and statistics. The parquet backend
+            first writes a native file next to file_path and converts it one row group at a time.
+    Returns:
+        Path: path to the written file.
+    """
+    if backend == 'parquet':
+        return _write_parquet(objs, Path(file_path), projection, row_group_size)
+    if backend != 'native':
+        raise ValueError(f"Unknown columnar backend {backend!r}, expected 'native' or 'parquet'")
+    with ColumnarWriter(file_path, row_group_size, projection) as writer:
+        for obj in objs:
+            writer.write(obj)
+    return writer.path
+
+
+def flatten_mixed_proto_stream_to_columnar(
+        objs: Iterable[ProtoAny],
+        output_dir: Path,
+        projection: Optional[Iterable[str]] = None,
+        row_group_size: int = DEFAULT_ROW_GROUP_SIZE) -> Dict[str, Path]:
+    """Writes a stream of protobuf objects to one columnar file per object type.
+    Args:
+        objs (Iterable[ProtoAny]): iterable of protobuf objects.
+        output_dir (Path): directory to write one file per object type to.
+        projection (Optional[Iterable[str]]): attribute path patterns to keep for every type, all
+            when None. See flatten_proto_to_list for the pattern syntax.
+        row_group_size (int): number of objects of a type written together as a row group.
+    Returns:
+        Dict[str, Path]: path of the file of each type.
+    """
+    writers: Dict[str, ColumnarWriter] = {}
+    try:
+        for obj in objs:
+            type_name = obj.DESCRIPTOR.full_name
+            writer = writers.get(type_name)
+            if writer is None:
+                writer = writers[type_name] = ColumnarWriter(
+                    Path(output_dir) / f'{type_name}{COLUMNAR_SUFFIX}', row_group_size, projection)
+            writer.write(obj)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return {type_name: writer.path for type_name, writer in writers.items()}
+
+
+def read_columnar(
+        file_path: Path,
+        columns: Optional[Iterable[str]] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Reads columns of a file written by flatten_same_proto_stream_to_columnar.
+    Args:
+        file_path (Path): columnar file to read.
+        columns (Optional[Iterable[str]]): attribute paths of the columns to read, all when None.
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, Any]]: columns and validity masks keyed by attribute
+            path, see flatten_protos_to_columns.
+    """
+    with ColumnarReader(file_path) as reader:
+        return reader.read(columns)
+# endregion
+
+
+# region Private Methods
+def _column_type(values: Any) -> str:
+    # array typecode of a numeric column or the type of the values of an object column
+    if isinstance(values, array):
+        return values.typecode
+    if numpy is not None and isinstance(values, numpy.ndarray) and values.dtype.kind != 'O':
+        if values.dtype.kind == 'b':
+            return 'b'
+        return {'i': 'iq', 'u': 'IQ', 'f': 'fd'}[values.dtype.kind][values.dtype.itemsize // 8]
+    present = next(value for value in values if value is not None)
+    return _TYPE_BYTES if isinstance(present, bytes) else _TYPE_STR
+
+
+def _to_list(values: Any) -> List:
+    # columns are lists, arrays or numpy arrays
+    return values if isinstance(values, list) else values.tolist()
+
+
+def _new_column(column_type: str) -> List:
+    # a column is [values, validity mask, value used for missing rows] like in list_transformer
+    if column_type in (_TYPE_STR, _TYPE_BYTES):
+        return [[], array('b'), None]
+    return [array(column_type), array('b'), 0]
+
+
+def _encode_chunk(
+        column_type: str, values: List, mask: List, offset: int) -> Tuple[ColumnChunk, bytes]:
+    # validity runs followed by the present values in the smallest fitting encoding
+    runs = [len(list(run)) for _, run in groupby(mask)]
+    if mask[0]:
+        runs.insert(0, 0)
+    null_count = sum(runs[0::2])
+    if null_count:
+        values = list(compress(values, mask))
+    encoded = bytearray(encode_varint(len(runs)))
+    encoded += _pack('I', runs)
+
+    encoding = ENCODING_PLAIN
+    if column_type not in _FLOAT_TYPECODES:
+        # floats are kept plain, grouping would merge 0.0 with -0.0
+        value_runs = [(value, len(list(run))) for value, run in groupby(values)]
+        if len(value_runs) * 4 <= len(values):
+            encoding = ENCODING_RLE
+            encoded += encode_varint(len(value_runs))
+            encoded += _encode_plain(column_type, [value for value, _ in value_runs])
+            encoded += _pack('I', [length for _, length in value_runs])
+        else:
+            dictionary = dict.fromkeys(values)
+            if len(dictionary) * 2 <= len(values) and len(dictionary) <= _MAX_DICTIONARY_SIZE:
+                encoding = ENCODING_DICTIONARY
+                for position, value in enumerate(dictionary):
+                    dictionary[value] = position
+                encoded += encode_varint(len(dictionary))
+                encoded += _encode_plain(column_type, list(dictionary))
+                encoded += _pack(
+                    'B' if len(dictionary) <= 256 else 'H', [dictionary[value] for value in values])
+    if encoding == ENCODING_PLAIN:
+        encoded += _encode_plain(column_type, values)
+
+    chunk = ColumnChunk(
+        offset,
+        len(encoded),
+        encoding,
+        len(values),
+        null_count,
+        min(values) if values else None,
+        max(values) if values else None)
+    return chunk, bytes(encoded)
+
+
+def _decode_chunk(column_type: str, chunk: ColumnChunk, buf: bytes, column: List) -> None:
+    # appends the rows of a chunk to a column
+    run_count, pos = decode_varint(buf, 0)
+    runs, pos = _unpack('I', buf, pos, run_count)
+    count = chunk.value_count
+    if chunk.encoding == ENCODING_RLE:
+        run_count, pos = decode_varint(buf, pos)
+        run_values, pos = _decode_plain(column_type, buf, pos, run_count)
+        lengths, pos = _unpack('I', buf, pos, run_count)
+        values = _new_column(column_type)[0]
+        for value, length in zip(run_values, lengths):
+            values.extend(repeat(value, length))
+    elif chunk.encoding == ENCODING_DICTIONARY:
+        size, pos = decode_varint(buf, pos)
+        dictionary, pos = _decode_plain(column_type, buf, pos, size)
+        indexes, pos = _unpack('B' if size <= 256 else 'H', buf, pos, count)
+        values = _new_column(column_type)[0]
+        values.extend([dictionary[index] for index in indexes])
+    else:
+        values, pos = _decode_plain(column_type, buf, pos, count)
+
+    data, mask, missing = column
+    if not chunk.null_count:
+        data.extend(values)
+        mask.frombytes(b'\x01' * count)
+        return
+    start = 0
+    for position, run in enumerate(runs):
+        if position % 2:
+            data.extend(values[start:start + run])
+            mask.frombytes(b'\x01' * run)
+            start += run
+        else:
+            data.extend(repeat(missing, run))
+            mask.frombytes(bytes(run))
+
+
+def _encode_plain(column_type: str, values: List) -> bytes:
+    if column_type == _TYPE_STR:
+        values = [value.encode() for value in values]
+    elif column_type != _TYPE_BYTES:
+        return _pack(column_type, values)
+    return _pack('I', [len(value) for value in values]) + b''.join(values)
+
+
+def _decode_plain(column_type: str, buf: bytes, pos: int, count: int) -> Tuple[Any, int]:
+    if column_type not in (_TYPE_STR, _TYPE_BYTES):
+        return _unpack(column_type, buf, pos, count)
+    lengths, pos = _unpack('I', buf, pos, count)
+    values = []
+    for length in lengths:
+        values.append(buf[pos:pos + length])
+        pos += length
+    if column_type == _TYPE_STR:
+        values = [value.decode() for value in values]
+    return values, pos
+
+
+def _pack(typecode: str, values: Iterable) -> bytes:
+    # packed little-endian array
+    packed = array(typecode, values)
+    if _BIG_ENDIAN:
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _unpack(typecode: str, buf: bytes, pos: int, count: int) -> Tuple[array, int]:
+    values = array(typecode)
+    end = pos + count * values.itemsize
+    values.frombytes(buf[pos:end])
+    if _BIG_ENDIAN:
+        values.byteswap()
+    return values, end
+
+
+def _encode_statistics(column_type: str, chunk: ColumnChunk) -> dict:
+    statistics = chunk._asdict()
+    if column_type == _TYPE_BYTES and chunk.value_count:
+        statistics['min'] = chunk.min.hex()
+        statistics['max'] = chunk.max.hex()
+    return statistics
+
+
+def _decode_statistics(column_type: str, statistics: dict) -> ColumnChunk:
+    chunk = ColumnChunk(**statistics)
+    if column_type == _TYPE_BYTES and chunk.value_count:
+        chunk = chunk._replace(min=bytes.fromhex(chunk.min), max=bytes.fromhex(chunk.max))
+    return chunk
+
+
+def _write_parquet(
+        objs: Iterable[ProtoAny],
+        file_path: Path,
+        projection: Optional[Iterable[str]],
+        row_group_size: int) -> Path:
+    # a Parquet file needs its schema up front but columns can first appear in a later row group,
+    # so the row groups are spilled to a native file next to the output and converted one at a
+    # time once the spill knows every column, only one row group is held in memory
+    if pyarrow is None:
+        raise ValueError('The parquet backend requires the pyarrow package')
+    spill_fd, spill_name = tempfile.mkstemp(suffix=COLUMNAR_SUFFIX, dir=file_path.parent)
+    os.close(spill_fd)
+    try:
+        with ColumnarWriter(spill_name, row_group_size, projection) as spill:
+            for obj in objs:
+                spill.write(obj)
+        with ColumnarReader(spill_name) as reader:
+            schema = pyarrow.schema(
+                [(name, _ARROW_TYPES[column_type]) for name, column_type in reader.columns.items()])
+            with pyarrow.parquet.ParquetWriter(
+                    str(file_path), schema, use_dictionary=True, write_statistics=True) as writer:
+                for position in range(len(reader.row_groups)):
+                    data, validity = reader.read(row_groups=(position,))
+                    writer.write_table(pyarrow.table(
+                        [
+                            pyarrow.array(
+                                [
+                                    value if present else None
+                                    for value, present in zip(
+                                        _to_list(data[name]), _to_list(validity[name]))
+                                ],
+                                type=field.type)
+                            for name, field in zip(schema.names, schema)
+                        ],
+                        schema=schema))
+    finally:
+        os.remove(spill_name)
+    return file_path
+# endregion
@@ -1,25 +1,52 @@
-from io import TextIOWrapper
-from collections import OrderedDict
+import io
+import multiprocessing
+import os
 from pathlib import Path
+import queue
 import tempfile
-from typing import Any, Iterator, Tuple, Dict
+import time
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, List, Optional, Tuple, Dict
 
 from google.protobuf.any_pb2 import Any as ProtoAny
 
+from protobuf_utility.logger.rotation import DEFAULT_PREFIX
+from protobuf_utility.logger.rotation import read_segment_messages
+from protobuf_utility.transforms.column_registry import ColumnRegistry
+from protobuf_utility.transforms.file_handle_pool import DEFAULT_MAX_OPEN_FILES
+from protobuf_utility.transforms.file_handle_pool import FileHandlePool
 from protobuf_utility.transforms.list_transformer import flatten_proto_to_list
+from protobuf_utility.transforms.metrics import COUNTER_BYTES
+from protobuf_utility.transforms.metrics import COUNTER_ROWS
+from protobuf_utility.transforms.metrics import COUNTER_SCHEMA_WIDENINGS
+from protobuf_utility.transforms.metrics import GAUGE_COLUMNS
+from protobuf_utility.transforms.metrics import STAGE_FLATTEN
+from protobuf_utility.transforms.metrics import STAGE_POST_PROCESS
+from protobuf_utility.transforms.metrics import STAGE_STRINGIFY
+from protobuf_utility.transforms.metrics import STAGE_WRITE
+from protobuf_utility.transforms.metrics import get_metrics
+
+
+# Size of the chunks used when copying rows from the temporary file to the final csv file.
+_COPY_CHUNK_SIZE = 1 << 20
+
+# Default number of bytes of rows a stream buffers in memory before spilling them to disk.
+DEFAULT_BUFFER_SIZE = 1 << 16
 
 
 # region Public Methods
-def flatten_proto_to_csv(obj: ProtoAny) -> Tuple[str, str]:
+def flatten_proto_to_csv(
+        obj: ProtoAny, projection: Optional[Iterable[str]] = None) -> Tuple[str, str]:
     """Flattens a protobuf object into csv lines. It uses the flatten proto to list method to
     get the provided object as a list of attributes and values, then joins those lists into a
     comma separated string.
     Args:
         obj (ProtoAny): protobuf object to convert to csv lines.
+        projection (Optional[Iterable[str]]): attribute path patterns to keep, all when None. See
+            flatten_proto_to_list for the pattern syntax.
     Returns:
         Tuple[str, str]: csv string of attributes and values.
     """
-    attrs, values = flatten_proto_to_list(obj)
+    attrs, values = flatten_proto_to_list(obj, projection)
 
     # convert bytes to hex string
     for idx, value in enumerate(values):
@@ -29,7 +56,8 @@ def flatten_proto_to_csv(obj: ProtoAny) -> Tuple[str, str]:
     return ','.join(attrs), ','.join(map(str, values))
 
 
-def flatten_same_proto_stream_to_csv(objs: Iterator, file_path: Path) -> Path:
+def flatten_same_proto_stream_to_csv(
+        objs: Iterator, file_path: Path, projection: Optional[Iterable[str]] = None) -> Path:
     """Writes a stream of protobuf objects of the same type to a file. It uses the protobuf to list
     method to get the provided objects attributes and values in a list format. The content for each
     list is converted to a string and joined with a comma separator. That is then written to a
@@ -38,97 +66,380 @@ def flatten_same_proto_stream_to_csv(objs: Iterator, file_path: Path) -> Path:
     Args:
         objs (Iterator): iterator of same type protobuf objects to convert to csv.
         file_path (Path): file path to write csv data to.
+        projection (Optional[Iterable[str]]): attribute path patterns to keep, all when None. See
+            flatten_proto_to_list for the pattern syntax.
     Returns:
         Path: path to file containing csv content.
     """
-    running_entry = OrderedDict()
-    temp_file_name = None
-
-    # write provided objects to temporary csv file
-    with tempfile.NamedTemporaryFile('w', delete=False) as csv_f:
-        temp_file_name = csv_f.name
+    handles = FileHandlePool(1)
+    stream = _CsvStream(handles, projection=projection)
+    try:
         for object in objs:
-            _proto_to_csv_file_helper(object, running_entry, csv_f)
-    return _post_process_csv(','.join(running_entry.keys()), temp_file_name, file_path)
+            stream.write(object)
+        return stream.finish(file_path)
+    finally:
+        stream.discard()
+        handles.close_all()
 
 
-def flatten_mixed_proto_stream_to_csv(objs: Iterator, output_dir: Path) -> bool:
+def flatten_mixed_proto_stream_to_csv(
+        objs: Iterator,
+        output_dir: Path,
+        workers: int = 1,
+        queue_depth: int = 64,
+        batch_size: int = 256,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        max_open_files: int = DEFAULT_MAX_OPEN_FILES,
+        spool_in_memory: bool = True,
+        projection: Optional[Iterable[str]] = None) -> bool:
     """Writes a stream of protobuf objects to a file. It uses the protobuf to list method to get
     the provided object's attributes and values in a list format. The content for each list is
     converted to a string and joined with a comma separator. That is then written to a file for
     this specific object type. This method does additional work to post process the files to
     handle dynamically changing message sizes due to list or dictionary fields.
+
+    With more than one worker the objects are serialized and routed by type to a pool of worker
+    processes. Every type is owned by a single worker so each type still produces exactly one
+    file. Each worker has a bounded queue, the producer blocks when a worker falls behind.
+
+    Rows of each type are buffered in memory and spilled to a temporary file once they exceed
+    buffer_size bytes. Temporary files are only kept open through a pool of at most
+    max_open_files handles so streams with hundreds of types do not run out of file descriptors.
     Args:
-        objs (Iterator): iterator of same type protobuf objects to convert to csv.
-        file_path (Path): file path to write csv data to.
+        objs (Iterator): iterator of protobuf objects to convert to csv.
+        output_dir (Path): directory to write one csv file per object type to.
+        workers (int): number of worker processes, 1 converts in the current process.
+        queue_depth (int): maximum number of batches waiting in each worker's queue.
+        batch_size (int): number of serialized objects sent to a worker at once.
+        buffer_size (int): bytes of rows each type buffers in memory before spilling to disk.
+        max_open_files (int): maximum number of temporary files open at once (per worker).
+        spool_in_memory (bool): write types that never exceeded buffer_size straight from memory
+            to their csv file without a temporary file.
+        projection (Optional[Iterable[str]]): attribute path patterns to keep for every type, all
+            when None. See flatten_proto_to_list for the pattern syntax.
     Returns:
         Path: path to file containing csv content.
     """
-    # Add helper items for tracking metadata for a specific stream type.
-    class StreamContext:
-        def __init__(self) -> None:
-            self.running_entry = OrderedDict()
-            self.temp_file = tempfile.NamedTemporaryFile('w', delete=False)
-            self.line_count = 0
-
-        def __del__(self) -> None:
-            self.temp_file.close()
-    stream_type_to_context: Dict[str, StreamContext] = {}
+    if projection is not None:
+        projection = tuple(projection)
+    stream_options = (buffer_size, max_open_files, spool_in_memory, projection)
+    if workers > 1:
+        return _flatten_mixed_proto_stream_in_workers(
+            objs, output_dir, workers, queue_depth, batch_size, stream_options)
 
     # iterate over provided data stream and handle each stream type in its own context
-    for obj in objs:
-        stream_type = obj.DESCRIPTOR.full_name
-        if stream_type in stream_type_to_context:
-            pass
-        else:
-            stream_type_to_context[stream_type] = StreamContext()
-        stream_type_to_context[stream_type].line_count += 1
-        if stream_type == 'N4':
-            print(stream_type_to_context[stream_type].temp_file.name)
-        _proto_to_csv_file_helper(
-            obj,
-            stream_type_to_context[stream_type].running_entry,
-            stream_type_to_context[stream_type].temp_file,
-        )
-
-    # add header to top of each data stream file
-    for stream_type, context in stream_type_to_context.items():
-        if stream_type == 'N4':
-            print(output_dir / f'{stream_type}.csv')
-        context.temp_file.close()
-        _post_process_csv(
-            ','.join(map(str, context.running_entry.keys())),
-            context.temp_file.name,
-            output_dir / f'{stream_type}.csv')
+    streams = _CsvStreamSet(*stream_options)
+    try:
+        for obj in objs:
+            streams.get(obj.DESCRIPTOR.full_name).write(obj)
+
+        # add header to top of each data stream file
+        streams.finish(output_dir)
+    finally:
+        streams.close()
+
+
+def flatten_log_to_csv(
+        log_dir: Path,
+        output_dir: Path,
+        type_names: Optional[Iterable[str]] = None,
+        start_timestamp: Optional[int] = None,
+        end_timestamp: Optional[int] = None,
+        prefix: str = DEFAULT_PREFIX,
+        message_classes: Optional[Dict[str, type]] = None,
+        **options: Any) -> None:
+    """Writes the logged protobufs of some types in a time range to one csv file per type. The
+    records are located with the type index of each segment so only the matching records are
+    read and parsed.
+    Args:
+        log_dir (Path): directory of segments written by RotatingSegmentWriter.
+        output_dir (Path): directory to write one csv file per object type to.
+        type_names (Optional[Iterable[str]]): DESCRIPTOR.full_name of the types to convert, every
+            type when None.
+        start_timestamp (Optional[int]): skip the records logged before this time in nanoseconds
+            since the epoch.
+        end_timestamp (Optional[int]): skip the records logged at or after this time in
+            nanoseconds since the epoch.
+        prefix (str): name of the segments before their sequence number.
+        message_classes (Optional[Dict[str, type]]): protobuf class of each type name. Types not
+            listed are looked up in the default symbol database.
+        options (Any): keyword arguments passed to flatten_mixed_proto_stream_to_csv.
+    """
+    objs = read_segment_messages(
+        log_dir, prefix, message_classes, start_timestamp, end_timestamp, type_names)
+    flatten_mixed_proto_stream_to_csv(objs, output_dir, **options)
+# endregion
+
+
+# region Private Classes
+class _CsvStream:
+    """Tracks the metadata for one stream of same type protobuf objects being written to csv.
+    Rows are buffered in memory and spilled to a temporary file once the buffer exceeds
+    buffer_size bytes. Each run of rows that share the same number of commas is recorded with its
+    byte offset so the final file can be produced by block copying the rows behind the header,
+    only padding the runs written before the header reached its final width.
+    While metrics are enabled every stage of the stream is timed and its rows, bytes, columns
+    and schema widenings are counted, otherwise writing a row only checks that they are not.
+    """
+
+    def __init__(
+            self,
+            handles: FileHandlePool,
+            buffer_size: int = DEFAULT_BUFFER_SIZE,
+            spool_in_memory: bool = True,
+            projection: Optional[Tuple[str, ...]] = None) -> None:
+        self.columns = ColumnRegistry()
+        self.handles = handles
+        self.buffer_size = buffer_size
+        self.spool_in_memory = spool_in_memory
+        self.projection = projection
+        self.buffer: List[bytes] = []
+        self.buffered_bytes = 0
+        self.temp_file_name: Optional[str] = None
+        self.line_count = 0
+        self.byte_count = 0
+        self.comma_runs: List[Tuple[int, int]] = []
+        self.metrics = get_metrics()
+        self.type_name = ''
+
+    def write(self, obj: Any) -> None:
+        metrics = self.metrics
+        columns = self.columns
+        if metrics is not None:
+            self.type_name = obj.DESCRIPTOR.full_name
+        attrs, values = self._timed(STAGE_FLATTEN, flatten_proto_to_list, obj, self.projection)
+        width = len(columns)
+        line = self._timed(STAGE_STRINGIFY, _to_csv_line, columns, attrs, values)
+        commas = line.count(',')
+        if not self.comma_runs or self.comma_runs[-1][1] != commas:
+            self.comma_runs.append((self.byte_count, commas))
+        data = f'{line}\n'.encode()
+        self.buffer.append(data)
+        self.buffered_bytes += len(data)
+        self.byte_count += len(data)
+        self.line_count += 1
+        if metrics is not None:
+            self._count_row(len(data), width)
+        if self.buffered_bytes >= self.buffer_size:
+            self.spill()
+
+    def spill(self) -> None:
+        if self.temp_file_name is None:
+            fd, self.temp_file_name = tempfile.mkstemp(suffix='.csv')
+            os.close(fd)
+        self._timed(
+            STAGE_WRITE, self.handles.get(self.temp_file_name).write, b''.join(self.buffer))
+        self.buffer.clear()
+        self.buffered_bytes = 0
+
+    def finish(self, dest_file: Path) -> Path:
+        header = ','.join(self.columns.names)
+        if self.temp_file_name is None and self.spool_in_memory:
+            rows = io.BytesIO(b''.join(self.buffer))
+            self.buffer.clear()
+            return self._timed(
+                STAGE_POST_PROCESS, _post_process_csv, header, rows, dest_file, self.comma_runs)
+
+        self.spill()
+        self.handles.close(self.temp_file_name)
+        try:
+            with open(self.temp_file_name, 'rb') as temp_csv_f:
+                return self._timed(
+                    STAGE_POST_PROCESS, _post_process_csv, header, temp_csv_f, dest_file,
+                    self.comma_runs)
+        finally:
+            self.discard()
+
+    def discard(self) -> None:
+        self.buffer.clear()
+        if self.temp_file_name is not None:
+            self.handles.close(self.temp_file_name)
+            os.remove(self.temp_file_name)
+            self.temp_file_name = None
+
+    def _timed(self, stage: str, function: Callable, *args: Any) -> Any:
+        # runs one stage, timing it while metrics are enabled
+        if self.metrics is None:
+            return function(*args)
+        started = _clock()
+        result = function(*args)
+        ended = _clock()
+        self.metrics.add_time(
+            stage, self.type_name, ended[0] - started[0], ended[1] - started[1])
+        return result
+
+    def _count_row(self, size: int, width: int) -> None:
+        # counts a written row and the columns it added to the header
+        metrics = self.metrics
+        type_name = self.type_name
+        metrics.increment(COUNTER_ROWS, type_name)
+        metrics.increment(COUNTER_BYTES, type_name, size)
+        if len(self.columns) != width:
+            if width:
+                metrics.increment(COUNTER_SCHEMA_WIDENINGS, type_name)
+            metrics.set_gauge(GAUGE_COLUMNS, type_name, len(self.columns))
+
+
+class _CsvStreamSet:
+    """Owns the csv stream of every type in a mixed stream and the file handles they share."""
+
+    def __init__(
+            self,
+            buffer_size: int,
+            max_open_files: int,
+            spool_in_memory: bool,
+            projection: Optional[Tuple[str, ...]]) -> None:
+        self.handles = FileHandlePool(max_open_files)
+        self.buffer_size = buffer_size
+        self.spool_in_memory = spool_in_memory
+        self.projection = projection
+        self.streams: Dict[str, _CsvStream] = {}
+
+    def get(self, stream_type: str) -> _CsvStream:
+        stream = self.streams.get(stream_type)
+        if stream is None:
+            stream = self.streams[stream_type] = _CsvStream(
+                self.handles, self.buffer_size, self.spool_in_memory, self.projection)
+        return stream
+
+    def finish(self, output_dir: Path) -> None:
+        while self.streams:
+            stream_type = next(iter(self.streams))
+            self.streams.pop(stream_type).finish(output_dir / f'{stream_type}.csv')
+
+    def close(self) -> None:
+        # remove the temporary files of streams that were not finished
+        for stream in self.streams.values():
+            stream.discard()
+        self.streams.clear()
+        self.handles.close_all()
 # endregion
 
 
 # region Private Methods
-def _post_process_csv(header: str, src_file: Path, dest_file: Path) -> Path:
+def _flatten_mixed_proto_stream_in_workers(
+        objs: Iterator,
+        output_dir: Path,
+        workers: int,
+        queue_depth: int,
+        batch_size: int,
+        stream_options: Tuple) -> None:
+    # types are assigned to workers round robin in order of first appearance
+    context = multiprocessing.get_context()
+    queues = [context.Queue(maxsize=queue_depth) for _ in range(workers)]
+    processes = [
+        context.Process(
+            target=_csv_worker, args=(worker_queue, output_dir, stream_options), daemon=True)
+        for worker_queue in queues
+    ]
+    for process in processes:
+        process.start()
+
+    stream_type_to_worker: Dict[str, int] = {}
+    stream_type_to_batch: Dict[str, Tuple[type, List[bytes]]] = {}
+    try:
+        for obj in objs:
+            stream_type = obj.DESCRIPTOR.full_name
+            batch = stream_type_to_batch.get(stream_type)
+            if batch is None:
+                stream_type_to_worker[stream_type] = len(stream_type_to_worker) % workers
+                batch = stream_type_to_batch[stream_type] = (type(obj), [])
+            batch[1].append(obj.SerializeToString())
+            if len(batch[1]) >= batch_size:
+                worker = stream_type_to_worker[stream_type]
+                _put_to_worker(queues[worker], processes[worker], batch)
+                stream_type_to_batch[stream_type] = (batch[0], [])
+
+        for stream_type, batch in stream_type_to_batch.items():
+            worker = stream_type_to_worker[stream_type]
+            if batch[1]:
+                _put_to_worker(queues[worker], processes[worker], batch)
+        for worker_queue, process in zip(queues, processes):
+            _put_to_worker(worker_queue, process, None)
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+    failed = [process.exitcode for process in processes if process.exitcode != 0]
+    if failed:
+        raise RuntimeError(f'{len(failed)} csv worker process(es) failed: exit codes {failed}')
+
+
+def _put_to_worker(worker_queue: Any, process: Any, item: Any) -> None:
+    # block while the worker's queue is full (backpressure) but stop if the worker died
+    while True:
+        try:
+            worker_queue.put(item, timeout=1)
+            return
+        except queue.Full:
+            if not process.is_alive():
+                raise RuntimeError(
+                    f'csv worker process exited with code {process.exitcode}') from None
+
+
+def _csv_worker(worker_queue: Any, output_dir: Path, stream_options: Tuple) -> None:
+    # owns the csv stream of every type routed to it until the producer sends None
+    streams = _CsvStreamSet(*stream_options)
+    try:
+        while True:
+            item = worker_queue.get()
+            if item is None:
+                break
+            message_class, batch = item
+            stream = streams.get(message_class.DESCRIPTOR.full_name)
+            for data in batch:
+                stream.write(message_class.FromString(data))
+        streams.finish(output_dir)
+    finally:
+        streams.close()
+
+
+def _post_process_csv(
+        header: str,
+        temp_csv_f: BinaryIO,
+        dest_file: Path,
+        comma_runs: List[Tuple[int, int]]) -> Path:
     # add the header to the top of the ouptut file and then copy the data from the temporary file
     # this must be completed after writting the data because repeated elements make the header
-    # values dynamic
-    col_count = len(header.split(','))
-    with open(src_file, 'r') as temp_csv_f:
-        with open(dest_file, 'w') as csv_f:
-            csv_f.write(f'{header}\n')
-            for line in temp_csv_f:
-                line_col_count = len(line.split(','))
-                num_commas_to_add = col_count - line_col_count
-                line = line[:-1] + ','*num_commas_to_add + '\n'
-                csv_f.write(line)
+    # values dynamic. Rows are never split again, runs that are already as wide as the header are
+    # copied as is and shorter runs get the same number of commas appended to every line.
+    header_commas = header.count(',')
+    with open(dest_file, 'wb') as csv_f:
+        csv_f.write(f'{header}\n'.encode())
+        for idx, (offset, commas) in enumerate(comma_runs):
+            if idx + 1 < len(comma_runs):
+                length = comma_runs[idx + 1][0] - offset
+            else:
+                length = None
+            padding = b','*(header_commas - commas)
+            _copy_rows(temp_csv_f, csv_f, length, padding)
     return dest_file
 
 
-def _proto_to_csv_file_helper(obj: Any, running_entry: OrderedDict, csv_f: TextIOWrapper):
+def _copy_rows(src: BinaryIO, dest: BinaryIO, length: int, padding: bytes) -> None:
+    # copy length bytes (or everything left when length is None) appending padding to each line
+    while length is None or length > 0:
+        chunk = src.read(_COPY_CHUNK_SIZE if length is None else min(length, _COPY_CHUNK_SIZE))
+        if not chunk:
+            break
+        if length is not None:
+            length -= len(chunk)
+        if padding:
+            chunk = chunk.replace(b'\n', padding + b'\n')
+        dest.write(chunk)
+
+
+def _clock() -> Tuple[float, float]:
+    # wall clock and process cpu time
+    return time.perf_counter(), time.process_time()
+
+
+def _to_csv_line(columns: ColumnRegistry, attrs: List, values: List) -> str:
     # need to handle attrs changing for each object if they contain lists or dict
-    # (need to consolidate indexes)
-    attrs, values = flatten_proto_to_list(obj)
-    for attr, value in zip(attrs, values):
-        running_entry[attr] = value
-    for key in running_entry.keys():
-        if key not in attrs:
-            running_entry[key] = ''
-    line = ','.join(map(str, running_entry.values()))
-    csv_f.write(f'{line}\n')
+    # (the registry consolidates indexes into stable column slots)
+    return ','.join(columns.fill_row(attrs, values))
 # endregion
@@ -0,0 +1,52 @@
+from collections import OrderedDict
+from typing import BinaryIO
+
+
+# Default number of files the writers of mixed streams keep open at the same time.
+DEFAULT_MAX_OPEN_FILES = 64
+
+
+class FileHandlePool:
+    """Keeps at most max_open_files files open for appending. When another file is needed the
+    least recently used handle is closed, it is reopened on its next use. Writers of mixed
+    streams share a pool so the number of open files does not grow with the number of types.
+    Args:
+        max_open_files (int): maximum number of files open at once, at least 1.
+    """
+
+    def __init__(self, max_open_files: int = DEFAULT_MAX_OPEN_FILES) -> None:
+        self.max_open_files = max(1, max_open_files)
+        self._handles: OrderedDict = OrderedDict()
+
+    def get(self, file_name: str) -> BinaryIO:
+        """Returns the handle of a file opened for appending bytes, closing the least recently
+        used handle first when max_open_files are open.
+        Args:
+            file_name (str): path of the file.
+        Returns:
+            BinaryIO: handle of the file.
+        """
+        handle = self._handles.get(file_name)
+        if handle is not None:
+            self._handles.move_to_end(file_name)
+            return handle
+        if len(self._handles) >= self.max_open_files:
+            _, oldest = self._handles.popitem(last=False)
+            oldest.close()
+        handle = self._handles[file_name] = open(file_name, 'ab')
+        return handle
+
+    def close(self, file_name: str) -> None:
+        """Closes the handle of a file if it is open.
+        Args:
+            file_name (str): path of the file.
+        """
+        handle = self._handles.pop(file_name, None)
+        if handle is not None:
+            handle.close()
+
+    def close_all(self) -> None:
+        """Closes every open handle."""
+        while self._handles:
+            _, handle = self._handles.popitem()
+            handle.close()
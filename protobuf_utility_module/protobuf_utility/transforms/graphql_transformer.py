@@ -1,3 +1,7 @@
+from functools import lru_cache
+import math
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
 import google
 from google.protobuf.descriptor import FieldDescriptor
 
@@ -6,40 +10,201 @@ ScalarMapContainer = google._upb._message.ScalarMapContainer
 MessageMapContainer = google._upb._message.MessageMapContainer
 Descriptor = google._upb._message.Descriptor
 
+# Number of times a message type may be nested inside itself before its field is left out.
+DEFAULT_MAX_RECURSION = 1
+
+# Number of selection sets kept. Selection sets are cached per message, indentation and limits
+# so the nested messages shared by many queries are only generated once.
+GRAPHQL_CACHE_SIZE = 1 << 14
+
+# Suffix of the fragment names, the fragment of RawMsg is RawMsgFields.
+FRAGMENT_SUFFIX = 'Fields'
+
 
-def proto_definition_to_graphql_query(proto_def: MessageMeta) -> str:
+def proto_definition_to_graphql_query(
+        proto_def: MessageMeta,
+        max_depth: Optional[int] = None,
+        max_recursion: int = DEFAULT_MAX_RECURSION,
+        fragments: bool = False) -> str:
     """Generated the client side graphql query for protobuf object as a string.
     Args:
         proto_def (MessageMeta): protobuf class to convert to a query.
+        max_depth (Optional[int]): number of levels of nested messages selected, deeper message
+            fields are left out. Unlimited when None.
+        max_recursion (int): number of times a recursive message type may be nested inside
+            itself, deeper fields of that type are left out.
+        fragments (bool): select the message types referenced by more than one field through a
+            named fragment (...RawMsgFields) defined once after the query, so the query grows
+            with the number of distinct types instead of the number of paths to them.
     Returns:
         str: protobuf query
     """
-    return _proto_definition_to_graphql_query(proto_def.DESCRIPTOR)
+    return _graphql_query(proto_def.DESCRIPTOR, max_depth, max_recursion, fragments)
 
 
-def _proto_definition_to_graphql_query(proto_descriptor: Descriptor, depth=1):
-    # Sort fields based on number to provide a more reproducible order
-    # Unsorted order matches that of file definition order even though there is no change to the
-    # underlying protobuf if a field is moved. This makes the code unnecessarily unstable.
-    field_nums = []
-    fields = []
-    for field in proto_descriptor.fields:
-        field_nums.append(field.number)
-        fields.append(field)
-    id_fields = zip(field_nums, fields)
-    sorted_id_fields = sorted(id_fields)
-
-    query = '{'
-    for _, field in sorted_id_fields:
-        tab_str = "\t"*depth
+@lru_cache(maxsize=GRAPHQL_CACHE_SIZE)
+def _graphql_query(
+        proto_descriptor: Descriptor,
+        max_depth: Optional[int],
+        max_recursion: int,
+        fragments: bool) -> str:
+    # the query of a message followed by the definitions of the fragments it uses, in order of
+    # first use
+    fragment_types = _fragment_types(proto_descriptor) if fragments else frozenset()
+    ancestors = (proto_descriptor,) if _is_recursive(proto_descriptor) else ()
+    query, used = _proto_definition_to_graphql_query(
+        proto_descriptor, 1, max_depth, max_recursion, ancestors, fragment_types)
+    parts = [query]
+    pending = list(used)
+    defined = set(used)
+    while pending:
+        fragment_type = pending.pop(0)
+        body, nested_used = _proto_definition_to_graphql_query(
+            fragment_type, 1, None, max_recursion, (), fragment_types)
+        name = graphql_type_name(fragment_type)
+        parts.append(f'fragment {name}{FRAGMENT_SUFFIX} on {name} {body}')
+        for nested_type in nested_used:
+            if nested_type not in defined:
+                defined.add(nested_type)
+                pending.append(nested_type)
+    return '\n\n'.join(parts)
+
+
+def graphql_type_name(proto_descriptor: Descriptor) -> str:
+    """Returns the graphql type name of a message or enum: its name within its package, with
+    the names of enclosing messages joined by underscores (common.RawMsg is RawMsg and
+    ComplexMessage.N5 is ComplexMessage_N5).
+    Args:
+        proto_descriptor (Descriptor): descriptor of the message or enum.
+    Returns:
+        str: graphql type name.
+    """
+    package = proto_descriptor.file.package
+    name = proto_descriptor.full_name
+    if package:
+        name = name[len(package) + 1:]
+    return name.replace('.', '_')
+
 
+@lru_cache(maxsize=GRAPHQL_CACHE_SIZE)
+def _proto_definition_to_graphql_query(
+        proto_descriptor: Descriptor,
+        depth: int,
+        remaining: Optional[int],
+        max_recursion: int,
+        ancestors: Tuple[Descriptor, ...],
+        fragment_types: FrozenSet[Descriptor]) -> Tuple[str, Tuple[Descriptor, ...]]:
+    # Builds the selection set of a message at an indentation depth and lists the fragments it
+    # spreads. remaining is the number of nested levels still selected and ancestors the
+    # recursive message types enclosing it, the selection set of a message that is not
+    # recursive never depends on its ancestors so it is cached without them.
+    tab_str = '\t'*depth
+    parts = ['{']
+    used: Dict[Descriptor, None] = {}
+    for field in _sorted_fields(proto_descriptor):
         # Works completely for: scalars, list of scalars
         # Forms base for: nest messages, repeated messages, dictionaries
-        query += f'\n{tab_str}{field.name}'
+        if field.type != FieldDescriptor.TYPE_MESSAGE:
+            parts.append(f'\n{tab_str}{field.name}')
+            continue
+
+        # Handle nested messages, left out past the depth or recursion limits
+        message_type = field.message_type
+        if message_type in fragment_types and (
+                remaining is None or _height(message_type) < remaining):
+            name = graphql_type_name(message_type)
+            parts.append(f'\n{tab_str}{field.name} {{\n{tab_str}\t...{name}{FRAGMENT_SUFFIX}'
+                         f'\n{tab_str}}}')
+            used[message_type] = None
+            continue
+        nested = _nested_selection(
+            message_type, depth, remaining, max_recursion, ancestors, fragment_types)
+        if nested is not None:
+            parts.append(f'\n{tab_str}{field.name} {nested[0]}')
+            used.update(dict.fromkeys(nested[1]))
+    parts.append(f'\n{tab_str[:-1]}}}')
+    return ''.join(parts), tuple(used)
+
+
+def _nested_selection(
+        message_type: Descriptor,
+        depth: int,
+        remaining: Optional[int],
+        max_recursion: int,
+        ancestors: Tuple[Descriptor, ...],
+        fragment_types: FrozenSet[Descriptor]) -> Optional[Tuple[str, Tuple[Descriptor, ...]]]:
+    # selection set of a message field, None when the field is left out
+    if remaining is not None:
+        if remaining <= 0:
+            return None
+        remaining -= 1
+    if _is_recursive(message_type):
+        if ancestors.count(message_type) > max_recursion:
+            return None
+        ancestors += (message_type,)
+    else:
+        ancestors = ()
+    nested = _proto_definition_to_graphql_query(
+        message_type, depth + 1, remaining, max_recursion, ancestors, fragment_types)
+    # a message whose fields were all left out has no valid selection
+    if nested[0] == '{\n' + '\t'*depth + '}':
+        return None
+    return nested
+
+
+@lru_cache(maxsize=GRAPHQL_CACHE_SIZE)
+def _fragment_types(proto_descriptor: Descriptor) -> FrozenSet[Descriptor]:
+    # message types referenced by more than one field of the messages reachable from a message.
+    # Recursive types are always inlined, graphql does not allow fragments to spread themselves.
+    references: Dict[Descriptor, int] = {}
+    visited = {proto_descriptor}
+    stack = [proto_descriptor]
+    while stack:
+        for field in stack.pop().fields:
+            message_type = field.message_type
+            if message_type is None:
+                continue
+            references[message_type] = references.get(message_type, 0) + 1
+            if message_type not in visited:
+                visited.add(message_type)
+                stack.append(message_type)
+    return frozenset(
+        message_type for message_type, count in references.items()
+        if count > 1 and not _is_recursive(message_type))
+
+
+@lru_cache(maxsize=GRAPHQL_CACHE_SIZE)
+def _height(proto_descriptor: Descriptor) -> float:
+    # number of levels of nested messages below a message, unbounded for recursive messages so
+    # the fragments containing them are inlined when the depth is limited
+    if _is_recursive(proto_descriptor):
+        return math.inf
+    return max((
+        _height(field.message_type) + 1 for field in proto_descriptor.fields
+        if field.message_type is not None), default=0)
+
+
+@lru_cache(maxsize=GRAPHQL_CACHE_SIZE)
+def _sorted_fields(proto_descriptor: Descriptor) -> Tuple[FieldDescriptor, ...]:
+    # Sort fields based on number to provide a more reproducible order
+    # Unsorted order matches that of file definition order even though there is no change to the
+    # underlying protobuf if a field is moved. This makes the code unnecessarily unstable.
+    return tuple(sorted(proto_descriptor.fields, key=lambda field: field.number))
 
-        # Handle nested messages
-        if field.type == FieldDescriptor.TYPE_MESSAGE:
-            query += ' '
-            query += _proto_definition_to_graphql_query(field.message_type, depth=depth+1)
 
-    return f'{query}\n{tab_str[:-1]}' + '}'
+@lru_cache(maxsize=GRAPHQL_CACHE_SIZE)
+def _is_recursive(proto_descriptor: Descriptor) -> bool:
+    # whether a message can contain itself through its message fields
+    stack: List[Descriptor] = [proto_descriptor]
+    visited = set()
+    while stack:
+        for field in stack.pop().fields:
+            message_type = field.message_type
+            if message_type is None:
+                continue
+            if message_type == proto_descriptor:
+                return True
+            if message_type.full_name not in visited:
+                visited.add(message_type.full_name)
+                stack.append(message_type)
+    return False
@@ -0,0 +1,300 @@
+from base64 import b64encode
+from functools import lru_cache
+import json
+from json.encoder import encode_basestring
+import math
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from google.protobuf import json_format
+from google.protobuf.any_pb2 import Any as ProtoAny
+from google.protobuf.descriptor import Descriptor, FieldDescriptor
+from google.protobuf.internal.type_checkers import ToShortestFloat
+
+from protobuf_utility.transforms.file_handle_pool import DEFAULT_MAX_OPEN_FILES
+from protobuf_utility.transforms.file_handle_pool import FileHandlePool
+from protobuf_utility.transforms.list_transformer import PLAN_CACHE_SIZE
+from protobuf_utility.transforms.list_transformer import STEP_MESSAGE_MAP
+from protobuf_utility.transforms.list_transformer import STEP_NESTED_MESSAGE
+from protobuf_utility.transforms.list_transformer import STEP_REPEATED_MESSAGE
+from protobuf_utility.transforms.list_transformer import STEP_REPEATED_SCALAR
+from protobuf_utility.transforms.list_transformer import STEP_SCALAR
+from protobuf_utility.transforms.list_transformer import get_flatten_plan
+
+
+# Number of bytes of lines buffered before they are written to a file.
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+# Suffix of the files written by split_proto_stream_to_ndjson.
+NDJSON_SUFFIX = '.ndjson'
+
+# 64 bit integers are quoted like json_format does, they do not fit a double.
+_QUOTED_CPPTYPES = (
+    FieldDescriptor.CPPTYPE_INT64,
+    FieldDescriptor.CPPTYPE_UINT64,
+)
+_NON_FINITE = {
+    math.inf: '"Infinity"',
+    -math.inf: '"-Infinity"',
+}
+
+# Well known types have their own json representation, they are encoded by json_format.
+_WELL_KNOWN_TYPES_PREFIX = 'google/protobuf/'
+
+
+# region Public Methods
+def proto_to_json(obj: ProtoAny) -> str:
+    """Encodes a protobuf object to a single line of json. The output matches
+    json_format.MessageToJson with preserving_proto_field_name and
+    including_default_value_fields: scalar, repeated and map fields are always present, singular
+    message and oneof fields only when they are set, 64 bit integers are strings, enums are names
+    and bytes are base64. Fields are ordered by number like flatten_proto_to_list and map keys are
+    sorted.
+    Args:
+        obj (ProtoAny): protobuf object to encode.
+    Returns:
+        str: json object.
+    """
+    return get_json_encoder(obj.DESCRIPTOR)(obj)
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def get_json_encoder(descriptor: Descriptor) -> Callable[[ProtoAny], str]:
+    """Compiles the json encoder of a message descriptor from its flattening plan. Each field gets
+    its quoted key and a value encoder chosen once from its type, so encoding an object only
+    calls the encoders of its fields. Encoders are cached per descriptor like flattening plans.
+    Args:
+        descriptor (Descriptor): descriptor of the protobuf message.
+    Returns:
+        Callable[[ProtoAny], str]: function encoding an object of the message to json.
+    """
+    if descriptor.file.name.startswith(_WELL_KNOWN_TYPES_PREFIX):
+        return _encode_well_known
+
+    steps: List[Tuple[str, str, Callable[[Any], str], Optional[str]]] = []
+    for kind, name, field, message_type in get_flatten_plan(descriptor):
+        key = encode_basestring(name) + ':'
+        # fields with presence are left out while they are not set
+        presence = name if (
+            kind == STEP_NESTED_MESSAGE or field.containing_oneof is not None) else None
+        if kind == STEP_SCALAR:
+            encoder = _get_scalar_encoder(field)
+        elif kind == STEP_NESTED_MESSAGE:
+            encoder = _get_message_encoder(message_type)
+        elif kind in (STEP_REPEATED_SCALAR, STEP_REPEATED_MESSAGE):
+            element_encoder = (
+                _get_scalar_encoder(field) if kind == STEP_REPEATED_SCALAR
+                else _get_message_encoder(message_type))
+            encoder = _list_encoder(element_encoder)
+        else:
+            entry_fields = field.message_type.fields_by_name
+            value_encoder = (
+                _get_message_encoder(message_type) if kind == STEP_MESSAGE_MAP
+                else _get_scalar_encoder(entry_fields['value']))
+            encoder = _map_encoder(_get_key_encoder(entry_fields['key']), value_encoder)
+        steps.append((name, key, encoder, presence))
+    steps = tuple(steps)
+
+    def encode(obj: ProtoAny) -> str:
+        parts = []
+        for name, key, encoder, presence in steps:
+            if presence is not None and not obj.HasField(presence):
+                continue
+            parts.append(key + encoder(getattr(obj, name)))
+        return '{' + ','.join(parts) + '}'
+
+    return encode
+
+
+def proto_stream_to_ndjson(
+        objs: Iterable[ProtoAny],
+        file: Union[Path, BinaryIO],
+        buffer_size: int = DEFAULT_BUFFER_SIZE) -> int:
+    """Writes a stream of protobuf objects of any types as newline delimited json, one object per
+    line encoded with proto_to_json. Lines are joined and written in chunks of about buffer_size
+    bytes.
+    Args:
+        objs (Iterable[ProtoAny]): protobuf objects to write.
+        file (Union[Path, BinaryIO]): file path to create or binary file object to write to.
+        buffer_size (int): number of bytes of lines buffered before they are written.
+    Returns:
+        int: number of objects written.
+    """
+    if not hasattr(file, 'write'):
+        with open(file, 'wb') as ndjson_f:
+            return proto_stream_to_ndjson(objs, ndjson_f, buffer_size)
+
+    encoders: Dict[Descriptor, Callable[[ProtoAny], str]] = {}
+    lines: List[str] = []
+    buffered = 0
+    count = 0
+    for obj in objs:
+        descriptor = obj.DESCRIPTOR
+        encoder = encoders.get(descriptor)
+        if encoder is None:
+            encoder = encoders[descriptor] = get_json_encoder(descriptor)
+        line = encoder(obj)
+        lines.append(line)
+        buffered += len(line) + 1
+        if buffered >= buffer_size:
+            _write_lines(file, lines)
+            buffered = 0
+        count += 1
+    _write_lines(file, lines)
+    return count
+
+
+def split_proto_stream_to_ndjson(
+        objs: Iterable[ProtoAny],
+        output_dir: Path,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        max_open_files: int = DEFAULT_MAX_OPEN_FILES) -> Dict[str, Path]:
+    """Writes a stream of protobuf objects to one newline delimited json file per object type,
+    named after DESCRIPTOR.full_name like the files of flatten_mixed_proto_stream_to_csv. The lines
+    of each type are buffered up to buffer_size bytes and the files are written through a pool of
+    at most max_open_files handles.
+    Args:
+        objs (Iterable[ProtoAny]): protobuf objects to write.
+        output_dir (Path): directory to write one file per object type to.
+        buffer_size (int): number of bytes of lines each type buffers before they are written.
+        max_open_files (int): maximum number of files open at once.
+    Returns:
+        Dict[str, Path]: path of the file of each type.
+    """
+    handles = FileHandlePool(max_open_files)
+    streams: Dict[Descriptor, _NdjsonStream] = {}
+    try:
+        for obj in objs:
+            descriptor = obj.DESCRIPTOR
+            stream = streams.get(descriptor)
+            if stream is None:
+                stream = streams[descriptor] = _NdjsonStream(
+                    descriptor, Path(output_dir) / f'{descriptor.full_name}{NDJSON_SUFFIX}')
+            line = stream.encoder(obj)
+            stream.lines.append(line)
+            stream.buffered += len(line) + 1
+            if stream.buffered >= buffer_size:
+                _write_lines(handles.get(stream.file_name), stream.lines)
+                stream.buffered = 0
+        for stream in streams.values():
+            if stream.lines:
+                _write_lines(handles.get(stream.file_name), stream.lines)
+    finally:
+        handles.close_all()
+    return {descriptor.full_name: Path(stream.file_name) for descriptor, stream in streams.items()}
+# endregion
+
+
+# region Private Classes
+class _NdjsonStream:
+    # encoder and buffered lines of one type of a split stream
+    __slots__ = ('encoder', 'file_name', 'lines', 'buffered')
+
+    def __init__(self, descriptor: Descriptor, path: Path) -> None:
+        self.encoder = get_json_encoder(descriptor)
+        self.file_name = str(path)
+        self.lines: List[str] = []
+        self.buffered = 0
+        # the handle pool appends so the file is truncated once
+        open(path, 'wb').close()
+# endregion
+
+
+# region Private Methods
+def _write_lines(file: BinaryIO, lines: List[str]) -> None:
+    # writes and clears the buffered lines
+    if lines:
+        lines.append('')
+        file.write('\n'.join(lines).encode())
+        lines.clear()
+
+
+def _get_message_encoder(descriptor: Descriptor) -> Callable[[ProtoAny], str]:
+    # nested encoders are looked up on first use so recursive messages compile
+    encoder = None
+
+    def encode(obj: ProtoAny) -> str:
+        nonlocal encoder
+        if encoder is None:
+            encoder = get_json_encoder(descriptor)
+        return encoder(obj)
+
+    return encode
+
+
+def _get_scalar_encoder(field: FieldDescriptor) -> Callable[[Any], str]:
+    cpp_type = field.cpp_type
+    if cpp_type == FieldDescriptor.CPPTYPE_STRING:
+        if field.type == FieldDescriptor.TYPE_BYTES:
+            return _encode_bytes
+        return encode_basestring
+    if cpp_type == FieldDescriptor.CPPTYPE_BOOL:
+        return _encode_bool
+    if cpp_type == FieldDescriptor.CPPTYPE_ENUM:
+        names = {value.number: encode_basestring(value.name) for value in field.enum_type.values}
+        # values unknown to the descriptor of an open enum are written as numbers
+        return lambda value: names.get(value) or str(value)
+    if cpp_type in _QUOTED_CPPTYPES:
+        return _encode_quoted
+    if cpp_type == FieldDescriptor.CPPTYPE_FLOAT:
+        return _encode_float
+    if cpp_type == FieldDescriptor.CPPTYPE_DOUBLE:
+        return _encode_double
+    return str
+
+
+def _get_key_encoder(field: FieldDescriptor) -> Callable[[Any], str]:
+    # json object keys are always strings
+    if field.cpp_type == FieldDescriptor.CPPTYPE_STRING:
+        return encode_basestring
+    if field.cpp_type == FieldDescriptor.CPPTYPE_BOOL:
+        return lambda key: '"true"' if key else '"false"'
+    return _encode_quoted
+
+
+def _list_encoder(element_encoder: Callable[[Any], str]) -> Callable[[Iterable], str]:
+    return lambda values: '[' + ','.join(map(element_encoder, values)) + ']'
+
+
+def _map_encoder(
+        key_encoder: Callable[[Any], str],
+        value_encoder: Callable[[Any], str]) -> Callable[[Any], str]:
+    def encode(mapping: Any) -> str:
+        return '{' + ','.join(
+            key_encoder(key) + ':' + value_encoder(mapping[key]) for key in sorted(mapping)) + '}'
+
+    return encode
+
+
+def _encode_bool(value: bool) -> str:
+    return 'true' if value else 'false'
+
+
+def _encode_quoted(value: int) -> str:
+    return f'"{value}"'
+
+
+def _encode_bytes(value: bytes) -> str:
+    return '"' + b64encode(value).decode() + '"'
+
+
+def _encode_double(value: float) -> str:
+    if math.isfinite(value):
+        return repr(value)
+    return _NON_FINITE.get(value, '"NaN"')
+
+
+def _encode_float(value: float) -> str:
+    # the shortest repr that round trips through a 32 bit float
+    if math.isfinite(value):
+        return repr(ToShortestFloat(value))
+    return _NON_FINITE.get(value, '"NaN"')
+
+
+def _encode_well_known(obj: ProtoAny) -> str:
+    return json.dumps(
+        json_format.MessageToDict(
+            obj, including_default_value_fields=True, preserving_proto_field_name=True),
+        separators=(',', ':'),
+        ensure_ascii=False)
+# endregion
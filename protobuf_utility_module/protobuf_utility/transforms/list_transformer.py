@@ -1,82 +1,458 @@
-from typing import List, Tuple
+from array import array
+from fnmatch import fnmatchcase
+from functools import lru_cache
+from itertools import repeat
+import re
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
 
-import google
 from google.protobuf.any_pb2 import Any as ProtoAny
-from google.protobuf.descriptor import FieldDescriptor
+from google.protobuf.descriptor import Descriptor, FieldDescriptor
 
+try:
+    import numpy
+except ImportError:  # numpy is optional, columns fall back to array.array
+    numpy = None
 
-def flatten_proto_to_list(obj: ProtoAny) -> Tuple[List, List]:
+
+# Maximum number of compiled flattening plans kept in memory. Plans are keyed by descriptor so
+# this bounds the number of distinct message types that stay cached at once.
+PLAN_CACHE_SIZE = 1024
+
+# Kinds of steps a flattening plan is made of. Each kind maps to one accessor in _run_plan.
+STEP_SCALAR = 0
+STEP_REPEATED_SCALAR = 1
+STEP_SCALAR_MAP = 2
+STEP_MESSAGE_MAP = 3
+STEP_REPEATED_MESSAGE = 4
+STEP_NESTED_MESSAGE = 5
+
+# One segment of an attribute path pattern: a field name glob optionally followed by an index
+# or key selector, e.g. raw_msgs[*] or raw_msgs_by_id["msg*"].
+PATTERN_SEGMENT = re.compile(r'([^.\[\]"]+)(?:\[(?:"([^"]*)"|([^\]"]*))\])?')
+
+# Returned by select_element when an element of a repeated field is not projected.
+SKIP_ELEMENT = object()
+
+# Typed storage used for numeric, bool and enum columns in flatten_protos_to_columns.
+# Everything else (strings and bytes) is stored in a plain list.
+_COLUMN_TYPECODES = {
+    FieldDescriptor.CPPTYPE_INT32: 'i',
+    FieldDescriptor.CPPTYPE_INT64: 'q',
+    FieldDescriptor.CPPTYPE_UINT32: 'I',
+    FieldDescriptor.CPPTYPE_UINT64: 'Q',
+    FieldDescriptor.CPPTYPE_DOUBLE: 'd',
+    FieldDescriptor.CPPTYPE_FLOAT: 'f',
+    FieldDescriptor.CPPTYPE_BOOL: 'b',
+    FieldDescriptor.CPPTYPE_ENUM: 'i',
+}
+
+
+class PlanStep(NamedTuple):
+    """A single typed accessor in a compiled flattening plan.
+    Attributes:
+        kind (int): one of the STEP_* constants describing how to read the field.
+        name (str): name of the field on the protobuf object.
+        field (FieldDescriptor): descriptor of the field.
+        message_type (Optional[Descriptor]): descriptor of the nested message for message steps
+            (the map value type for message maps), otherwise None.
+    """
+    kind: int
+    name: str
+    field: FieldDescriptor
+    message_type: Optional[Descriptor]
+
+
+# region Public Methods
+def flatten_proto_to_list(
+        obj: ProtoAny, projection: Optional[Iterable[str]] = None) -> Tuple[List, List]:
     """This method flattens a protobuf to a list. It follows the object tree as deep as it goes
     and creates a list of attributes and values. The attributes for nested items are formatted
     to match the syntax required to retrieve the value for that attribute from the object.
+
+    A projection limits the output to the attributes matching at least one of its patterns.
+    Patterns use the attribute syntax with globs for field names, indexes and keys, for example
+    raw_msgs[*].id or raw_msgs_by_id["*"].timestamp. A pattern also selects everything nested
+    below the attribute it matches and a field without a selector matches every index or key.
+    Fields that cannot match are never read.
     Args:
         obj (ProtoAny): protobuf object to process.
+        projection (Optional[Iterable[str]]): attribute path patterns to keep, all when None.
     Returns:
         Tuple[List, List]: list of object attributes and list of object values.
     """
     attrs = []
     values = []
+    if projection is None:
+        _run_plan(obj, '', attrs, values)
+    else:
+        _run_projected_plan(obj, parse_projection(tuple(projection)), '', attrs, values)
+    return attrs, values
+
+
+def flatten_protos_to_columns(
+        objs: Iterable[ProtoAny],
+        projection: Optional[Iterable[str]] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Flattens a batch of protobuf objects of the same type into columns. Each attribute path
+    produced by flatten_proto_to_list becomes one column holding that attribute's value for every
+    object in the batch. Numeric, bool and enum columns are typed arrays (numpy arrays when numpy
+    is installed, otherwise array.array) and string and bytes columns are lists (numpy object
+    arrays when numpy is installed). Repeated and map fields do not produce the same attributes
+    for every object, so each column also has a validity mask that is false for rows where the
+    attribute was missing. Missing rows hold 0 in typed columns and None in object columns.
+    Args:
+        objs (Iterable[ProtoAny]): iterable of same type protobuf objects to flatten.
+        projection (Optional[Iterable[str]]): attribute path patterns to keep, all when None. See
+            flatten_proto_to_list for the pattern syntax.
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, Any]]: columns and validity masks keyed by attribute
+            path, in the order the attributes were first seen.
+    """
+    columns: Dict[str, List] = {}
+    attrs = []
+    values = []
+    fields = []
+    row_count = 0
+    patterns = None if projection is None else parse_projection(tuple(projection))
+    for obj in objs:
+        if patterns is None:
+            _run_plan(obj, '', attrs, values, fields)
+        else:
+            _run_projected_plan(obj, patterns, '', attrs, values, fields)
+        for attr, value, field in zip(attrs, values, fields):
+            column = columns.get(attr)
+            if column is None:
+                column = columns[attr] = _new_column(field)
+            if len(column[1]) != row_count:
+                _pad_column(column, row_count)
+            column[0].append(value)
+            column[1].append(1)
+        attrs.clear()
+        values.clear()
+        fields.clear()
+        row_count += 1
+
+    data = {}
+    validity = {}
+    for attr, column in columns.items():
+        _pad_column(column, row_count)
+        data[attr], validity[attr] = finish_column(column)
+    return data, validity
+
 
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def get_flatten_plan(descriptor: Descriptor) -> Tuple[PlanStep, ...]:
+    """Compiles the flattening plan for a message descriptor. The plan is an ordered tuple of typed
+    accessor steps, one per field, so flattening an object only has to run the steps instead of
+    re-inspecting the descriptor. Plans are cached per descriptor with least recently used
+    eviction once PLAN_CACHE_SIZE descriptors have been compiled.
+    Args:
+        descriptor (Descriptor): descriptor of the protobuf message to compile.
+    Returns:
+        Tuple[PlanStep, ...]: steps ordered by field number.
+    """
     # Sort fields based on number to provide a more reproducible order
     # Unsorted order matches that of file definition order even though there is no change to the
     # underlying protobuf if a field is moved. This makes the code unnecessarily unstable.
-    field_nums = []
-    fields = []
-    for field in obj.DESCRIPTOR.fields:
-        field_nums.append(field.number)
-        fields.append(field)
-    id_fields = zip(field_nums, fields)
-    sorted_id_fields = sorted(id_fields)
-
-    for _, field in sorted_id_fields:
-        value = getattr(obj, field.name)
-
-        # Handle nested messages
-        if field.type == FieldDescriptor.TYPE_MESSAGE:
-            # Handle single nested message
-            if field.label != FieldDescriptor.LABEL_REPEATED:
-                nested_attrs, nested_values = flatten_proto_to_list(value)
-                nested_attrs = [f'{field.name}.{attr}' for attr in nested_attrs]
-                values.extend(nested_values)
-                attrs.extend(nested_attrs)
-                continue
+    steps = []
+    for field in sorted(descriptor.fields, key=lambda field: field.number):
+        repeated = field.label == FieldDescriptor.LABEL_REPEATED
+        if field.type != FieldDescriptor.TYPE_MESSAGE:
+            kind = STEP_REPEATED_SCALAR if repeated else STEP_SCALAR
+            steps.append(PlanStep(kind, field.name, field, None))
+        elif not repeated:
+            steps.append(PlanStep(STEP_NESTED_MESSAGE, field.name, field, field.message_type))
+        elif field.message_type.GetOptions().map_entry:
+            value_field = field.message_type.fields_by_name['value']
+            if value_field.type == FieldDescriptor.TYPE_MESSAGE:
+                steps.append(
+                    PlanStep(STEP_MESSAGE_MAP, field.name, field, value_field.message_type))
+            else:
+                steps.append(PlanStep(STEP_SCALAR_MAP, field.name, field, None))
+        else:
+            steps.append(
+                PlanStep(STEP_REPEATED_MESSAGE, field.name, field, field.message_type))
+    return tuple(steps)
 
-            # Handle scalar map
-            if isinstance(value,  google._upb._message.ScalarMapContainer):
-                # map order cannot be guaranteed so to support as much consistency as possible
-                # for maps that have fixed structures, sort the keys and use sorted order to
-                # generate list.
-                keys = list(value.keys())
-                keys.sort()
-                for key in keys:
-                    attrs.append(f'{field.name}["{key}"]')
-                    values.append(value[key])
-                continue
 
-            # Handle repeated nested message (map or list)
-            if isinstance(value, google._upb._message.MessageMapContainer):
-                generator = value.items()
-            else:
-                generator = enumerate(value)
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def parse_projection(projection: Tuple[str, ...]) -> Tuple:
+    """Parses the attribute path patterns of a projection, see flatten_proto_to_list for the
+    pattern syntax. Parsed projections are cached.
+    Args:
+        projection (Tuple[str, ...]): attribute path patterns.
+    Returns:
+        Tuple: unique patterns, each a tuple of (name glob, index or key glob) segments.
+    """
+    patterns = []
+    for pattern in projection:
+        segments = []
+        pos = 0
+        while True:
+            match = PATTERN_SEGMENT.match(pattern, pos)
+            if match is None:
+                raise ValueError(f'Invalid attribute path pattern: {pattern!r}')
+            name, key, index = match.groups()
+            segments.append((name, key if key is not None else index))
+            pos = match.end()
+            if pos == len(pattern):
+                break
+            if pattern[pos] != '.':
+                raise ValueError(f'Invalid attribute path pattern: {pattern!r}')
+            pos += 1
+        patterns.append(tuple(segments))
+    return _dedupe(tuple(patterns))
 
-            for idx, repeated_object in generator:
-                nested_attrs, nested_values = flatten_proto_to_list(repeated_object)
-                if type(idx) is str:
-                    nested_attrs = [f'{field.name}["{idx}"].{attr}' for attr in nested_attrs]
-                else:
-                    nested_attrs = [f'{field.name}[{idx}].{attr}' for attr in nested_attrs]
-                values.extend(nested_values)
-                attrs.extend(nested_attrs)
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def get_projected_plan(descriptor: Descriptor, patterns: Tuple) -> Tuple:
+    """Filters the flattening plan of a descriptor down to the steps at least one pattern can
+    match. Each kept step is paired with what is selected below it:
+        nested messages: the remaining patterns, None when the whole subtree is selected.
+        repeated scalars and scalar maps: the index or key globs, None when every element is
+            selected.
+        repeated messages and message maps: (index or key glob, remaining patterns) pairs, see
+            select_element.
+    Projected plans are cached per descriptor and patterns.
+    Args:
+        descriptor (Descriptor): descriptor of the protobuf message.
+        patterns (Tuple): patterns from parse_projection.
+    Returns:
+        Tuple: (PlanStep, selection) pairs ordered by field number.
+    """
+    projected = []
+    for step in get_flatten_plan(descriptor):
+        singular = step.kind in (STEP_SCALAR, STEP_NESTED_MESSAGE)
+        leaf = step.kind in (STEP_SCALAR, STEP_REPEATED_SCALAR, STEP_SCALAR_MAP)
+        selections: Dict[Optional[str], Optional[Tuple]] = {}
+        for pattern in patterns:
+            (name_glob, selector), rest = pattern[0], pattern[1:]
+            if not fnmatchcase(step.name, name_glob):
+                continue
+            if singular and selector is not None:
+                continue
+            if not singular and selector is None:
+                selector = '*'
+            if leaf and rest:
+                continue
+            current = selections.get(selector, ())
+            if current is not None:
+                selections[selector] = current + (rest,) if rest else None
+        if not selections:
             continue
 
-        # Handle list of scalars
-        if field.label == FieldDescriptor.LABEL_REPEATED:
+        if step.kind == STEP_SCALAR:
+            projected.append((step, None))
+        elif step.kind == STEP_NESTED_MESSAGE:
+            projected.append((step, _dedupe(selections[None])))
+        elif leaf:
+            projected.append((step, None if '*' in selections else tuple(selections)))
+        else:
+            projected.append((step, tuple(
+                (selector, _dedupe(sub_patterns))
+                for selector, sub_patterns in selections.items())))
+    return tuple(projected)
+
+
+def select_element(selection: Tuple, key: Any) -> Any:
+    """Returns the patterns selected below one element of a repeated message or message map.
+    Args:
+        selection (Tuple): selection of the field from get_projected_plan.
+        key (Any): index or key of the element.
+    Returns:
+        Any: remaining patterns, None when the whole element is selected and SKIP_ELEMENT when
+            it is not selected.
+    """
+    matched = [
+        sub_patterns for selector, sub_patterns in selection
+        if selector == '*' or fnmatchcase(str(key), selector)
+    ]
+    if not matched:
+        return SKIP_ELEMENT
+    if len(matched) == 1:
+        return matched[0]
+    if None in matched:
+        return None
+    return _dedupe(tuple(pattern for sub_patterns in matched for pattern in sub_patterns))
+
+
+def match_selectors(selectors: Tuple[str, ...], key: Any) -> bool:
+    """Returns whether an element of a repeated scalar or scalar map is selected.
+    Args:
+        selectors (Tuple[str, ...]): index or key globs from get_projected_plan.
+        key (Any): index or key of the element.
+    Returns:
+        bool: True when a glob matches the element.
+    """
+    key = str(key)
+    return any(fnmatchcase(key, selector) for selector in selectors)
+
+
+def finish_column(column: List) -> Tuple[Any, Any]:
+    """Converts a column built by flatten_protos_to_columns to its returned values and validity
+    mask, numpy arrays when numpy is installed.
+    Args:
+        column (List): [values, validity mask, value of missing rows], values are an array.array
+            for typed columns and a list otherwise, the mask an array.array('b').
+    Returns:
+        Tuple[Any, Any]: values and validity mask.
+    """
+    values, mask, _ = column
+    if numpy is None:
+        return values, mask
+    mask = numpy.frombuffer(mask, dtype=numpy.bool_)
+    if isinstance(values, list):
+        object_values = numpy.empty(len(values), dtype=object)
+        object_values[:] = values
+        return object_values, mask
+    if values.typecode == 'b':
+        return numpy.frombuffer(values, dtype=numpy.bool_), mask
+    return numpy.frombuffer(values, dtype=values.typecode), mask
+# endregion
+
+
+# region Private Methods
+def _run_plan(
+        obj: ProtoAny, prefix: str, attrs: List, values: List, fields: List = None) -> None:
+    # Nested plans are looked up lazily so compiling a descriptor never recurses into its
+    # children. Attribute prefixes are threaded down instead of rewriting the nested lists.
+    # When a fields list is provided the descriptor of every emitted value is recorded too.
+    for kind, name, field, message_type in get_flatten_plan(obj.DESCRIPTOR):
+        value = getattr(obj, name)
+
+        if kind == STEP_SCALAR:
+            values.append(value)
+            attrs.append(f'{prefix}{name}')
+            if fields is not None:
+                fields.append(field)
+
+        elif kind == STEP_NESTED_MESSAGE:
+            _run_plan(value, f'{prefix}{name}.', attrs, values, fields)
+
+        elif kind == STEP_REPEATED_SCALAR:
             for idx, val in enumerate(value):
                 values.append(val)
-                attrs.append(f'{field.name}[{idx}]')
-            continue
+                attrs.append(f'{prefix}{name}[{idx}]')
+            if fields is not None:
+                fields.extend(repeat(field, len(value)))
 
-        # Handle scalars
-        values.append(value)
-        attrs.append(field.name)
-    return attrs, values
+        elif kind == STEP_SCALAR_MAP:
+            # map order cannot be guaranteed so to support as much consistency as possible
+            # for maps that have fixed structures, sort the keys and use sorted order to
+            # generate list.
+            for key in sorted(value.keys()):
+                attrs.append(f'{prefix}{name}["{key}"]')
+                values.append(value[key])
+            if fields is not None:
+                fields.extend(repeat(field.message_type.fields_by_name['value'], len(value)))
+
+        elif kind == STEP_MESSAGE_MAP:
+            # sorted like scalar maps, the iteration order of a message map changes when the
+            # object is serialized and parsed again
+            for key in sorted(value.keys()):
+                repeated_object = value[key]
+                if type(key) is str:
+                    _run_plan(repeated_object, f'{prefix}{name}["{key}"].', attrs, values, fields)
+                else:
+                    _run_plan(repeated_object, f'{prefix}{name}[{key}].', attrs, values, fields)
+
+        else:
+            for idx, repeated_object in enumerate(value):
+                _run_plan(repeated_object, f'{prefix}{name}[{idx}].', attrs, values, fields)
+
+
+def _run_projected_plan(
+        obj: ProtoAny,
+        patterns: Tuple,
+        prefix: str,
+        attrs: List,
+        values: List,
+        fields: List = None) -> None:
+    # Same as _run_plan but only for the steps and elements selected by the remaining patterns.
+    # Once every remaining pattern is consumed the rest of the subtree is run unprojected.
+    for (kind, name, field, message_type), selection in get_projected_plan(
+            obj.DESCRIPTOR, patterns):
+        value = getattr(obj, name)
+
+        if kind == STEP_SCALAR:
+            values.append(value)
+            attrs.append(f'{prefix}{name}')
+            if fields is not None:
+                fields.append(field)
+
+        elif kind == STEP_NESTED_MESSAGE:
+            _run_selected(value, selection, f'{prefix}{name}.', attrs, values, fields)
+
+        elif kind == STEP_REPEATED_SCALAR:
+            for idx, val in enumerate(value):
+                if selection is None or match_selectors(selection, idx):
+                    values.append(val)
+                    attrs.append(f'{prefix}{name}[{idx}]')
+                    if fields is not None:
+                        fields.append(field)
+
+        elif kind == STEP_SCALAR_MAP:
+            value_field = field.message_type.fields_by_name['value']
+            for key in sorted(value.keys()):
+                if selection is None or match_selectors(selection, key):
+                    attrs.append(f'{prefix}{name}["{key}"]')
+                    values.append(value[key])
+                    if fields is not None:
+                        fields.append(value_field)
+
+        elif kind == STEP_MESSAGE_MAP:
+            for key in sorted(value.keys()):
+                repeated_object = value[key]
+                sub_patterns = select_element(selection, key)
+                if sub_patterns is SKIP_ELEMENT:
+                    continue
+                if type(key) is str:
+                    sub_prefix = f'{prefix}{name}["{key}"].'
+                else:
+                    sub_prefix = f'{prefix}{name}[{key}].'
+                _run_selected(repeated_object, sub_patterns, sub_prefix, attrs, values, fields)
+
+        else:
+            for idx, repeated_object in enumerate(value):
+                sub_patterns = select_element(selection, idx)
+                if sub_patterns is not SKIP_ELEMENT:
+                    _run_selected(
+                        repeated_object,
+                        sub_patterns,
+                        f'{prefix}{name}[{idx}].',
+                        attrs,
+                        values,
+                        fields)
+
+
+def _run_selected(
+        obj: ProtoAny,
+        patterns: Optional[Tuple],
+        prefix: str,
+        attrs: List,
+        values: List,
+        fields: List) -> None:
+    if patterns is None:
+        _run_plan(obj, prefix, attrs, values, fields)
+    else:
+        _run_projected_plan(obj, patterns, prefix, attrs, values, fields)
+
+
+def _dedupe(patterns: Optional[Tuple]) -> Optional[Tuple]:
+    return None if patterns is None else tuple(dict.fromkeys(patterns))
+
+
+def _new_column(field: FieldDescriptor) -> List:
+    # a column is [values, validity mask, value used for missing rows]
+    typecode = _COLUMN_TYPECODES.get(field.cpp_type)
+    if typecode is None:
+        return [[], array('b'), None]
+    return [array(typecode), array('b'), 0]
+
+
+def _pad_column(column: List, row_count: int) -> None:
+    # fill rows that did not have this attribute so the column lines up with the current row
+    missing = row_count - len(column[1])
+    if missing:
+        column[0].extend(repeat(column[2], missing))
+        column[1].frombytes(bytes(missing))
+# endregion
@@ -0,0 +1,239 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+# Stages timed by the csv writers: flattening objects to attributes and values, converting the
+# values to a csv line, writing rows to the temporary file and producing the final csv file.
+STAGE_FLATTEN = 'flatten'
+STAGE_STRINGIFY = 'stringify'
+STAGE_WRITE = 'write'
+STAGE_POST_PROCESS = 'post_process'
+
+# Counters and gauges recorded per message type.
+COUNTER_ROWS = 'rows'
+COUNTER_BYTES = 'bytes'
+COUNTER_SCHEMA_WIDENINGS = 'schema_widenings'
+GAUGE_COLUMNS = 'columns'
+
+# Prefix of the exported prometheus metric names.
+PROMETHEUS_PREFIX = 'protobuf_utility'
+
+# Registry the transforms record to, nothing is recorded while it is None.
+_active_registry = None
+
+
+class StageTiming(NamedTuple):
+    """Time spent in one stage for one message type.
+    Attributes:
+        calls (int): number of times the stage ran.
+        wall (float): wall clock seconds.
+        cpu (float): process cpu seconds.
+    """
+    calls: int
+    wall: float
+    cpu: float
+
+
+class MetricsRegistry:
+    """Collects the stage timings, counters and gauges the transforms record per message type.
+    Subclasses can override add_time, increment and set_gauge to forward the measurements to
+    another metrics system. Only the current process is recorded, the worker processes of
+    flatten_mixed_proto_stream_to_csv keep their own measurements.
+    Attributes:
+        timings (Dict[Tuple[str, str], List]): [calls, wall, cpu] of each (stage, type name).
+        counters (Dict[Tuple[str, str], int]): value of each (counter name, type name).
+        gauges (Dict[Tuple[str, str], float]): last value of each (gauge name, type name).
+    """
+
+    def __init__(self) -> None:
+        self.timings: Dict[Tuple[str, str], List] = {}
+        self.counters: Dict[Tuple[str, str], int] = {}
+        self.gauges: Dict[Tuple[str, str], float] = {}
+
+    def add_time(self, stage: str, type_name: str, wall: float, cpu: float) -> None:
+        """Adds one run of a stage.
+        Args:
+            stage (str): name of the stage.
+            type_name (str): DESCRIPTOR.full_name of the message type.
+            wall (float): wall clock seconds of the run.
+            cpu (float): process cpu seconds of the run.
+        """
+        timing = self.timings.get((stage, type_name))
+        if timing is None:
+            timing = self.timings[(stage, type_name)] = [0, 0.0, 0.0]
+        timing[0] += 1
+        timing[1] += wall
+        timing[2] += cpu
+
+    def increment(self, name: str, type_name: str, value: int = 1) -> None:
+        """Increments a counter.
+        Args:
+            name (str): name of the counter.
+            type_name (str): DESCRIPTOR.full_name of the message type.
+            value (int): amount to add.
+        """
+        key = (name, type_name)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, type_name: str, value: float) -> None:
+        """Sets a gauge.
+        Args:
+            name (str): name of the gauge.
+            type_name (str): DESCRIPTOR.full_name of the message type.
+            value (float): current value.
+        """
+        self.gauges[(name, type_name)] = value
+
+    def timing(self, stage: str, type_name: str) -> StageTiming:
+        """Returns the time spent in a stage for a message type.
+        Args:
+            stage (str): name of the stage.
+            type_name (str): DESCRIPTOR.full_name of the message type.
+        Returns:
+            StageTiming: runs and seconds of the stage, zeros when it never ran.
+        """
+        return StageTiming(*self.timings.get((stage, type_name), (0, 0.0, 0.0)))
+
+    def clear(self) -> None:
+        """Drops every measurement."""
+        self.timings.clear()
+        self.counters.clear()
+        self.gauges.clear()
+
+    def to_dict(self) -> Dict[str, Dict]:
+        """Returns the measurements grouped by message type.
+        Returns:
+            Dict[str, Dict]: for each type name its 'stages' ({stage: {calls, wall_seconds,
+                cpu_seconds}}), 'counters' and 'gauges'.
+        """
+        types: Dict[str, Dict] = {}
+
+        def get_type(type_name: str) -> Dict:
+            entry = types.get(type_name)
+            if entry is None:
+                entry = types[type_name] = {'stages': {}, 'counters': {}, 'gauges': {}}
+            return entry
+
+        for (stage, type_name), (calls, wall, cpu) in sorted(self.timings.items()):
+            get_type(type_name)['stages'][stage] = {
+                'calls': calls, 'wall_seconds': wall, 'cpu_seconds': cpu}
+        for (name, type_name), value in sorted(self.counters.items()):
+            get_type(type_name)['counters'][name] = value
+        for (name, type_name), value in sorted(self.gauges.items()):
+            get_type(type_name)['gauges'][name] = value
+        return {type_name: types[type_name] for type_name in sorted(types)}
+
+    def to_prometheus(self, prefix: str = PROMETHEUS_PREFIX) -> str:
+        """Formats the measurements in the prometheus text exposition format. Stage timings become
+        the counters <prefix>_stage_calls_total, <prefix>_stage_wall_seconds_total and
+        <prefix>_stage_cpu_seconds_total labelled by stage and type, counters become
+        <prefix>_<name>_total and gauges <prefix>_<name> labelled by type.
+        Args:
+            prefix (str): prefix of the metric names.
+        Returns:
+            str: metrics text.
+        """
+        lines: List[str] = []
+        timings = sorted(self.timings.items())
+        for position, (suffix, description) in enumerate((
+                ('stage_calls_total', 'Number of runs of each stage.'),
+                ('stage_wall_seconds_total', 'Wall clock seconds spent in each stage.'),
+                ('stage_cpu_seconds_total', 'Process cpu seconds spent in each stage.'))):
+            _add_prometheus_family(lines, f'{prefix}_{suffix}', 'counter', description, [
+                (f'stage="{_escape_label(stage)}",type="{_escape_label(type_name)}"',
+                 timing[position])
+                for (stage, type_name), timing in timings
+            ])
+        for values, metric_type, suffix in (
+                (self.counters, 'counter', '_total'), (self.gauges, 'gauge', '')):
+            names = sorted({name for name, _ in values})
+            for name in names:
+                _add_prometheus_family(
+                    lines, f'{prefix}_{name}{suffix}', metric_type,
+                    f'{name.replace("_", " ").capitalize()} per message type.', [
+                        (f'type="{_escape_label(type_name)}"', value)
+                        for (value_name, type_name), value in sorted(values.items())
+                        if value_name == name
+                    ])
+        return ''.join(lines)
+
+    def write_json(self, path: Path) -> None:
+        """Writes the measurements of to_dict to a json file. The file is replaced atomically so
+        readers never see a partial file.
+        Args:
+            path (Path): json file to write.
+        """
+        _write_atomic(path, json.dumps(self.to_dict(), indent=2) + '\n')
+
+    def write_prometheus(self, path: Path, prefix: str = PROMETHEUS_PREFIX) -> None:
+        """Writes the measurements of to_prometheus to a text file, e.g. for the textfile
+        collector of the node exporter. The file is replaced atomically so scrapers never see a
+        partial file.
+        Args:
+            path (Path): text file to write, named *.prom for the textfile collector.
+            prefix (str): prefix of the metric names.
+        """
+        _write_atomic(path, self.to_prometheus(prefix))
+
+
+# region Public Methods
+def enable_metrics(registry: Optional[MetricsRegistry] = None) -> MetricsRegistry:
+    """Makes the transforms record their measurements to a registry. Streams look the registry
+    up when they are created, so streams that already exist keep recording to the registry they
+    started with.
+    Args:
+        registry (Optional[MetricsRegistry]): registry to record to, a new one when None.
+    Returns:
+        MetricsRegistry: the active registry.
+    """
+    global _active_registry
+    _active_registry = MetricsRegistry() if registry is None else registry
+    return _active_registry
+
+
+def disable_metrics() -> Optional[MetricsRegistry]:
+    """Stops recording measurements for new streams.
+    Returns:
+        Optional[MetricsRegistry]: the registry that was active, if any.
+    """
+    global _active_registry
+    registry, _active_registry = _active_registry, None
+    return registry
+
+
+def get_metrics() -> Optional[MetricsRegistry]:
+    """Returns the active registry.
+    Returns:
+        Optional[MetricsRegistry]: the registry the transforms record to, None when disabled.
+    """
+    return _active_registry
+# endregion
+
+
+# region Private Methods
+def _add_prometheus_family(
+        lines: List[str],
+        name: str,
+        metric_type: str,
+        description: str,
+        samples: List[Tuple[str, float]]) -> None:
+    if not samples:
+        return
+    lines.append(f'# HELP {name} {description}\n')
+    lines.append(f'# TYPE {name} {metric_type}\n')
+    for labels, value in samples:
+        lines.append(f'{name}{{{labels}}} {value!r}\n')
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w') as out_f:
+        out_f.write(text)
+    os.replace(temp_path, path)
+# endregion
@@ -0,0 +1,298 @@
+from operator import attrgetter
+from pathlib import Path
+import sqlite3
+import time
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from google.protobuf.any_pb2 import Any as ProtoAny
+from google.protobuf.descriptor import Descriptor, FieldDescriptor
+
+from protobuf_utility.schema.sqlite_schema import ID_COLUMN
+from protobuf_utility.schema.sqlite_schema import KEY_COLUMN
+from protobuf_utility.schema.sqlite_schema import TABLE_REPEATED
+from protobuf_utility.schema.sqlite_schema import TableSchema
+from protobuf_utility.schema.sqlite_schema import create_index_statements
+from protobuf_utility.schema.sqlite_schema import create_table_statement
+from protobuf_utility.schema.sqlite_schema import get_table_schemas
+from protobuf_utility.schema.sqlite_schema import quote_identifier
+
+
+# Number of protobuf objects whose rows are buffered before they are inserted.
+DEFAULT_BATCH_SIZE = 4096
+
+# Settings applied to the connection before loading, trading durability of a crash during the
+# load for speed. They can be overridden per load.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'OFF',
+    'cache_size': -262144,
+    'temp_store': 'MEMORY',
+}
+
+_UINT64_SIGN = 1 << 63
+
+
+class TableLoadStats(NamedTuple):
+    """Counters of a table reported by load_protos_to_sqlite.
+    Attributes:
+        rows (int): rows inserted into the table.
+        insert_seconds (float): seconds spent inserting the rows of the table.
+        rows_per_second (float): rows inserted per second of the whole load.
+    """
+    rows: int
+    insert_seconds: float
+    rows_per_second: float
+
+
+class LoadStats(NamedTuple):
+    """Counters reported by load_protos_to_sqlite.
+    Attributes:
+        messages (int): protobuf objects loaded.
+        elapsed (float): seconds spent loading, including creating the indexes.
+        index_seconds (float): seconds spent creating the indexes after the rows were inserted.
+        tables (Dict[str, TableLoadStats]): counters of each table rows were inserted into.
+    """
+    messages: int
+    elapsed: float
+    index_seconds: float
+    tables: Dict[str, TableLoadStats]
+
+
+# region Public Methods
+def load_protos_to_sqlite(
+        objs: Iterable[ProtoAny],
+        database: Union[str, Path, sqlite3.Connection],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        pragmas: Optional[Dict[str, Any]] = None,
+        create_indexes: bool = True) -> LoadStats:
+    """Loads a stream of protobuf objects into the SQLite tables generated by get_table_schemas,
+    creating the tables of each type the first time it is seen. Rows are built by cached plans
+    per descriptor that read the columns of a message with a single attrgetter call and
+    buffered per table, every batch_size objects they are inserted with one executemany per
+    table. The whole load runs in a single transaction and the indexes are created once the rows
+    are inserted. Every row gets an _id continuing after the largest _id already in its table.
+    uint64 values of 2**63 and more are stored as negative integers (two's complement), as
+    SQLite integers are signed.
+    Args:
+        objs (Iterable[ProtoAny]): protobuf objects of any types to load.
+        database (Union[str, Path, sqlite3.Connection]): database file or open connection.
+        batch_size (int): number of objects whose rows are buffered before they are inserted.
+        pragmas (Optional[Dict[str, Any]]): PRAGMA settings overriding DEFAULT_PRAGMAS.
+        create_indexes (bool): create the indexes of the child tables after the load.
+    Returns:
+        LoadStats: number of rows and rows per second of each table.
+    """
+    started = time.perf_counter()
+    connection = database if isinstance(database, sqlite3.Connection) else sqlite3.connect(
+        str(database))
+    try:
+        settings = dict(DEFAULT_PRAGMAS)
+        settings.update(pragmas or {})
+        if connection.in_transaction:
+            connection.commit()
+        for name, value in settings.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+
+        plans: Dict[Descriptor, _TablePlan] = {}
+        messages = 0
+        pending = 0
+        for obj in objs:
+            descriptor = obj.DESCRIPTOR
+            plan = plans.get(descriptor)
+            if plan is None:
+                plan = plans[descriptor] = _create_tables(connection, descriptor)
+            _add_message_row(plan, obj, ())
+            pending += 1
+            if pending >= batch_size:
+                for root in plans.values():
+                    _insert_rows(connection, root)
+                pending = 0
+            messages += 1
+        for root in plans.values():
+            _insert_rows(connection, root)
+        connection.commit()
+
+        index_started = time.perf_counter()
+        if create_indexes:
+            for root in plans.values():
+                for plan in _iter_plans(root):
+                    for statement in create_index_statements(plan.table):
+                        connection.execute(statement)
+            connection.commit()
+        finished = time.perf_counter()
+    finally:
+        if connection is not database:
+            connection.close()
+
+    elapsed = finished - started
+    tables = {}
+    for root in plans.values():
+        for plan in _iter_plans(root):
+            rows = plan.next_id - plan.first_id
+            tables[plan.table.name] = TableLoadStats(
+                rows, plan.insert_seconds, rows / elapsed if elapsed else 0.0)
+    return LoadStats(messages, elapsed, finished - index_started, tables)
+# endregion
+
+
+# region Private Classes
+class _TablePlan:
+    # compiled row builder of a table and the plans of its child tables
+    __slots__ = (
+        'table',
+        'insert',
+        'getter',
+        'single',
+        'converters',
+        'container',
+        'children',
+        'rows',
+        'first_id',
+        'next_id',
+        'insert_seconds')
+
+    def __init__(self, table: TableSchema, first_id: int) -> None:
+        self.table = table
+        placeholders = ', '.join('?' * len(table.columns))
+        self.insert = f'INSERT INTO {quote_identifier(table.name)} VALUES ({placeholders})'
+
+        # the values of every field column are read with one call, nested singular messages
+        # are read through dotted attribute names
+        data_columns = [column for column in table.columns if column.path]
+        names = ['.'.join(column.path) for column in data_columns]
+        self.getter: Optional[Callable] = attrgetter(*names) if names else None
+        self.single = len(names) == 1
+        self.converters: List[Tuple[int, Callable]] = []
+        for position, column in enumerate(table.columns):
+            field = column.field
+            if column.name == KEY_COLUMN and column.path is None:
+                field = table.field.message_type.fields_by_name['key']
+            converter = _get_converter(field)
+            if converter is not None:
+                self.converters.append((position, converter))
+        self.container = attrgetter('.'.join(table.path)) if table.path else None
+        self.children: List[_TablePlan] = []
+        self.rows: List[tuple] = []
+        self.first_id = first_id
+        self.next_id = first_id
+        self.insert_seconds = 0.0
+# endregion
+
+
+# region Private Methods
+def _create_tables(connection: sqlite3.Connection, descriptor: Descriptor) -> _TablePlan:
+    # creates the tables of a descriptor and returns the plan of its message table
+    plans: Dict[str, _TablePlan] = {}
+    root = None
+    for table in get_table_schemas(descriptor):
+        connection.execute(create_table_statement(table))
+        last_id = connection.execute(
+            f'SELECT MAX({quote_identifier(ID_COLUMN)}) FROM {quote_identifier(table.name)}'
+        ).fetchone()[0]
+        plan = plans[table.name] = _TablePlan(table, (last_id or 0) + 1)
+        if table.parent is None:
+            root = plan
+        else:
+            plans[table.parent].children.append(plan)
+    return root
+
+
+def _add_message_row(plan: _TablePlan, obj: ProtoAny, prefix: tuple) -> None:
+    # adds the row of a message and the rows of its repeated and map fields
+    row_id = plan.next_id
+    plan.next_id += 1
+    getter = plan.getter
+    if getter is None:
+        row = (row_id,) + prefix
+    elif plan.single:
+        row = (row_id,) + prefix + (getter(obj),)
+    else:
+        row = (row_id,) + prefix + getter(obj)
+    if plan.converters:
+        row = _convert(row, plan.converters)
+    plan.rows.append(row)
+
+    for child in plan.children:
+        container = child.container(obj)
+        if not container:
+            continue
+        if child.table.kind == TABLE_REPEATED:
+            elements = enumerate(container)
+        else:
+            elements = container.items()
+        if child.children:
+            for position, element in elements:
+                _add_message_row(child, element, (row_id, position))
+            continue
+
+        # rows of elements without repeated or map fields are built in one pass
+        first_id = child.next_id
+        child.next_id += len(container)
+        getter = child.getter
+        if child.table.descriptor is None:
+            rows = [
+                (element_id, row_id, position, value)
+                for element_id, (position, value) in enumerate(elements, first_id)
+            ]
+        elif getter is None:
+            rows = [
+                (element_id, row_id, position)
+                for element_id, (position, _) in enumerate(elements, first_id)
+            ]
+        elif child.single:
+            rows = [
+                (element_id, row_id, position, getter(value))
+                for element_id, (position, value) in enumerate(elements, first_id)
+            ]
+        else:
+            rows = [
+                (element_id, row_id, position) + getter(value)
+                for element_id, (position, value) in enumerate(elements, first_id)
+            ]
+        if child.converters:
+            rows = [_convert(row, child.converters) for row in rows]
+        child.rows.extend(rows)
+
+
+def _insert_rows(connection: sqlite3.Connection, plan: _TablePlan) -> None:
+    # inserts the buffered rows of a table and its child tables
+    if plan.rows:
+        started = time.perf_counter()
+        connection.executemany(plan.insert, plan.rows)
+        plan.insert_seconds += time.perf_counter() - started
+        plan.rows = []
+    for child in plan.children:
+        _insert_rows(connection, child)
+
+
+def _iter_plans(plan: _TablePlan) -> Iterable[_TablePlan]:
+    yield plan
+    for child in plan.children:
+        yield from _iter_plans(child)
+
+
+def _convert(row: tuple, converters: List[Tuple[int, Callable]]) -> tuple:
+    values = list(row)
+    for position, converter in converters:
+        values[position] = converter(values[position])
+    return tuple(values)
+
+
+def _get_converter(field: Optional[FieldDescriptor]) -> Optional[Callable]:
+    # values that sqlite3 can not bind directly
+    if field is None:
+        return None
+    if field.cpp_type == FieldDescriptor.CPPTYPE_UINT64:
+        return _to_signed64
+    if field.cpp_type == FieldDescriptor.CPPTYPE_MESSAGE:
+        return _serialize
+    return None
+
+
+def _to_signed64(value: int) -> int:
+    return value - (1 << 64) if value >= _UINT64_SIGN else value
+
+
+def _serialize(obj: ProtoAny) -> bytes:
+    return obj.SerializeToString()
+# endregion
@@ -0,0 +1,371 @@
+import ast
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from google.protobuf.any_pb2 import Any as ProtoAny
+from google.protobuf.descriptor import Descriptor, FieldDescriptor
+
+from protobuf_utility.transforms.list_transformer import PLAN_CACHE_SIZE
+from protobuf_utility.transforms.list_transformer import STEP_MESSAGE_MAP
+from protobuf_utility.transforms.list_transformer import STEP_NESTED_MESSAGE
+from protobuf_utility.transforms.list_transformer import PATTERN_SEGMENT
+from protobuf_utility.transforms.list_transformer import STEP_REPEATED_MESSAGE
+from protobuf_utility.transforms.list_transformer import STEP_REPEATED_SCALAR
+from protobuf_utility.transforms.list_transformer import STEP_SCALAR
+from protobuf_utility.transforms.list_transformer import STEP_SCALAR_MAP
+from protobuf_utility.transforms.list_transformer import get_flatten_plan
+
+_INTEGER_CPPTYPES = (
+    FieldDescriptor.CPPTYPE_INT32,
+    FieldDescriptor.CPPTYPE_INT64,
+    FieldDescriptor.CPPTYPE_UINT32,
+    FieldDescriptor.CPPTYPE_UINT64,
+)
+_FLOAT_CPPTYPES = (
+    FieldDescriptor.CPPTYPE_DOUBLE,
+    FieldDescriptor.CPPTYPE_FLOAT,
+)
+_TRUE_VALUES = frozenset(('True', 'true', '1'))
+
+
+# region Public Methods
+def unflatten_csv_to_proto(attrs: str, values: str, message_class: type) -> ProtoAny:
+    """Rebuilds a protobuf object from the csv strings of flatten_proto_to_csv.
+    Args:
+        attrs (str): csv string of attributes.
+        values (str): csv string of values.
+        message_class (type): protobuf class of the object.
+    Returns:
+        ProtoAny: the protobuf object.
+    """
+    obj = message_class()
+    # an object without set fields flattens to no attributes
+    if not attrs:
+        return obj
+    plan = _get_unflatten_plan(message_class.DESCRIPTOR, tuple(attrs.split(',')))
+    _run_unflatten_plan(plan, obj, values.split(','))
+    return obj
+
+
+def unflatten_list_to_proto(
+        attrs: Iterable[str], values: Iterable, message_class: type) -> ProtoAny:
+    """Rebuilds a protobuf object from the lists of flatten_proto_to_list. Values may be the
+    values themselves or their csv strings.
+    Args:
+        attrs (Iterable[str]): object attributes.
+        values (Iterable): values matching the attributes.
+        message_class (type): protobuf class of the object.
+    Returns:
+        ProtoAny: the protobuf object.
+    """
+    plan = _get_unflatten_plan(message_class.DESCRIPTOR, tuple(attrs))
+    obj = message_class()
+    _run_unflatten_plan(plan, obj, [
+        value if isinstance(value, str) else _to_cell(value) for value in values
+    ])
+    return obj
+
+
+def unflatten_csv_to_protos(
+        file_path: Path,
+        message_class: type,
+        serialized: bool = False) -> Iterator[Union[ProtoAny, bytes]]:
+    """Streams the protobuf objects of a csv file written by flatten_same_proto_stream_to_csv.
+    The header is compiled once into a setter plan and every line is rebuilt by running the plan,
+    lines are read one at a time so memory does not grow with the file. Empty cells are missing
+    attributes, so empty strings at the end of a repeated string field are not restored. Cells
+    are not quoted, so strings and bytes containing a comma cannot be read back and their rows
+    raise a ValueError.
+    Args:
+        file_path (Path): csv file to read.
+        message_class (type): protobuf class of the rows.
+        serialized (bool): yield the serialized bytes of each object instead of the object, a
+            single object is then reused for every row.
+    Returns:
+        Iterator[Union[ProtoAny, bytes]]: protobuf objects or their serialized bytes.
+    """
+    with open(file_path, 'r', newline='') as csv_f:
+        header = csv_f.readline().rstrip('\r\n')
+        if not header:
+            return
+        attrs = tuple(header.split(','))
+        plan = _get_unflatten_plan(message_class.DESCRIPTOR, attrs)
+        width = len(attrs)
+        obj = message_class() if serialized else None
+        for line_number, line in enumerate(csv_f, 2):
+            cells = line.rstrip('\r\n').split(',')
+            if len(cells) < width:
+                cells.extend([''] * (width - len(cells)))
+            elif len(cells) > width:
+                raise ValueError(
+                    f'Line {line_number} of {file_path} has {len(cells)} cells for {width} '
+                    f'columns, a value contains a comma')
+            if serialized:
+                obj.Clear()
+                _run_unflatten_plan(plan, obj, cells)
+                yield obj.SerializeToString()
+            else:
+                row_obj = message_class()
+                _run_unflatten_plan(plan, row_obj, cells)
+                yield row_obj
+# endregion
+
+
+# region Private Classes
+class _UnflattenNode:
+    # setters of the columns below one message, grouped by the kind of field they set
+    __slots__ = (
+        'scalars',
+        'nested',
+        'repeated_scalars',
+        'scalar_maps',
+        'repeated_messages',
+        'message_maps',
+        'columns')
+
+    def __init__(self) -> None:
+        # (column, name, converter, value left unset)
+        self.scalars: List[Tuple[int, str, Callable, Any]] = []
+        # name -> node
+        self.nested: Dict[str, _UnflattenNode] = {}
+        # name -> (default, {index: (column, converter)})
+        self.repeated_scalars: Dict[str, Tuple[Any, Dict[int, Tuple[int, Callable]]]] = {}
+        # name -> (converter, {key: column})
+        self.scalar_maps: Dict[str, Tuple[Callable, Dict[Any, int]]] = {}
+        # name -> {index: node}
+        self.repeated_messages: Dict[str, Dict[int, _UnflattenNode]] = {}
+        # name -> {key: node}
+        self.message_maps: Dict[str, Dict[Any, _UnflattenNode]] = {}
+        # every column set below the node
+        self.columns: List[int] = []
+# endregion
+
+
+# region Private Methods
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _get_unflatten_plan(descriptor: Descriptor, attrs: Tuple[str, ...]) -> _UnflattenNode:
+    # Compiles the attribute paths of a csv header into a setter plan. Every path, such as
+    # field.sub[3].x or map["key"].y, is resolved once against the flattening plan of the
+    # descriptor into the column's field, the position or key of its element and a converter
+    # from the csv string. Plans are cached per descriptor and header.
+    root = _UnflattenNode()
+    for column, attr in enumerate(attrs):
+        try:
+            segments = _parse_attr(attr)
+        except ValueError:
+            raise ValueError(f'Invalid attribute path {attr!r}') from None
+        _add_column(root, descriptor, segments, column, attr)
+    _finish_node(root)
+    return root
+
+
+def _run_unflatten_plan(node: _UnflattenNode, obj: ProtoAny, cells: List[str]) -> None:
+    # sets the non empty cells of a row on a protobuf object
+    for column, name, convert, unset in node.scalars:
+        cell = cells[column]
+        if cell:
+            value = convert(cell)
+            if value != unset:
+                setattr(obj, name, value)
+
+    for name, child in node.nested:
+        if any(cells[column] for column in child.columns):
+            _run_unflatten_plan(child, getattr(obj, name), cells)
+
+    for name, default, elements in node.repeated_scalars:
+        values = [
+            (index, convert, cells[column]) for index, (column, convert) in elements
+            if cells[column]]
+        if values:
+            # positions before the last present element are kept, missing ones as defaults
+            container = [default] * (values[-1][0] + 1)
+            for index, convert, cell in values:
+                container[index] = convert(cell)
+            getattr(obj, name).extend(container)
+
+    for name, convert, entries in node.scalar_maps:
+        container = None
+        for key, column in entries:
+            cell = cells[column]
+            if cell:
+                if container is None:
+                    container = getattr(obj, name)
+                container[key] = convert(cell)
+
+    for name, elements in node.repeated_messages:
+        container = None
+        for index, child in elements:
+            if any(cells[column] for column in child.columns):
+                if container is None:
+                    container = getattr(obj, name)
+                while len(container) <= index:
+                    container.add()
+                _run_unflatten_plan(child, container[index], cells)
+
+    for name, entries in node.message_maps:
+        container = None
+        for key, child in entries:
+            if any(cells[column] for column in child.columns):
+                if container is None:
+                    container = getattr(obj, name)
+                _run_unflatten_plan(child, container[key], cells)
+
+
+def _add_column(
+        node: _UnflattenNode,
+        descriptor: Descriptor,
+        segments: List[Tuple[str, Optional[str], Optional[str]]],
+        column: int,
+        attr: str) -> None:
+    # resolves the remaining segments of a column path below a message
+    name, key, index = segments[0]
+    step = _get_steps(descriptor).get(name)
+    selector = key if key is not None else index
+    last = len(segments) == 1
+    kind = None if step is None else step.kind
+    node.columns.append(column)
+
+    if kind == STEP_SCALAR and last and selector is None:
+        # flattening writes unset fields as their defaults, so defaults are never set and oneof
+        # members written alongside the set one do not replace it
+        field = step.field
+        node.scalars.append((column, name, _get_converter(field, attr), field.default_value))
+    elif kind == STEP_NESTED_MESSAGE and not last and selector is None:
+        child = node.nested.get(name)
+        if child is None:
+            child = node.nested[name] = _UnflattenNode()
+        _add_column(child, step.message_type, segments[1:], column, attr)
+    elif kind == STEP_REPEATED_SCALAR and last and index is not None:
+        field = step.field
+        entry = node.repeated_scalars.get(name)
+        if entry is None:
+            entry = node.repeated_scalars[name] = (_get_element_default(field), {})
+        entry[1][int(index)] = (column, _get_converter(field, attr))
+    elif kind == STEP_SCALAR_MAP and last and selector is not None:
+        entry_fields = step.field.message_type.fields_by_name
+        entry = node.scalar_maps.get(name)
+        if entry is None:
+            entry = node.scalar_maps[name] = (_get_converter(entry_fields['value'], attr), {})
+        entry[1][_get_converter(entry_fields['key'])(selector)] = column
+    elif kind == STEP_REPEATED_MESSAGE and not last and index is not None:
+        elements = node.repeated_messages.setdefault(name, {})
+        child = elements.get(int(index))
+        if child is None:
+            child = elements[int(index)] = _UnflattenNode()
+        _add_column(child, step.message_type, segments[1:], column, attr)
+    elif kind == STEP_MESSAGE_MAP and not last and selector is not None:
+        key_field = step.field.message_type.fields_by_name['key']
+        entries = node.message_maps.setdefault(name, {})
+        map_key = _get_converter(key_field)(selector)
+        child = entries.get(map_key)
+        if child is None:
+            child = entries[map_key] = _UnflattenNode()
+        _add_column(child, step.message_type, segments[1:], column, attr)
+    else:
+        raise ValueError(f'Attribute path {attr!r} does not match {descriptor.full_name}')
+
+
+def _finish_node(node: _UnflattenNode) -> None:
+    # freezes the plan into tuples ordered by position so rows are rebuilt in one pass
+    for child in node.nested.values():
+        _finish_node(child)
+    for elements in node.repeated_messages.values():
+        for child in elements.values():
+            _finish_node(child)
+    for entries in node.message_maps.values():
+        for child in entries.values():
+            _finish_node(child)
+    node.scalars = tuple(node.scalars)
+    node.nested = tuple(node.nested.items())
+    node.repeated_scalars = tuple(
+        (name, default, tuple(sorted(elements.items())))
+        for name, (default, elements) in node.repeated_scalars.items())
+    node.scalar_maps = tuple(
+        (name, convert, tuple(entries.items()))
+        for name, (convert, entries) in node.scalar_maps.items())
+    node.repeated_messages = tuple(
+        (name, tuple(sorted(elements.items())))
+        for name, elements in node.repeated_messages.items())
+    node.message_maps = tuple(
+        (name, tuple(entries.items())) for name, entries in node.message_maps.items())
+    node.columns = tuple(node.columns)
+
+
+def _parse_attr(attr: str) -> List[Tuple[str, Optional[str], Optional[str]]]:
+    # splits an attribute path into (name, quoted key, index) segments
+    segments = []
+    pos = 0
+    while True:
+        match = PATTERN_SEGMENT.match(attr, pos)
+        if match is None:
+            raise ValueError(attr)
+        segments.append(match.groups())
+        pos = match.end()
+        if pos == len(attr):
+            return segments
+        if attr[pos] != '.':
+            raise ValueError(attr)
+        pos += 1
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _get_steps(descriptor: Descriptor) -> Dict[str, Any]:
+    return {step.name: step for step in get_flatten_plan(descriptor)}
+
+
+def _get_converter(field: FieldDescriptor, attr: str = '') -> Callable[[str], Any]:
+    # converts the csv string of a value back to the field's python type, attr names the column
+    # in errors
+    cpp_type = field.cpp_type
+    if cpp_type in _INTEGER_CPPTYPES:
+        return int
+    if cpp_type in _FLOAT_CPPTYPES:
+        return float
+    if cpp_type == FieldDescriptor.CPPTYPE_BOOL:
+        return _to_bool
+    if cpp_type == FieldDescriptor.CPPTYPE_ENUM:
+        numbers = {value.name: value.number for value in field.enum_type.values}
+        return lambda cell: numbers[cell] if cell in numbers else int(cell)
+    if field.type == FieldDescriptor.TYPE_BYTES:
+        return lambda cell: _to_bytes(cell, attr)
+    return str
+
+
+def _get_element_default(field: FieldDescriptor) -> Any:
+    # default_value of a repeated field is an empty list, elements default like singular fields
+    cpp_type = field.cpp_type
+    if cpp_type in _INTEGER_CPPTYPES:
+        return 0
+    if cpp_type in _FLOAT_CPPTYPES:
+        return 0.0
+    if cpp_type == FieldDescriptor.CPPTYPE_BOOL:
+        return False
+    if cpp_type == FieldDescriptor.CPPTYPE_ENUM:
+        return field.enum_type.values[0].number
+    if field.type == FieldDescriptor.TYPE_BYTES:
+        return b''
+    return ''
+
+
+def _to_bool(cell: str) -> bool:
+    return cell in _TRUE_VALUES
+
+
+def _to_bytes(cell: str, attr: str) -> bytes:
+    # flatten_proto_to_csv writes space separated hex, str(bytes) gives a b'..' literal which
+    # is cut in two when the bytes contain a comma
+    try:
+        if cell[:2] in ("b'", 'b"'):
+            return ast.literal_eval(cell)
+        return bytes.fromhex(cell)
+    except (SyntaxError, ValueError):
+        raise ValueError(f'Invalid bytes value {cell!r} in column {attr!r}') from None
+
+
+def _to_cell(value: Any) -> str:
+    # csv string of a value from flatten_proto_to_list
+    if isinstance(value, bytes):
+        return value.hex(' ')
+    return str(value)
+# endregion
@@ -0,0 +1,339 @@
+from functools import lru_cache
+import struct
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from google.protobuf.descriptor import Descriptor, FieldDescriptor
+
+from protobuf_utility.logger.segment import decode_varint
+from protobuf_utility.transforms.list_transformer import PLAN_CACHE_SIZE
+from protobuf_utility.transforms.list_transformer import STEP_MESSAGE_MAP
+from protobuf_utility.transforms.list_transformer import STEP_NESTED_MESSAGE
+from protobuf_utility.transforms.list_transformer import STEP_REPEATED_SCALAR
+from protobuf_utility.transforms.list_transformer import STEP_SCALAR
+from protobuf_utility.transforms.list_transformer import STEP_SCALAR_MAP
+from protobuf_utility.transforms.list_transformer import SKIP_ELEMENT
+from protobuf_utility.transforms.list_transformer import get_flatten_plan
+from protobuf_utility.transforms.list_transformer import get_projected_plan
+from protobuf_utility.transforms.list_transformer import match_selectors
+from protobuf_utility.transforms.list_transformer import parse_projection
+from protobuf_utility.transforms.list_transformer import select_element
+
+
+WIRETYPE_VARINT = 0
+WIRETYPE_FIXED64 = 1
+WIRETYPE_LENGTH_DELIMITED = 2
+WIRETYPE_FIXED32 = 5
+
+_INT32_SIGN = 1 << 31
+_INT64_SIGN = 1 << 63
+
+
+def _to_int32(value: int) -> int:
+    value &= 0xFFFFFFFF
+    return value - (1 << 32) if value & _INT32_SIGN else value
+
+
+def _to_int64(value: int) -> int:
+    return value - (1 << 64) if value & _INT64_SIGN else value
+
+
+def _zigzag32(value: int) -> int:
+    value &= 0xFFFFFFFF
+    return (value >> 1) ^ -(value & 1)
+
+
+def _zigzag64(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+# Converters from a decoded varint to the python value of each varint field type.
+_VARINT_DECODERS = {
+    FieldDescriptor.TYPE_INT32: _to_int32,
+    FieldDescriptor.TYPE_INT64: _to_int64,
+    FieldDescriptor.TYPE_UINT32: lambda value: value & 0xFFFFFFFF,
+    FieldDescriptor.TYPE_UINT64: lambda value: value,
+    FieldDescriptor.TYPE_SINT32: _zigzag32,
+    FieldDescriptor.TYPE_SINT64: _zigzag64,
+    FieldDescriptor.TYPE_BOOL: bool,
+    FieldDescriptor.TYPE_ENUM: _to_int32,
+}
+
+# Little endian struct formats of each fixed width field type.
+_FIXED_FORMATS = {
+    FieldDescriptor.TYPE_FIXED32: 'I',
+    FieldDescriptor.TYPE_SFIXED32: 'i',
+    FieldDescriptor.TYPE_FLOAT: 'f',
+    FieldDescriptor.TYPE_FIXED64: 'Q',
+    FieldDescriptor.TYPE_SFIXED64: 'q',
+    FieldDescriptor.TYPE_DOUBLE: 'd',
+}
+
+
+class _WireStep(NamedTuple):
+    # flattening plan step with everything needed to decode it from the wire precomputed
+    kind: int
+    name: str
+    number: int
+    field_type: int
+    default: Any
+    message_type: Optional[Descriptor]
+    selection: Any
+    key_type: int
+    key_default: Any
+    value_type: int
+    value_default: Any
+
+
+# region Public Methods
+def flatten_wire_to_list(
+        data: Union[bytes, bytearray, memoryview, Any],
+        descriptor: Descriptor,
+        projection: Optional[Iterable[str]] = None) -> Tuple[List, List]:
+    """Flattens a serialized protobuf to a list without parsing it into a protobuf object. The
+    wire format is decoded on demand using the message descriptor, fields that are not needed are
+    skipped by their wire length. It produces the same attributes and values as
+    flatten_proto_to_list, including default values for fields missing from the wire. Entries of
+    message maps are listed in wire order since there is no parsed map to iterate.
+    Args:
+        data (Union[bytes, bytearray, memoryview, Any]): serialized protobuf, any object supporting
+            the buffer protocol (e.g. an mmap) is read without copying it.
+        descriptor (Descriptor): descriptor of the serialized protobuf message.
+        projection (Optional[Iterable[str]]): attribute path patterns to keep, all when None. See
+            flatten_proto_to_list for the pattern syntax.
+    Returns:
+        Tuple[List, List]: list of object attributes and list of object values.
+    """
+    buf = memoryview(data)
+    if buf.format != 'B' or buf.ndim != 1:
+        buf = buf.cast('B')
+    patterns = None if projection is None else parse_projection(tuple(projection))
+    attrs = []
+    values = []
+    try:
+        _flatten_wire(buf, 0, len(buf), descriptor, patterns, '', attrs, values)
+    except (IndexError, struct.error) as error:
+        raise ValueError(f'Truncated or malformed {descriptor.full_name} message') from error
+    return attrs, values
+# endregion
+
+
+# region Private Methods
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _get_wire_plan(descriptor: Descriptor, patterns: Optional[Tuple]) -> Tuple:
+    # returns the steps to decode and the field numbers they need from the wire
+    if patterns is None:
+        plan = tuple((step, None) for step in get_flatten_plan(descriptor))
+    else:
+        plan = get_projected_plan(descriptor, patterns)
+
+    steps = []
+    for step, selection in plan:
+        field = step.field
+        key_type = key_default = value_type = value_default = None
+        if step.kind in (STEP_SCALAR_MAP, STEP_MESSAGE_MAP):
+            key_field = field.message_type.fields_by_name['key']
+            key_type = key_field.type
+            key_default = key_field.default_value
+            value_field = field.message_type.fields_by_name['value']
+            value_type = value_field.type
+            value_default = value_field.default_value
+        default = None if field.label == FieldDescriptor.LABEL_REPEATED else field.default_value
+        steps.append(_WireStep(
+            step.kind,
+            step.name,
+            field.number,
+            field.type,
+            default,
+            step.message_type,
+            selection,
+            key_type,
+            key_default,
+            value_type,
+            value_default))
+    return tuple(steps), frozenset(step.number for step in steps)
+
+
+def _flatten_wire(
+        buf: memoryview,
+        start: int,
+        end: int,
+        descriptor: Descriptor,
+        patterns: Optional[Tuple],
+        prefix: str,
+        attrs: List,
+        values: List) -> None:
+    steps, numbers = _get_wire_plan(descriptor, patterns)
+    occurrences = _scan(buf, start, end, numbers)
+
+    for step in steps:
+        kind = step.kind
+        name = step.name
+        found = occurrences.get(step.number)
+
+        if kind == STEP_SCALAR:
+            if found:
+                wire_type, value, value_end = found[-1]
+                values.append(_decode_scalar(buf, step.field_type, wire_type, value, value_end))
+            else:
+                values.append(step.default)
+            attrs.append(f'{prefix}{name}')
+
+        elif kind == STEP_NESTED_MESSAGE:
+            sub_buf, sub_start, sub_end = _merge_spans(buf, found)
+            _flatten_wire(
+                sub_buf,
+                sub_start,
+                sub_end,
+                step.message_type,
+                step.selection,
+                f'{prefix}{name}.',
+                attrs,
+                values)
+
+        elif kind == STEP_REPEATED_SCALAR:
+            elements = []
+            for wire_type, value, value_end in found or ():
+                _decode_repeated(buf, step.field_type, wire_type, value, value_end, elements)
+            for idx, val in enumerate(elements):
+                if step.selection is None or match_selectors(step.selection, idx):
+                    values.append(val)
+                    attrs.append(f'{prefix}{name}[{idx}]')
+
+        elif kind == STEP_SCALAR_MAP:
+            entries = {}
+            for _, entry_start, entry_end in found or ():
+                key, value = _decode_map_entry(buf, entry_start, entry_end, step)
+                entries[key] = value
+            # keys are sorted the same way flatten_proto_to_list sorts scalar maps
+            for key in sorted(entries):
+                if step.selection is None or match_selectors(step.selection, key):
+                    attrs.append(f'{prefix}{name}["{key}"]')
+                    values.append(entries[key])
+
+        elif kind == STEP_MESSAGE_MAP:
+            entries = {}
+            for _, entry_start, entry_end in found or ():
+                key, span = _decode_map_entry(buf, entry_start, entry_end, step)
+                entries[key] = span
+            for key in sorted(entries):
+                span = entries[key]
+                sub_patterns = _element_patterns(step.selection, key)
+                if sub_patterns is SKIP_ELEMENT:
+                    continue
+                if type(key) is str:
+                    sub_prefix = f'{prefix}{name}["{key}"].'
+                else:
+                    sub_prefix = f'{prefix}{name}[{key}].'
+                _flatten_wire(
+                    buf, span[0], span[1], step.message_type, sub_patterns, sub_prefix, attrs,
+                    values)
+
+        else:
+            for idx, (_, element_start, element_end) in enumerate(found or ()):
+                sub_patterns = _element_patterns(step.selection, idx)
+                if sub_patterns is not SKIP_ELEMENT:
+                    _flatten_wire(
+                        buf,
+                        element_start,
+                        element_end,
+                        step.message_type,
+                        sub_patterns,
+                        f'{prefix}{name}[{idx}].',
+                        attrs,
+                        values)
+
+
+def _element_patterns(selection: Any, key: Any) -> Optional[Tuple]:
+    # unprojected steps select every element and everything below it
+    if selection is None:
+        return None
+    return select_element(selection, key)
+
+
+def _scan(buf: memoryview, pos: int, end: int, numbers: frozenset) -> Dict[int, List]:
+    # index the occurrences of the wanted fields as (wire type, value or offset, end offset),
+    # every other field is skipped by its wire length without being decoded
+    occurrences: Dict[int, List] = {}
+    while pos < end:
+        tag, pos = decode_varint(buf, pos)
+        number = tag >> 3
+        wire_type = tag & 7
+        if wire_type == WIRETYPE_VARINT:
+            value, pos = decode_varint(buf, pos)
+            value_end = pos
+        elif wire_type == WIRETYPE_LENGTH_DELIMITED:
+            length, value = decode_varint(buf, pos)
+            pos = value_end = value + length
+        elif wire_type == WIRETYPE_FIXED64:
+            value = pos
+            pos = value_end = pos + 8
+        elif wire_type == WIRETYPE_FIXED32:
+            value = pos
+            pos = value_end = pos + 4
+        else:
+            raise ValueError(f'Unsupported wire type {wire_type} for field {number}')
+        if number in numbers:
+            found = occurrences.get(number)
+            if found is None:
+                found = occurrences[number] = []
+            found.append((wire_type, value, value_end))
+    if pos > end:
+        raise IndexError('field extends past the end of the message')
+    return occurrences
+
+
+def _decode_scalar(buf: memoryview, field_type: int, wire_type: int, value: int, end: int) -> Any:
+    if wire_type == WIRETYPE_VARINT:
+        return _VARINT_DECODERS[field_type](value)
+    if wire_type == WIRETYPE_LENGTH_DELIMITED:
+        if field_type == FieldDescriptor.TYPE_STRING:
+            return str(buf[value:end], 'utf-8')
+        return bytes(buf[value:end])
+    return struct.unpack_from(f'<{_FIXED_FORMATS[field_type]}', buf, value)[0]
+
+
+def _decode_repeated(
+        buf: memoryview, field_type: int, wire_type: int, value: int, end: int,
+        elements: List) -> None:
+    # length delimited numeric fields are packed, everything else is a single element
+    if wire_type != WIRETYPE_LENGTH_DELIMITED or field_type in (
+            FieldDescriptor.TYPE_STRING, FieldDescriptor.TYPE_BYTES):
+        elements.append(_decode_scalar(buf, field_type, wire_type, value, end))
+        return
+
+    fixed_format = _FIXED_FORMATS.get(field_type)
+    if fixed_format is not None:
+        count = (end - value) // struct.calcsize(fixed_format)
+        elements.extend(struct.unpack_from(f'<{count}{fixed_format}', buf, value))
+        return
+
+    decoder = _VARINT_DECODERS[field_type]
+    pos = value
+    while pos < end:
+        varint, pos = decode_varint(buf, pos)
+        elements.append(decoder(varint))
+
+
+def _decode_map_entry(buf: memoryview, start: int, end: int, step: _WireStep) -> Tuple[Any, Any]:
+    # returns the key and either the value or, for message maps, the (start, end) of the value
+    entry = _scan(buf, start, end, frozenset((1, 2)))
+    found = entry.get(1)
+    key = _decode_scalar(buf, step.key_type, *found[-1]) if found else step.key_default
+    found = entry.get(2)
+    if step.kind == STEP_MESSAGE_MAP:
+        return key, (found[-1][1], found[-1][2]) if found else (start, start)
+    if found:
+        return key, _decode_scalar(buf, step.value_type, *found[-1])
+    return key, step.value_default
+
+
+def _merge_spans(buf: memoryview, found: Optional[List]) -> Tuple[memoryview, int, int]:
+    # a singular message that occurs more than once on the wire is the merge of all occurrences,
+    # which is the same as decoding their concatenation
+    if not found:
+        return buf, 0, 0
+    if len(found) == 1:
+        return buf, found[0][1], found[0][2]
+    merged = memoryview(b''.join(buf[start:end] for _, start, end in found))
+    return merged, 0, len(merged)
+# endregion
@@ -23,7 +23,7 @@ setup(
         "License :: OSI Approved :: MIT License",
     ],
     keywords="protobuf schema sql migration",
-    packages=find_packages(exclude=["tests"]),
+    packages=find_packages(exclude=["tests", "benchmarks"]),
     install_requires=[
         "protobuf == 4.21.6"
     ],
@@ -31,6 +31,7 @@ setup(
     extras_require={
         'test': tests_requires,
         'dev': dev_requires,
+        'numpy': ['numpy'],
     },
     include_package_data=True,
 )
@@ -0,0 +1,135 @@
+from pathlib import Path
+import tempfile
+import threading
+from unittest import TestCase
+import unittest
+
+import test_data as td
+
+from protobuf_utility.logger.async_writer import DROP
+from protobuf_utility.logger.async_writer import AsyncSegmentWriter
+from protobuf_utility.logger.segment import SegmentReader
+from protobuf_utility.logger.segment import SegmentWriter
+
+
+class _GatedSegmentWriter(SegmentWriter):
+    # segment writer that does not write anything until the gate is opened
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.gate = threading.Event()
+
+    def write(self, *args, **kwargs) -> int:
+        self.gate.wait()
+        return super().write(*args, **kwargs)
+
+
+class _FailingSegmentWriter(_GatedSegmentWriter):
+    # segment writer that fails once the gate is opened
+    def write(self, *args, **kwargs) -> int:
+        self.gate.wait()
+        raise OSError('disk full')
+
+
+class TestAsyncWriter(TestCase):
+
+    def setUp(self) -> None:
+        self.path = Path(tempfile.mkdtemp()) / 'test.pblog'
+
+    def test_log(self) -> None:
+        stream = (td.raw_msg, td.n4, td.test_types) * 100
+        with AsyncSegmentWriter(SegmentWriter(self.path), fsync_every=50) as writer:
+            for obj in stream:
+                self.assertTrue(writer.log(obj))
+        stats = writer.stats
+        self.assertEqual(stats.written, len(stream))
+        self.assertEqual(stats.dropped, 0)
+        self.assertEqual(stats.queue_depth, 0)
+        self.assertGreater(stats.flushes, 0)
+        self.assertGreater(stats.fsyncs, 0)
+
+        with SegmentReader(self.path) as reader:
+            self.assertEqual(list(reader.messages()), list(stream))
+
+    def test_drop_when_full(self) -> None:
+        segment = _GatedSegmentWriter(self.path)
+        writer = AsyncSegmentWriter(segment, capacity=2, on_full=DROP)
+        try:
+            results = [writer.log(td.raw_msg, timestamp=idx) for idx in range(10)]
+        finally:
+            segment.gate.set()
+            writer.close()
+        # the background thread may already hold one record, the rest of the queue is bounded
+        self.assertLessEqual(sum(results), 3)
+        self.assertEqual(writer.stats.dropped, results.count(False))
+        with SegmentReader(self.path) as reader:
+            self.assertEqual(len(list(reader)), sum(results))
+
+    def test_block_when_full(self) -> None:
+        segment = _GatedSegmentWriter(self.path)
+        writer = AsyncSegmentWriter(segment, capacity=2)
+        logged = threading.Event()
+
+        def log_all() -> None:
+            for idx in range(10):
+                writer.log(td.raw_msg, timestamp=idx)
+            logged.set()
+
+        producer = threading.Thread(target=log_all)
+        producer.start()
+        # the producer is blocked until the background thread can write
+        self.assertFalse(logged.wait(0.2))
+        segment.gate.set()
+        producer.join()
+        writer.close()
+        with SegmentReader(self.path) as reader:
+            self.assertEqual([record.timestamp for record in reader], list(range(10)))
+
+    def test_drop_when_full_threads(self) -> None:
+        segment = _GatedSegmentWriter(self.path)
+        writer = AsyncSegmentWriter(segment, capacity=2, on_full=DROP)
+        results = []
+
+        def log_all() -> None:
+            results.extend(writer.log(td.raw_msg, timestamp=idx) for idx in range(100))
+
+        producers = [threading.Thread(target=log_all) for _ in range(4)]
+        try:
+            for producer in producers:
+                producer.start()
+            for producer in producers:
+                producer.join()
+        finally:
+            segment.gate.set()
+            writer.close()
+        self.assertLessEqual(sum(results), 3)
+        self.assertEqual(writer.stats.dropped, results.count(False))
+
+    def test_block_when_failed(self) -> None:
+        segment = _FailingSegmentWriter(self.path)
+        writer = AsyncSegmentWriter(segment, capacity=1)
+        errors = []
+
+        def log_all() -> None:
+            try:
+                for idx in range(10):
+                    writer.log(td.raw_msg, timestamp=idx)
+            except RuntimeError as error:
+                errors.append(error)
+
+        producer = threading.Thread(target=log_all)
+        producer.start()
+        segment.gate.set()
+        producer.join()
+        # the blocked producer raises the error of the background thread instead of queueing
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0].__cause__, OSError)
+        self.assertRaises(RuntimeError, writer.close)
+
+    def test_invalid_policy(self) -> None:
+        segment = SegmentWriter(self.path)
+        self.assertRaises(ValueError, AsyncSegmentWriter, segment, on_full='wait')
+        segment.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
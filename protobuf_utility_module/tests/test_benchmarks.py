@@ -0,0 +1,55 @@
+from pathlib import Path
+import tempfile
+from unittest import TestCase
+import unittest
+
+from benchmarks.suite import Regression
+from benchmarks.suite import SHAPES
+from benchmarks.suite import compare_results
+from benchmarks.suite import load_results
+from benchmarks.suite import run_benchmarks
+from benchmarks.suite import save_results
+
+
+class TestBenchmarks(TestCase):
+
+    def test_run_benchmarks(self) -> None:
+        reported = []
+        results = run_benchmarks(sizes=[3, 5], repeat=1, report=reported.append)
+        self.assertEqual(results, reported)
+        self.assertEqual(len(results), len(SHAPES) * 4 * 2)
+        self.assertEqual(
+            [(result.shape, result.stage, result.size) for result in results[:4]],
+            [('scalar', 'list', 3), ('scalar', 'list', 5), ('scalar', 'csv', 3),
+             ('scalar', 'csv', 5)])
+        self.assertEqual(results[0].message, 'TestTypes')
+        for result in results:
+            self.assertGreater(result.throughput, 0)
+
+        with self.assertRaises(ValueError):
+            run_benchmarks(sizes=[1], shapes=['missing'])
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / 'results.json'
+            save_results(results, path)
+            self.assertEqual(load_results(path), results)
+
+    def test_compare_results(self) -> None:
+        baseline = run_benchmarks(sizes=[2], shapes=['scalar'], stages=['list', 'csv'], repeat=1)
+        self.assertEqual(compare_results(baseline, baseline), [])
+
+        slower = baseline[0]._replace(throughput=baseline[0].throughput * 0.8)
+        bigger = baseline[1]._replace(peak_memory=baseline[1].peak_memory * 2 + 1)
+        regressions = compare_results(baseline, [slower, bigger], threshold=0.1)
+        self.assertEqual([regression.metric for regression in regressions], [
+            'throughput', 'peak_memory'])
+        self.assertIsInstance(regressions[0], Regression)
+        self.assertAlmostEqual(regressions[0].change, -0.2)
+        # a looser threshold tolerates the slowdown
+        self.assertEqual(len(compare_results(baseline, [slower], threshold=0.25)), 0)
+        # benchmarks missing from the baseline are not compared
+        self.assertEqual(compare_results([], [slower]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
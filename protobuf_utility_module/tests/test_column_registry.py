@@ -0,0 +1,31 @@
+from unittest import TestCase
+import unittest
+
+from protobuf_utility.transforms.column_registry import ColumnRegistry
+
+
+class TestColumnRegistry(TestCase):
+
+    def test_add(self) -> None:
+        columns = ColumnRegistry()
+        self.assertEqual(columns.add('id'), 0)
+        self.assertEqual(columns.add('data'), 1)
+        self.assertEqual(columns.add('id'), 0)
+        self.assertEqual(columns.names, ['id', 'data'])
+        self.assertEqual(len(columns), 2)
+
+    def test_fill_row(self) -> None:
+        columns = ColumnRegistry()
+        self.assertEqual(columns.fill_row(['id', 'list[0]'], [1, 'a']), ['1', 'a'])
+
+        # new attributes get new slots and missing attributes are blanked
+        self.assertEqual(
+            columns.fill_row(['id', 'list[1]', 'flag'], [2, 'b', True]),
+            ['2', '', 'b', 'True'])
+        self.assertEqual(columns.fill_row(['list[0]'], ['c']), ['', 'c', '', ''])
+        self.assertEqual(columns.names, ['id', 'list[0]', 'list[1]', 'flag'])
+        self.assertEqual(columns.slots['flag'], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
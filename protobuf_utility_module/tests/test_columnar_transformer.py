@@ -0,0 +1,130 @@
+from pathlib import Path
+import tempfile
+from unittest import TestCase
+import unittest
+
+import test_data as td
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from protobuf_utility.transforms.columnar_transformer import ENCODING_DICTIONARY
+from protobuf_utility.transforms.columnar_transformer import ENCODING_PLAIN
+from protobuf_utility.transforms.columnar_transformer import ENCODING_RLE
+from protobuf_utility.transforms.columnar_transformer import ColumnarReader
+from protobuf_utility.transforms.columnar_transformer import flatten_mixed_proto_stream_to_columnar
+from protobuf_utility.transforms.columnar_transformer import flatten_same_proto_stream_to_columnar
+from protobuf_utility.transforms.columnar_transformer import read_columnar
+from protobuf_utility.transforms.list_transformer import flatten_protos_to_columns
+
+
+class TestColumnarTransformer(TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name)
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def _assert_columns_equal(self, actual: tuple, expected: tuple) -> None:
+        self.assertEqual(list(actual[0]), list(expected[0]))
+        for name in expected[0]:
+            self.assertEqual(list(actual[0][name]), list(expected[0][name]), name)
+            self.assertEqual(list(actual[1][name]), list(expected[1][name]), name)
+
+    def test_round_trip(self) -> None:
+        objs = [td.n4, td.n4_2, td.n4, td.n4_2, td.n4]
+        file_path = flatten_same_proto_stream_to_columnar(
+            objs, self.path / 'n4.pbcol', row_group_size=2)
+        self._assert_columns_equal(read_columnar(file_path), flatten_protos_to_columns(objs))
+
+        with ColumnarReader(file_path) as reader:
+            self.assertEqual(reader.type_name, 'N4')
+            self.assertEqual(reader.row_count, 5)
+            self.assertEqual([group.row_count for group in reader.row_groups], [2, 2, 1])
+            chunk = reader.row_groups[0].chunks['raw_msgs[2].id']
+            self.assertEqual((chunk.value_count, chunk.null_count), (1, 1))
+            self.assertEqual((chunk.min, chunk.max), (10, 10))
+            # a column missing from a row group reads as missing rows
+            self.assertNotIn('raw_msgs[2].id', reader.row_groups[2].chunks)
+
+            data, validity = reader.read(['raw_msgs[2].data'], row_groups=[1, 2])
+            self.assertEqual(list(data), ['raw_msgs[2].data'])
+            self.assertEqual(list(data['raw_msgs[2].data']), [None, 'data', None])
+            self.assertEqual(list(validity['raw_msgs[2].data']), [0, 1, 0])
+            with self.assertRaises(ValueError):
+                reader.read(['missing'])
+
+    def test_encodings(self) -> None:
+        objs = []
+        for idx in range(200):
+            obj = td.TestTypes()
+            obj.CopyFrom(td.test_types)
+            obj.val1 = idx * 0.5
+            obj.val3 = idx
+            obj.val5 = idx % 3
+            obj.val14 = f'name{idx % 4}'
+            obj.val15 = bytes([idx % 256]) * 3
+            objs.append(obj)
+        file_path = flatten_same_proto_stream_to_columnar(objs, self.path / 'types.pbcol')
+        self._assert_columns_equal(read_columnar(file_path), flatten_protos_to_columns(objs))
+
+        with ColumnarReader(file_path) as reader:
+            chunks = reader.row_groups[0].chunks
+            self.assertEqual(chunks['val1'].encoding, ENCODING_PLAIN)
+            self.assertEqual(chunks['val3'].encoding, ENCODING_PLAIN)
+            self.assertEqual(chunks['val5'].encoding, ENCODING_DICTIONARY)
+            self.assertEqual(chunks['val14'].encoding, ENCODING_DICTIONARY)
+            self.assertEqual(chunks['val6'].encoding, ENCODING_RLE)
+            self.assertEqual((chunks['val3'].min, chunks['val3'].max), (0, 199))
+            self.assertEqual((chunks['val15'].min, chunks['val15'].max), (b'\0' * 3, b'\xc7' * 3))
+
+    def test_mixed_stream(self) -> None:
+        paths = flatten_mixed_proto_stream_to_columnar(
+            [td.n4, td.raw_msg, td.test_specials, td.n4_2], self.path)
+        self.assertEqual(sorted(paths), ['N4', 'TestSpecials', 'common.RawMsg'])
+        data, validity = read_columnar(paths['TestSpecials'])
+        self._assert_columns_equal(
+            (data, validity), flatten_protos_to_columns([td.test_specials]))
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_parquet(self) -> None:
+        # raw_msgs[2].data is first seen in the second row group
+        objs = [td.n4, td.n4, td.n4_2]
+        file_path = flatten_same_proto_stream_to_columnar(
+            objs, self.path / 'n4.parquet', row_group_size=2, backend='parquet')
+        self.assertEqual(sorted(path.name for path in self.path.iterdir()), ['n4.parquet'])
+        self.assertEqual(pyarrow.parquet.ParquetFile(file_path).num_row_groups, 2)
+        data, validity = flatten_protos_to_columns(objs)
+        self.assertEqual(
+            pyarrow.parquet.read_table(file_path).to_pydict(),
+            {
+                name: [
+                    value if present else None
+                    for value, present in zip(list(values), list(validity[name]))
+                ]
+                for name, values in data.items()
+            })
+
+    @unittest.skipIf(pyarrow is not None, 'pyarrow is installed')
+    def test_parquet_missing(self) -> None:
+        with self.assertRaises(ValueError):
+            flatten_same_proto_stream_to_columnar(
+                [td.n4], self.path / 'n4.parquet', backend='parquet')
+
+    def test_invalid(self) -> None:
+        with self.assertRaises(ValueError):
+            flatten_same_proto_stream_to_columnar(
+                [td.n4, td.raw_msg], self.path / 'mixed.pbcol')
+        with self.assertRaises(ValueError):
+            flatten_same_proto_stream_to_columnar([td.n4], self.path / 'n4.pbcol', backend='x')
+        (self.path / 'empty.pbcol').write_bytes(b'')
+        with self.assertRaises(ValueError):
+            ColumnarReader(self.path / 'empty.pbcol')
+
+
+if __name__ == "__main__":
+    unittest.main()
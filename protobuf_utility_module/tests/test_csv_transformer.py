@@ -5,6 +5,9 @@ import unittest
 
 import test_data as td
 
+from protobuf_utility.logger.rotation import RotatingSegmentWriter
+from protobuf_utility.playback.generator import generate_messages
+from protobuf_utility.transforms.csv_transformer import flatten_log_to_csv
 from protobuf_utility.transforms.csv_transformer import flatten_mixed_proto_stream_to_csv
 from protobuf_utility.transforms.csv_transformer import flatten_proto_to_csv
 from protobuf_utility.transforms.csv_transformer import flatten_same_proto_stream_to_csv
@@ -86,6 +89,24 @@ class TestCSVTransformer(TestCase):
             td.test_types.val19[2].val2,
         ])))
 
+    def test_flatten_proto_to_csv_projection(self) -> None:
+        attrs, values = flatten_proto_to_csv(td.test_types, ['val15', 'val17.*'])
+        self.assertEqual(attrs, 'val15,val17.val1,val17.val2')
+        self.assertEqual(values, ','.join(map(str, [
+            td.test_types.val15.hex(' '),
+            td.test_types.val17.val1,
+            td.test_types.val17.val2,
+        ])))
+
+    def test_flatten_same_protos_to_csv_projection(self) -> None:
+        file_path = Path(tempfile.mkdtemp()) / 'test_proto_transform.csv'
+        flatten_same_proto_stream_to_csv(
+            (td.n4, td.n4_2), file_path, projection=['id', 'raw_msgs[*].id'])
+        with open(file_path, 'r') as f:
+            self.assertEqual(f.read(), 'id,raw_msgs[0].id,raw_msgs[1].id,raw_msgs[2].id\n'
+                                       '23,10,11,\n'
+                                       '23,10,11,10\n')
+
     def test_flatten_mixed_protos_to_csv(self) -> None:
         stream = (
             td.raw_msg,
@@ -111,6 +132,62 @@ class TestCSVTransformer(TestCase):
         # check N4
         self._check_n4_stream_to_csv(temp_dir / f'{td.n4.DESCRIPTOR.full_name}.csv')
 
+    def test_flatten_log_to_csv(self) -> None:
+        log_dir = Path(tempfile.mkdtemp())
+        with RotatingSegmentWriter(log_dir, max_bytes=256) as writer:
+            for idx, obj in enumerate((td.raw_msg, td.n4, td.test_types, td.n4_2) * 3):
+                writer.log(obj, timestamp=idx)
+        temp_dir = Path(tempfile.mkdtemp())
+        flatten_log_to_csv(log_dir, temp_dir, type_names=['N4'], start_timestamp=2)
+        self.assertEqual([path.name for path in temp_dir.glob("*.csv")], ['N4.csv'])
+        with open(temp_dir / 'N4.csv', 'r') as f:
+            # n4_2 at 3, n4 at 5, n4_2 at 7, n4 at 9, n4_2 at 11
+            self.assertEqual(len(f.read().splitlines()), 6)
+
+    def test_flatten_mixed_protos_to_csv_workers(self) -> None:
+        # the parallel mode produces the same files as the single process mode, although workers
+        # parse serialized copies whose message maps iterate in a different order
+        stream = (
+            td.raw_msg,
+            td.n4,
+            td.complex_msg,
+            td.test_specials,
+            td.test_types,
+            td.n4_2,
+            td.n4_3,
+        ) * 3 + tuple(generate_messages(td.ComplexMessage, 50))
+        serial_dir = Path(tempfile.mkdtemp())
+        parallel_dir = Path(tempfile.mkdtemp())
+        flatten_mixed_proto_stream_to_csv(iter(stream), serial_dir)
+        flatten_mixed_proto_stream_to_csv(
+            iter(stream), parallel_dir, workers=2, queue_depth=2, batch_size=2)
+
+        serial_files = sorted(path.name for path in serial_dir.glob("*.csv"))
+        self.assertEqual(serial_files, sorted(path.name for path in parallel_dir.glob("*.csv")))
+        for file_name in serial_files:
+            self.assertEqual(
+                (serial_dir / file_name).read_bytes(), (parallel_dir / file_name).read_bytes())
+
+    def test_flatten_mixed_protos_to_csv_spilled(self) -> None:
+        # spilling every row through a single open handle produces the same files and leaves no
+        # temporary files behind
+        stream = (td.raw_msg, td.n4, td.test_types, td.n4_2, td.raw_msg, td.n4_3) * 2
+        memory_dir = Path(tempfile.mkdtemp())
+        spilled_dir = Path(tempfile.mkdtemp())
+        spill_dir = tempfile.mkdtemp()
+        flatten_mixed_proto_stream_to_csv(stream, memory_dir)
+        default_tempdir = tempfile.tempdir
+        tempfile.tempdir = spill_dir
+        try:
+            flatten_mixed_proto_stream_to_csv(
+                stream, spilled_dir, buffer_size=1, max_open_files=1, spool_in_memory=False)
+        finally:
+            tempfile.tempdir = default_tempdir
+
+        self.assertEqual(list(Path(spill_dir).iterdir()), [])
+        for path in memory_dir.glob("*.csv"):
+            self.assertEqual(path.read_bytes(), (spilled_dir / path.name).read_bytes())
+
     def test_flatten_same_protos_to_csv(self) -> None:
         stream = (
             td.n4,
@@ -124,6 +201,22 @@ class TestCSVTransformer(TestCase):
         self.assertTrue(file_path.exists())
         self._check_n4_stream_to_csv(file_path)
 
+    def test_flatten_same_protos_to_csv_widening(self) -> None:
+        # rows written before the header reached its final width are padded, rows written after
+        # are copied as is
+        stream = (td.n4, td.n4, td.n4_3, td.n4)
+        file_path = Path(tempfile.mkdtemp()) / 'test_proto_transform.csv'
+        flatten_same_proto_stream_to_csv(stream, file_path)
+        _, n4_values = flatten_proto_to_csv(td.n4)
+        with open(file_path, 'r') as f:
+            lines = [line.rstrip('\n') for line in f]
+        self.assertEqual(lines[1:], [
+            n4_values + ',,,,,,',
+            n4_values + ',,,,,,',
+            n4_values + ',10,23432,data,10,23432,data',
+            n4_values + ',,,,,,',
+        ])
+
     def _check_n4_stream_to_csv(self, file_name):
         # check N4
         with open(file_name, 'r') as f:
@@ -0,0 +1,34 @@
+from pathlib import Path
+import tempfile
+from unittest import TestCase
+import unittest
+
+from protobuf_utility.transforms.file_handle_pool import FileHandlePool
+
+
+class TestFileHandlePool(TestCase):
+
+    def test_get(self) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            names = [str(Path(temp_dir) / f'{name}.txt') for name in 'abc']
+            handles = FileHandlePool(2)
+            first = handles.get(names[0])
+            first.write(b'1')
+            self.assertIs(handles.get(names[0]), first)
+            handles.get(names[1]).write(b'2')
+            # the least recently used handle is closed and reopened for appending
+            handles.get(names[2]).write(b'3')
+            self.assertTrue(first.closed)
+            handles.get(names[0]).write(b'4')
+            handles.close(names[1])
+            handles.close(names[1])
+            handles.close_all()
+            contents = []
+            for name in names:
+                with open(name, 'rb') as in_f:
+                    contents.append(in_f.read())
+            self.assertEqual(contents, [b'14', b'2', b'3'])
+
+
+if __name__ == "__main__":
+    unittest.main()
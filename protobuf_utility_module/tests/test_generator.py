@@ -0,0 +1,81 @@
+from pathlib import Path
+import tempfile
+from unittest import TestCase
+import unittest
+
+import test_data as td
+
+from protobuf_utility.logger.segment import SegmentReader
+from protobuf_utility.logger.segment import SegmentWriter
+from protobuf_utility.playback.generator import CHUNK_SIZE
+from protobuf_utility.playback.generator import GeneratorOptions
+from protobuf_utility.playback.generator import generate_messages
+from protobuf_utility.playback.generator import generate_serialized_messages
+from protobuf_utility.playback.generator import log_generated_messages
+
+
+class TestGenerator(TestCase):
+
+    def test_generate_messages(self) -> None:
+        objs = list(generate_messages(td.TestTypes, 20, seed=3))
+        self.assertEqual(len(objs), 20)
+        self.assertEqual(objs, list(generate_messages(td.TestTypes.DESCRIPTOR, 20, seed=3)))
+        self.assertNotEqual(objs, list(generate_messages(td.TestTypes, 20, seed=4)))
+        # every scalar is drawn, so messages differ from each other
+        self.assertEqual(len({obj.SerializeToString(deterministic=True) for obj in objs}), 20)
+        for obj in objs:
+            self.assertTrue(obj.HasField('val17'))
+            self.assertTrue(4 <= len(obj.val14) <= 16)
+            self.assertTrue(0 <= len(obj.val18) <= 4)
+            self.assertTrue(0 <= len(obj.val19) <= 4)
+            self.assertIn(obj.val16, td.TYPES.values())
+
+    def test_generator_options(self) -> None:
+        options = GeneratorOptions(
+            repeated_length=(7, 7),
+            map_size=(2, 2),
+            string_length=(1, 1),
+            lengths={'TestSpecials.list1': (3, 3)},
+            oneof_weights={'TestSpecials.test_oneof': {'fault2': 1.0}})
+        for obj in generate_messages(td.TestSpecials, 10, options=options):
+            self.assertEqual(len(obj.list1), 3)
+            self.assertEqual(len(obj.map1), 2)
+            self.assertTrue(all(len(key) == 1 for key in obj.map1))
+            self.assertEqual(obj.WhichOneof('test_oneof'), 'fault2')
+
+        options = GeneratorOptions(unset_oneof_probability=1.0)
+        for obj in generate_messages(td.TestSpecials, 10, options=options):
+            self.assertIsNone(obj.WhichOneof('test_oneof'))
+
+        options = GeneratorOptions(repeated_length=(1, 1), map_size=(1, 1), max_depth=2)
+        for obj in generate_messages(td.ComplexMessage, 5, options=options):
+            self.assertEqual(len(obj.n4s), 1)
+            # the raw messages of the n4s are a third level
+            self.assertEqual(len(obj.n4s[0].raw_msgs), 0)
+            self.assertEqual(len(obj.n4s[0].raw_msgs_by_id), 0)
+
+    def test_generate_serialized_messages(self) -> None:
+        count = CHUNK_SIZE + 10
+        expected = [
+            obj.SerializeToString(deterministic=True)
+            for obj in generate_messages(td.ComplexMessage, count, seed=1)
+        ]
+        self.assertEqual(list(generate_serialized_messages(td.ComplexMessage, count, 1)), expected)
+        self.assertEqual(
+            list(generate_serialized_messages(td.ComplexMessage, count, 1, workers=2)), expected)
+
+    def test_log_generated_messages(self) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / 'generated.seg'
+            with SegmentWriter(path) as writer:
+                self.assertEqual(
+                    log_generated_messages(writer, td.N4, 5, start_timestamp=100, interval=10), 5)
+            with SegmentReader(path) as reader:
+                records = list(reader.records())
+                self.assertEqual(
+                    [record.timestamp for record in records], [100, 110, 120, 130, 140])
+                self.assertEqual(list(reader.messages()), list(generate_messages(td.N4, 5)))
+
+
+if __name__ == "__main__":
+    unittest.main()
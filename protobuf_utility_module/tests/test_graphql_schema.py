@@ -0,0 +1,117 @@
+from unittest import TestCase
+import unittest
+
+from google.protobuf import descriptor_pb2
+from google.protobuf.descriptor import FieldDescriptor
+
+import test_data as td
+
+from protobuf_utility.schema.graphql_schema import generate_graphql_sdl
+from protobuf_utility.schema.graphql_schema import generate_graphql_sdl_from_file_set
+
+
+def _build_file_set(*files: dict) -> descriptor_pb2.FileDescriptorSet:
+    # builds files {'name':, 'package':, 'messages': {name: [(field name, number, type, label,
+    # type name)]}}
+    file_set = descriptor_pb2.FileDescriptorSet()
+    for file in files:
+        file_proto = file_set.file.add(
+            name=file['name'], package=file['package'], syntax='proto3',
+            dependency=file.get('dependency', []))
+        for name, fields in file['messages'].items():
+            message = file_proto.message_type.add(name=name)
+            for field_name, number, field_type, label, type_name in fields:
+                field = message.field.add(
+                    name=field_name, number=number, type=field_type, label=label)
+                if type_name:
+                    field.type_name = type_name
+    return file_set
+
+
+_OPTIONAL = FieldDescriptor.LABEL_OPTIONAL
+_REPEATED = FieldDescriptor.LABEL_REPEATED
+_MESSAGE = FieldDescriptor.TYPE_MESSAGE
+
+
+class TestGraphqlSchema(TestCase):
+
+    def test_generate_graphql_sdl(self) -> None:
+        sdl = generate_graphql_sdl([td.N4.DESCRIPTOR.file])
+        self.assertEqual(
+            sdl,
+            'scalar UInt32\n\n'
+            'type RawMsg {\n\tid: UInt32!\n\ttimestamp: UInt32!\n\tdata: String!\n}\n\n'
+            'type N4_RawMsgsByIdEntry {\n\tkey: String!\n\tvalue: RawMsg\n}\n\n'
+            'type N4 {\n\tid: UInt32!\n\traw_msgs: [RawMsg!]!\n'
+            '\traw_msgs_by_id: [N4_RawMsgsByIdEntry!]!\n}\n\n'
+            'type ComplexMessage_RawMsgsByIdEntry {\n\tkey: String!\n\tvalue: RawMsg\n}\n\n'
+            'type ComplexMessage_N4sByIdEntry {\n\tkey: String!\n\tvalue: N4\n}\n\n'
+            'enum ComplexMessage_N5_N5Types {\n\tDEFAULT\n\ttype1\n\ttype2\n\ttype3\n}\n\n'
+            'type ComplexMessage_N5 {\n\ttypes: [ComplexMessage_N5_N5Types!]!\n'
+            '\tdata: String!\n}\n\n'
+            'type ComplexMessage_N5sByIdEntry {\n\tkey: String!\n\tvalue: ComplexMessage_N5\n}\n\n'
+            'type ComplexMessage {\n\traw_msgs_by_id: [ComplexMessage_RawMsgsByIdEntry!]!\n'
+            '\tn4s: [N4!]!\n\tn4s_by_id: [ComplexMessage_N4sByIdEntry!]!\n'
+            '\tn5s_by_id: [ComplexMessage_N5sByIdEntry!]!\n}\n\n'
+            'type N6 {\n\tn5val: ComplexMessage_N5\n}\n'
+        )
+
+    def test_generate_graphql_sdl_names(self) -> None:
+        # files are looked up by name, shared types are defined once
+        sdl = generate_graphql_sdl(['types.proto', 'specials.proto', 'complex.proto'])
+        self.assertEqual(sdl.count('type RawMsg {'), 1)
+        self.assertEqual(sdl.count('enum TYPES {'), 1)
+        self.assertTrue(sdl.startswith(
+            'scalar Int64\n\nscalar UInt64\n\nscalar UInt32\n\nscalar Bytes\n\nenum TYPES {'))
+        self.assertIn('\tval4: Int64!\n', sdl)
+        self.assertIn('\tval15: Bytes!\n', sdl)
+        self.assertIn('\tval16: TYPES!\n', sdl)
+        # oneof members have presence
+        self.assertIn('\tfault1: Boolean\n\tfault2: Boolean\n', sdl)
+        self.assertIn('\tlist1: [String!]!\n', sdl)
+        self.assertIn('type TestSpecials_Map1Entry {\n\tkey: String!\n\tvalue: String!\n}', sdl)
+        self.assertEqual(generate_graphql_sdl([]), '')
+
+    def test_generate_graphql_sdl_from_file_set(self) -> None:
+        file_set = _build_file_set(
+            {
+                'name': 'a.proto', 'package': 'a',
+                'messages': {'Empty': [], 'Leaf': [
+                    ('val', 1, FieldDescriptor.TYPE_SINT64, _OPTIONAL, '')]},
+            },
+            {
+                'name': 'b.proto', 'package': 'b.c', 'dependency': ['a.proto'],
+                'messages': {'Node': [
+                    ('child', 1, _MESSAGE, _OPTIONAL, '.b.c.Node'),
+                    ('leaves', 2, _MESSAGE, _REPEATED, '.a.Leaf'),
+                ]},
+            })
+        sdl = generate_graphql_sdl_from_file_set(file_set.SerializeToString())
+        self.assertEqual(
+            sdl,
+            'scalar Int64\n\n'
+            'type Empty {\n\t_empty: Boolean\n}\n\n'
+            'type Leaf {\n\tval: Int64!\n}\n\n'
+            'type Node {\n\tchild: Node\n\tleaves: [Leaf!]!\n}\n'
+        )
+        # types are defined after the types they reference
+        sdl = generate_graphql_sdl_from_file_set(_build_file_set(
+            {
+                'name': 'a.proto', 'package': 'a',
+                'messages': {
+                    'Outer': [('inner', 1, _MESSAGE, _OPTIONAL, '.a.Inner')],
+                    'Inner': [('val', 1, FieldDescriptor.TYPE_INT32, _OPTIONAL, '')],
+                },
+            }))
+        self.assertLess(sdl.index('type Inner {'), sdl.index('type Outer {'))
+
+    def test_generate_graphql_sdl_conflicts(self) -> None:
+        file_set = _build_file_set(
+            {'name': 'a.proto', 'package': 'a', 'messages': {'Same': []}},
+            {'name': 'b.proto', 'package': 'b', 'messages': {'Same': []}})
+        with self.assertRaises(ValueError):
+            generate_graphql_sdl_from_file_set(file_set)
+
+
+if __name__ == "__main__":
+    unittest.main()
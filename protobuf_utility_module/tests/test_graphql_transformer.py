@@ -1,11 +1,61 @@
 from unittest import TestCase
 import unittest
 
+from google.protobuf import descriptor_pb2
+from google.protobuf import descriptor_pool
+from google.protobuf import message_factory
+from google.protobuf.descriptor import FieldDescriptor
+
 import test_data as td
 
 from protobuf_utility.transforms.graphql_transformer import proto_definition_to_graphql_query
 
 
+def _build_node_class() -> type:
+    # message Node { int32 val = 1; Node child = 2; repeated Leaf leaves = 3; }
+    file_proto = descriptor_pb2.FileDescriptorProto(
+        name='graphql_node.proto', package='g', syntax='proto3')
+    leaf = file_proto.message_type.add(name='Leaf')
+    leaf.field.add(
+        name='val', number=1, type=FieldDescriptor.TYPE_INT32,
+        label=FieldDescriptor.LABEL_OPTIONAL)
+    node = file_proto.message_type.add(name='Node')
+    node.field.add(
+        name='val', number=1, type=FieldDescriptor.TYPE_INT32,
+        label=FieldDescriptor.LABEL_OPTIONAL)
+    node.field.add(
+        name='child', number=2, type=FieldDescriptor.TYPE_MESSAGE, type_name='.g.Node',
+        label=FieldDescriptor.LABEL_OPTIONAL)
+    node.field.add(
+        name='leaves', number=3, type=FieldDescriptor.TYPE_MESSAGE, type_name='.g.Leaf',
+        label=FieldDescriptor.LABEL_REPEATED)
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file_proto)
+    return message_factory.MessageFactory(pool).GetPrototype(pool.FindMessageTypeByName('g.Node'))
+
+
+def _build_root_class() -> type:
+    # message Root { T a = 1; T b = 2; } message T { R r = 1; }
+    # message R { int32 val = 1; R child = 2; }
+    file_proto = descriptor_pb2.FileDescriptorProto(
+        name='graphql_root.proto', package='r', syntax='proto3')
+    for name, fields in (
+            ('Root', (('a', '.r.T'), ('b', '.r.T'))),
+            ('T', (('r', '.r.R'),)),
+            ('R', (('val', ''), ('child', '.r.R')))):
+        message = file_proto.message_type.add(name=name)
+        for number, (field_name, type_name) in enumerate(fields, 1):
+            field = message.field.add(
+                name=field_name, number=number, type=FieldDescriptor.TYPE_INT32,
+                label=FieldDescriptor.LABEL_OPTIONAL)
+            if type_name:
+                field.type = FieldDescriptor.TYPE_MESSAGE
+                field.type_name = type_name
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file_proto)
+    return message_factory.MessageFactory(pool).GetPrototype(pool.FindMessageTypeByName('r.Root'))
+
+
 class TestGraphqlTransformer(TestCase):
 
     def test_proto_definition_to_graphql_query_raw(self) -> None:
@@ -59,8 +109,92 @@ class TestGraphqlTransformer(TestCase):
     def test_proto_definition_to_graphql_query_types(self) -> None:
         self.assertEqual(
             proto_definition_to_graphql_query(td.test_types),
-            '{\n\tval1\n\tval2\n\tval3\n\tval4\n\tval5\n\tval6\n\tval7\n\tval8\n\tval9\n\tval10\n\tval11\n\tval12\n\tval13\n\tval14\n\tval15\n\tval16\n\tval17 {\n\t\tval1\n\t\tval2\n\t}\n\tval18 {\n\t\tkey\n\t\tvalue {\n\t\t\tval1\n\t\t\tval2\n\t\t}\n\t}\n\tval19 {\n\t\tval1\n\t\tval2\n\t}\n}'
+            '{\n\tval1\n\tval2\n\tval3\n\tval4\n\tval5\n\tval6\n\tval7\n\tval8\n\tval9\n\tval10\n'
+            '\tval11\n\tval12\n\tval13\n\tval14\n\tval15\n\tval16\n\tval17 {\n\t\tval1\n'
+            '\t\tval2\n\t}\n\tval18 {\n\t\tkey\n\t\tvalue {\n\t\t\tval1\n\t\t\tval2\n\t\t}\n\t}\n'
+            '\tval19 {\n\t\tval1\n\t\tval2\n\t}\n}'
+        )
+
+    def test_proto_definition_to_graphql_query_max_depth(self) -> None:
+        self.assertEqual(
+            proto_definition_to_graphql_query(td.complex_msg, max_depth=0),
+            '{\n}'
         )
+        self.assertEqual(
+            proto_definition_to_graphql_query(td.n4, max_depth=1),
+            '{\n\tid\n\traw_msgs {\n\t\tid\n\t\ttimestamp\n\t\tdata\n\t}\n\traw_msgs_by_id {\n'
+            '\t\tkey\n\t}\n}'
+        )
+        self.assertEqual(
+            proto_definition_to_graphql_query(td.complex_msg, max_depth=4),
+            proto_definition_to_graphql_query(td.complex_msg)
+        )
+        self.assertNotEqual(
+            proto_definition_to_graphql_query(td.complex_msg, max_depth=3),
+            proto_definition_to_graphql_query(td.complex_msg)
+        )
+
+    def test_proto_definition_to_graphql_query_recursive(self) -> None:
+        node_class = _build_node_class()
+        leaves = 'leaves {\n%s\tval\n%s}'
+        self.assertEqual(
+            proto_definition_to_graphql_query(node_class),
+            '{\n\tval\n\tchild {\n\t\tval\n\t\t' + leaves % ('\t\t', '\t\t')
+            + '\n\t}\n\t' + leaves % ('\t', '\t') + '\n}'
+        )
+        self.assertEqual(
+            proto_definition_to_graphql_query(node_class, max_recursion=0),
+            '{\n\tval\n\t' + leaves % ('\t', '\t') + '\n}'
+        )
+        self.assertEqual(
+            proto_definition_to_graphql_query(node_class, max_recursion=3).count('child'), 3)
+
+    def test_proto_definition_to_graphql_query_fragments(self) -> None:
+        raw_fragment = 'fragment RawMsgFields on RawMsg {\n\tid\n\ttimestamp\n\tdata\n}'
+        self.assertEqual(
+            proto_definition_to_graphql_query(td.n4, fragments=True),
+            '{\n\tid\n\traw_msgs {\n\t\t...RawMsgFields\n\t}\n\traw_msgs_by_id {\n\t\tkey\n'
+            '\t\tvalue {\n\t\t\t...RawMsgFields\n\t\t}\n\t}\n}\n\n'
+            + raw_fragment
+        )
+        self.assertEqual(
+            proto_definition_to_graphql_query(td.complex_msg, fragments=True),
+            '{\n\traw_msgs_by_id {\n\t\tkey\n\t\tvalue {\n\t\t\t...RawMsgFields\n\t\t}\n\t}\n'
+            '\tn4s {\n\t\t...N4Fields\n\t}\n\tn4s_by_id {\n\t\tkey\n\t\tvalue {\n'
+            '\t\t\t...N4Fields\n\t\t}\n\t}\n\tn5s_by_id {\n\t\tkey\n\t\tvalue {\n\t\t\ttypes\n'
+            '\t\t\tdata\n\t\t}\n\t}\n}\n\n'
+            + raw_fragment + '\n\n'
+            'fragment N4Fields on N4 {\n\tid\n\traw_msgs {\n\t\t...RawMsgFields\n\t}\n'
+            '\traw_msgs_by_id {\n\t\tkey\n\t\tvalue {\n\t\t\t...RawMsgFields\n\t\t}\n\t}\n}'
+        )
+        # types used once are inlined
+        self.assertEqual(
+            proto_definition_to_graphql_query(td.test_types, fragments=True),
+            proto_definition_to_graphql_query(td.test_types).replace(
+                'val17 {\n\t\tval1\n\t\tval2\n\t}', 'val17 {\n\t\t...N3Fields\n\t}').replace(
+                'value {\n\t\t\tval1\n\t\t\tval2\n\t\t}',
+                'value {\n\t\t\t...N3Fields\n\t\t}').replace(
+                'val19 {\n\t\tval1\n\t\tval2\n\t}', 'val19 {\n\t\t...N3Fields\n\t}')
+            + '\n\nfragment N3Fields on N3 {\n\tval1\n\tval2\n}'
+        )
+        self.assertEqual(
+            proto_definition_to_graphql_query(td.test_nested, fragments=True),
+            proto_definition_to_graphql_query(td.test_nested)
+        )
+        # fragments only replace selections that fit in the remaining depth
+        self.assertNotIn(
+            'N4Fields', proto_definition_to_graphql_query(td.complex_msg, 2, fragments=True))
+        self.assertIn(
+            'RawMsgFields', proto_definition_to_graphql_query(td.complex_msg, 2, fragments=True))
+        # recursive types are never fragments
+        self.assertNotIn(
+            'fragment', proto_definition_to_graphql_query(_build_node_class(), fragments=True))
+        # fragment types containing recursive types are inlined when the depth is limited
+        root_class = _build_root_class()
+        self.assertEqual(
+            proto_definition_to_graphql_query(root_class, max_depth=3, fragments=True),
+            proto_definition_to_graphql_query(root_class, max_depth=3))
+        self.assertIn('...TFields', proto_definition_to_graphql_query(root_class, fragments=True))
 
 
 if __name__ == "__main__":
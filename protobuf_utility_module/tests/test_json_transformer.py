@@ -0,0 +1,90 @@
+import io
+import json
+from pathlib import Path
+import tempfile
+from unittest import TestCase
+import unittest
+
+from google.protobuf import json_format
+from google.protobuf import timestamp_pb2
+
+import test_data as td
+
+from protobuf_utility.transforms.json_transformer import get_json_encoder
+from protobuf_utility.transforms.json_transformer import proto_stream_to_ndjson
+from protobuf_utility.transforms.json_transformer import proto_to_json
+from protobuf_utility.transforms.json_transformer import split_proto_stream_to_ndjson
+
+
+def _message_to_dict(obj) -> dict:
+    return json.loads(json_format.MessageToJson(
+        obj, including_default_value_fields=True, preserving_proto_field_name=True))
+
+
+class TestJsonTransformer(TestCase):
+
+    def test_proto_to_json(self) -> None:
+        objs = [
+            td.raw_msg,
+            td.n4,
+            td.n4_2,
+            td.complex_msg,
+            td.n6,
+            td.n2,
+            td.test_nested,
+            td.test_specials,
+            td.n3,
+            td.test_types,
+        ]
+        for obj in objs:
+            self.assertEqual(json.loads(proto_to_json(obj)), _message_to_dict(obj))
+        self.assertIs(get_json_encoder(td.N4.DESCRIPTOR), get_json_encoder(td.N4.DESCRIPTOR))
+
+    def test_proto_to_json_types(self) -> None:
+        line = proto_to_json(td.test_types)
+        # fields are ordered by number, 64 bit integers quoted, enums named and bytes in base64
+        self.assertTrue(line.startswith('{"val1":-320.0,"val2":0.032,"val3":-24,"val4":"-2439723"'))
+        self.assertIn('"val15":"amtucTMyOTBkc2tzcw==","val16":"type1"', line)
+        self.assertNotIn('\n', line)
+
+        obj = td.TestTypes()
+        obj.val1 = float('nan')
+        obj.val2 = float('-inf')
+        obj.val14 = 'quote " and é'
+        self.assertEqual(json.loads(proto_to_json(obj)), _message_to_dict(obj))
+        # unset singular messages are left out
+        self.assertNotIn('val17', json.loads(proto_to_json(obj)))
+
+    def test_well_known_types(self) -> None:
+        timestamp = timestamp_pb2.Timestamp(seconds=1, nanos=5000)
+        self.assertEqual(json.loads(proto_to_json(timestamp)), '1970-01-01T00:00:01.000005Z')
+
+    def test_proto_stream_to_ndjson(self) -> None:
+        objs = [td.n4, td.raw_msg, td.test_specials] * 10
+        buffer = io.BytesIO()
+        self.assertEqual(proto_stream_to_ndjson(objs, buffer, buffer_size=64), 30)
+        lines = buffer.getvalue().decode().split('\n')
+        self.assertEqual(lines[-1], '')
+        self.assertEqual(
+            [json.loads(line) for line in lines[:-1]], list(map(_message_to_dict, objs)))
+
+    def test_split_proto_stream_to_ndjson(self) -> None:
+        objs = [td.n4, td.raw_msg, td.n4_2, td.raw_msg]
+        with tempfile.TemporaryDirectory() as output_dir:
+            paths = split_proto_stream_to_ndjson(objs, Path(output_dir), buffer_size=16)
+            self.assertEqual(
+                paths,
+                {
+                    'N4': Path(output_dir) / 'N4.ndjson',
+                    'common.RawMsg': Path(output_dir) / 'common.RawMsg.ndjson',
+                })
+            with open(paths['N4']) as ndjson_f:
+                self.assertEqual(
+                    [json.loads(line) for line in ndjson_f],
+                    [_message_to_dict(td.n4), _message_to_dict(td.n4_2)])
+            with open(paths['common.RawMsg']) as ndjson_f:
+                self.assertEqual(len(ndjson_f.readlines()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,7 +3,10 @@ import unittest
 
 import test_data as td
 
+from protobuf_utility.transforms import list_transformer as lt
 from protobuf_utility.transforms.list_transformer import flatten_proto_to_list
+from protobuf_utility.transforms.list_transformer import flatten_protos_to_columns
+from protobuf_utility.transforms.list_transformer import get_flatten_plan
 
 
 class TestListTransformer(TestCase):
@@ -320,6 +323,104 @@ class TestListTransformer(TestCase):
         # Handled changing the location of a field in the protobuf but keep the id.
         # TODO(wesley): add test case
 
+    def test_flatten_proto_to_list_projection(self) -> None:
+        attrs, values = flatten_proto_to_list(
+            td.n4, ['raw_msgs[*].id', 'raw_msgs_by_id["*"].timestamp'])
+        self.assertEqual(attrs, [
+            'raw_msgs[0].id',
+            'raw_msgs[1].id',
+            'raw_msgs_by_id["msg0"].timestamp',
+            'raw_msgs_by_id["msg1"].timestamp',
+        ])
+        self.assertEqual(values, [
+            td.n4.raw_msgs[0].id,
+            td.n4.raw_msgs[1].id,
+            td.n4.raw_msgs_by_id["msg0"].timestamp,
+            td.n4.raw_msgs_by_id["msg1"].timestamp,
+        ])
+
+        # a pattern selects the whole subtree below it, patterns are combined per element and
+        # fields without a selector match every index or key
+        attrs, _ = flatten_proto_to_list(td.complex_msg, [
+            'n4s[0].id',
+            'n4s.raw_msgs_by_id["msg1"].id',
+            'n5s_by_id["msg1"]',
+        ])
+        self.assertEqual(attrs, [
+            'n4s[0].id',
+            'n4s[0].raw_msgs_by_id["msg1"].id',
+            'n4s[1].raw_msgs_by_id["msg1"].id',
+            'n5s_by_id["msg1"].types[0]',
+            'n5s_by_id["msg1"].types[1]',
+            'n5s_by_id["msg1"].data',
+        ])
+
+        # field names are globs
+        attrs, values = flatten_proto_to_list(td.test_specials, ['list1[2]', 'map1["*2"]', 'f*'])
+        self.assertEqual(attrs, ['list1[2]', 'map1["key2"]', 'fault1', 'fault2'])
+        self.assertEqual(values, ['3', 'val2', True, False])
+
+        self.assertEqual(flatten_proto_to_list(td.test_types, []), ([], []))
+        self.assertRaises(ValueError, flatten_proto_to_list, td.n4, ['raw_msgs..id'])
+
+    def test_flatten_protos_to_columns_n4(self) -> None:
+        columns, validity = flatten_protos_to_columns([td.n4, td.n4_2, td.n4_3])
+        # columns follow the order attributes were first seen, same as the csv header
+        self.assertEqual(list(columns)[:2], ['id', 'raw_msgs[0].id'])
+        self.assertEqual(list(columns)[-1], 'raw_msgs_by_id["a"].data')
+        self.assertEqual(list(columns), list(validity))
+
+        self.assertEqual(list(columns['id']), [td.n4.id, td.n4_2.id, td.n4_3.id])
+        self.assertEqual(list(validity['id']), [True, True, True])
+
+        # missing rows are masked and filled with a default
+        self.assertEqual(
+            list(columns['raw_msgs[2].id']), [0, td.n4_2.raw_msgs[2].id, td.n4_3.raw_msgs[2].id])
+        self.assertEqual(list(map(bool, validity['raw_msgs[2].id'])), [False, True, True])
+        self.assertEqual(
+            list(columns['raw_msgs_by_id["msg1"].data']),
+            [td.n4.raw_msgs_by_id["msg1"].data, None, td.n4_3.raw_msgs_by_id["msg1"].data])
+        self.assertEqual(
+            list(map(bool, validity['raw_msgs_by_id["msg1"].data'])), [True, False, True])
+
+    def test_flatten_protos_to_columns_types(self) -> None:
+        columns, validity = flatten_protos_to_columns([td.test_types, td.test_types])
+        self.assertEqual(list(columns), flatten_proto_to_list(td.test_types)[0])
+        self.assertEqual(list(columns['val5']), [td.test_types.val5] * 2)
+        self.assertAlmostEqual(columns['val2'][0], td.test_types.val2)
+        self.assertEqual(list(columns['val15']), [td.test_types.val15] * 2)
+        self.assertFalse(any(isinstance(column, list) for column in (
+            columns['val1'], columns['val6'], columns['val13'], columns['val16'])))
+
+    def test_flatten_protos_to_columns_empty(self) -> None:
+        self.assertEqual(flatten_protos_to_columns([]), ({}, {}))
+
+    def test_get_flatten_plan_step_kinds(self) -> None:
+        # map detection comes from the descriptor so scalar maps, message maps and repeated
+        # messages each get their own step kind
+        plan = get_flatten_plan(td.test_specials.DESCRIPTOR)
+        self.assertEqual(
+            [(step.name, step.kind) for step in plan],
+            [
+                ('list1', lt.STEP_REPEATED_SCALAR),
+                ('map1', lt.STEP_SCALAR_MAP),
+                ('fault1', lt.STEP_SCALAR),
+                ('fault2', lt.STEP_SCALAR),
+            ])
+        plan = get_flatten_plan(td.test_types.DESCRIPTOR)
+        self.assertEqual(
+            [(step.name, step.kind) for step in plan[-3:]],
+            [
+                ('val17', lt.STEP_NESTED_MESSAGE),
+                ('val18', lt.STEP_MESSAGE_MAP),
+                ('val19', lt.STEP_REPEATED_MESSAGE),
+            ])
+        self.assertIs(plan[-2].message_type, td.N3.DESCRIPTOR)
+
+    def test_get_flatten_plan_cached(self) -> None:
+        # plans are compiled once per descriptor
+        self.assertIs(get_flatten_plan(td.n4.DESCRIPTOR), get_flatten_plan(td.n4.DESCRIPTOR))
+
 
 if __name__ == "__main__":
     unittest.main()
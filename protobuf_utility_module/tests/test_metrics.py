@@ -0,0 +1,101 @@
+import json
+from pathlib import Path
+import tempfile
+from unittest import TestCase
+import unittest
+
+import test_data as td
+
+from protobuf_utility.transforms.csv_transformer import flatten_mixed_proto_stream_to_csv
+from protobuf_utility.transforms.csv_transformer import flatten_proto_to_csv
+from protobuf_utility.transforms.csv_transformer import flatten_same_proto_stream_to_csv
+from protobuf_utility.transforms.metrics import MetricsRegistry
+from protobuf_utility.transforms.metrics import StageTiming
+from protobuf_utility.transforms.metrics import disable_metrics
+from protobuf_utility.transforms.metrics import enable_metrics
+from protobuf_utility.transforms.metrics import get_metrics
+
+
+class TestMetrics(TestCase):
+
+    def tearDown(self) -> None:
+        disable_metrics()
+
+    def test_enable_metrics(self) -> None:
+        self.assertIsNone(get_metrics())
+        registry = enable_metrics()
+        self.assertIs(get_metrics(), registry)
+        own = MetricsRegistry()
+        self.assertIs(enable_metrics(own), own)
+        self.assertIs(disable_metrics(), own)
+        self.assertIsNone(get_metrics())
+
+    def test_csv_stream_metrics(self) -> None:
+        registry = enable_metrics()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # n4_2 has more repeated elements than n4, the header widens once
+            path = flatten_same_proto_stream_to_csv(
+                iter([td.n4, td.n4, td.n4_2]), Path(temp_dir) / 'n4.csv')
+            with open(path) as csv_f:
+                header = csv_f.readline()
+                rows = csv_f.read()
+            self.assertEqual(registry.gauges[('columns', 'N4')], header.count(',') + 1)
+            # rows are counted before the two n4 rows are padded to the header
+            padding = 2 * (header.count(',') - flatten_proto_to_csv(td.n4)[1].count(','))
+            self.assertEqual(registry.counters[('bytes', 'N4')], len(rows) - padding)
+            flatten_mixed_proto_stream_to_csv(iter([td.raw_msg, td.n4]), Path(temp_dir))
+
+        self.assertEqual(registry.timing('flatten', 'N4').calls, 4)
+        self.assertEqual(registry.timing('stringify', 'N4').calls, 4)
+        self.assertEqual(registry.timing('post_process', 'N4').calls, 2)
+        self.assertEqual(registry.timing('flatten', 'common.RawMsg').calls, 1)
+        self.assertEqual(registry.timing('write', 'N4'), StageTiming(0, 0.0, 0.0))
+        self.assertGreater(registry.timing('flatten', 'N4').wall, 0)
+        self.assertEqual(registry.counters[('rows', 'N4')], 4)
+        self.assertEqual(registry.counters[('schema_widenings', 'N4')], 1)
+
+        disable_metrics()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            flatten_same_proto_stream_to_csv(iter([td.n4]), Path(temp_dir) / 'n4.csv')
+        self.assertEqual(registry.counters[('rows', 'N4')], 4)
+
+    def test_export(self) -> None:
+        registry = MetricsRegistry()
+        registry.add_time('flatten', 'N4', 0.5, 0.25)
+        registry.add_time('flatten', 'N4', 0.5, 0.25)
+        registry.increment('rows', 'N4', 3)
+        registry.increment('rows', 'say "hi"')
+        registry.set_gauge('columns', 'N4', 12)
+
+        self.assertEqual(registry.to_dict(), {
+            'N4': {
+                'stages': {'flatten': {'calls': 2, 'wall_seconds': 1.0, 'cpu_seconds': 0.5}},
+                'counters': {'rows': 3},
+                'gauges': {'columns': 12},
+            },
+            'say "hi"': {'stages': {}, 'counters': {'rows': 1}, 'gauges': {}},
+        })
+
+        text = registry.to_prometheus()
+        self.assertIn('# TYPE protobuf_utility_stage_wall_seconds_total counter\n', text)
+        self.assertIn(
+            'protobuf_utility_stage_wall_seconds_total{stage="flatten",type="N4"} 1.0\n', text)
+        self.assertIn('protobuf_utility_stage_calls_total{stage="flatten",type="N4"} 2\n', text)
+        self.assertIn('protobuf_utility_rows_total{type="say \\"hi\\""} 1\n', text)
+        self.assertIn('# TYPE protobuf_utility_columns gauge\n', text)
+        self.assertIn('protobuf_utility_columns{type="N4"} 12\n', text)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            registry.write_json(Path(temp_dir) / 'metrics.json')
+            registry.write_prometheus(Path(temp_dir) / 'metrics.prom')
+            with open(Path(temp_dir) / 'metrics.json') as json_f:
+                self.assertEqual(json.load(json_f), registry.to_dict())
+            with open(Path(temp_dir) / 'metrics.prom') as prom_f:
+                self.assertEqual(prom_f.read(), text)
+
+        registry.clear()
+        self.assertEqual(registry.to_prometheus(), '')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,197 @@
+from pathlib import Path
+import sqlite3
+import tempfile
+from unittest import TestCase
+import unittest
+
+from google.protobuf import descriptor_pb2
+from google.protobuf import descriptor_pool
+from google.protobuf.descriptor import FieldDescriptor
+
+import test_data as td
+
+from protobuf_utility.schema.migration import FIELD_ADDED
+from protobuf_utility.schema.migration import FIELD_LABEL_CHANGED
+from protobuf_utility.schema.migration import FIELD_MOVED_INTO_MAP
+from protobuf_utility.schema.migration import FIELD_RENAMED
+from protobuf_utility.schema.migration import FIELD_TYPE_CHANGED
+from protobuf_utility.schema.migration import FingerprintCache
+from protobuf_utility.schema.migration import descriptor_fingerprint
+from protobuf_utility.schema.migration import diff_descriptors
+from protobuf_utility.schema.migration import generate_migration_script
+from protobuf_utility.schema.sqlite_schema import generate_sqlite_script
+
+_OPTIONAL = FieldDescriptor.LABEL_OPTIONAL
+_REPEATED = FieldDescriptor.LABEL_REPEATED
+
+
+def _build_messages(messages: dict) -> list:
+    # builds the messages {name: [(field name, number, type, label, type name)]} of package m,
+    # a type name starting with 'map<' makes a map field with an int32 key
+    file_proto = descriptor_pb2.FileDescriptorProto(
+        name='migration.proto', package='m', syntax='proto3')
+    for name, fields in messages.items():
+        message = file_proto.message_type.add(name=name)
+        for field_name, number, field_type, label, type_name in fields:
+            if type_name.startswith('map<'):
+                entry = message.nested_type.add(name=field_name.capitalize() + 'Entry')
+                entry.options.map_entry = True
+                entry.field.add(
+                    name='key', number=1, type=FieldDescriptor.TYPE_INT32, label=_OPTIONAL)
+                entry.field.add(name='value', number=2, type=field_type, label=_OPTIONAL)
+                message.field.add(
+                    name=field_name, number=number, type=FieldDescriptor.TYPE_MESSAGE,
+                    type_name=f'.m.{name}.{entry.name}', label=_REPEATED)
+            else:
+                field = message.field.add(
+                    name=field_name, number=number, type=field_type, label=label)
+                if type_name:
+                    field.type_name = type_name
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file_proto)
+    return [pool.FindMessageTypeByName(f'm.{name}') for name in messages]
+
+
+_INNER = [('a', 1, FieldDescriptor.TYPE_INT32, _OPTIONAL, '')]
+_OLD = {
+    'Inner': _INNER,
+    'Item': [
+        ('id', 1, FieldDescriptor.TYPE_INT32, _OPTIONAL, ''),
+        ('name', 2, FieldDescriptor.TYPE_STRING, _OPTIONAL, ''),
+        ('tags', 3, FieldDescriptor.TYPE_INT32, _REPEATED, ''),
+        ('inner', 4, FieldDescriptor.TYPE_MESSAGE, _OPTIONAL, '.m.Inner'),
+    ],
+    'Renamed': [('x', 1, FieldDescriptor.TYPE_INT32, _OPTIONAL, '')],
+    'Same': [('x', 1, FieldDescriptor.TYPE_INT32, _OPTIONAL, '')],
+    'Gone': [('x', 1, FieldDescriptor.TYPE_INT32, _OPTIONAL, '')],
+}
+_NEW = {
+    'Inner': _INNER + [('b', 2, FieldDescriptor.TYPE_INT32, _OPTIONAL, '')],
+    'Item': [
+        ('item_id', 1, FieldDescriptor.TYPE_INT32, _OPTIONAL, ''),
+        ('name', 2, FieldDescriptor.TYPE_BYTES, _OPTIONAL, ''),
+        ('tags', 3, FieldDescriptor.TYPE_INT32, _REPEATED, 'map<'),
+        ('inner', 4, FieldDescriptor.TYPE_MESSAGE, _OPTIONAL, '.m.Inner'),
+        ('score', 5, FieldDescriptor.TYPE_DOUBLE, _OPTIONAL, ''),
+    ],
+    'Renamed': [
+        ('y', 1, FieldDescriptor.TYPE_INT32, _OPTIONAL, ''),
+        ('z', 2, FieldDescriptor.TYPE_STRING, _OPTIONAL, ''),
+    ],
+    'Same': [('x', 1, FieldDescriptor.TYPE_INT32, _OPTIONAL, '')],
+    'Added': [('x', 1, FieldDescriptor.TYPE_INT32, _REPEATED, '')],
+}
+
+
+class TestMigration(TestCase):
+
+    def setUp(self) -> None:
+        self.old = _build_messages(_OLD)
+        self.new = _build_messages(_NEW)
+
+    def test_descriptor_fingerprint(self) -> None:
+        old = dict(zip(_OLD, self.old))
+        new = dict(zip(_NEW, self.new))
+        self.assertEqual(descriptor_fingerprint(old['Same']), descriptor_fingerprint(new['Same']))
+        self.assertNotEqual(
+            descriptor_fingerprint(old['Same']), descriptor_fingerprint(old['Gone']))
+        # a change of a nested message changes the messages containing it
+        self.assertNotEqual(
+            descriptor_fingerprint(old['Item']), descriptor_fingerprint(new['Item']))
+        self.assertEqual(
+            descriptor_fingerprint(td.N4.DESCRIPTOR), descriptor_fingerprint(td.N4.DESCRIPTOR))
+
+    def test_diff_descriptors(self) -> None:
+        diff = diff_descriptors(self.old, self.new)
+        self.assertEqual(diff.added, ['m.Added'])
+        self.assertEqual(diff.removed, ['m.Gone'])
+        self.assertEqual(diff.changed, ['m.Inner', 'm.Item', 'm.Renamed'])
+        self.assertEqual(diff.unchanged, 1)
+        self.assertEqual(
+            sorted((change.message, change.number, change.change) for change in diff.fields),
+            [
+                ('m.Inner', 2, FIELD_ADDED),
+                ('m.Item', 1, FIELD_RENAMED),
+                ('m.Item', 2, FIELD_TYPE_CHANGED),
+                ('m.Item', 3, FIELD_MOVED_INTO_MAP),
+                ('m.Item', 5, FIELD_ADDED),
+                ('m.Renamed', 1, FIELD_RENAMED),
+                ('m.Renamed', 2, FIELD_ADDED),
+            ])
+
+        label_changed = dict(_OLD, Same=[('x', 1, FieldDescriptor.TYPE_INT32, _REPEATED, '')])
+        diff = diff_descriptors(self.old, _build_messages(label_changed))
+        self.assertEqual(
+            [(change.message, change.change) for change in diff.fields],
+            [('m.Same', FIELD_LABEL_CHANGED)])
+
+    def test_generate_migration_script(self) -> None:
+        connection = sqlite3.connect(':memory:')
+        connection.executescript(generate_sqlite_script(self.old))
+        connection.execute('INSERT INTO "m.Item" VALUES (1, 7, \'seven\', 3)')
+        connection.execute('INSERT INTO "m.Item.tags" VALUES (1, 1, 0, 5)')
+        connection.execute('INSERT INTO "m.Renamed" VALUES (1, 9)')
+
+        script = generate_migration_script(self.old, self.new)
+        self.assertTrue(script.startswith('PRAGMA foreign_keys = OFF;\nBEGIN;\n'))
+        self.assertTrue(script.endswith('COMMIT;\n'))
+        self.assertNotIn('m.Same', script)
+        connection.executescript(script)
+
+        tables = {row[0] for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertEqual(
+            tables,
+            {'m.Inner', 'm.Item', 'm.Item.tags', 'm.Renamed', 'm.Same', 'm.Added',
+             'm.Added.x'})
+        # the renamed and retyped columns keep their values, the table was copied
+        self.assertEqual(
+            connection.execute(
+                'SELECT "_id", "item_id", "name", "inner.a", "inner.b", "score" FROM "m.Item"'
+            ).fetchall(),
+            [(1, 7, b'seven', 3, None, None)])
+        self.assertEqual(
+            [row[1] for row in connection.execute('PRAGMA table_info("m.Item.tags")')],
+            ['_id', '_parent_id', '_key', 'value'])
+        self.assertEqual(
+            connection.execute('SELECT * FROM "m.Renamed"').fetchall(), [(1, 9, None)])
+        self.assertEqual(
+            [row[1] for row in connection.execute('PRAGMA table_info("m.Renamed")')],
+            ['_id', 'y', 'z'])
+        indexes = {row[0] for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertEqual(indexes, {'m.Item.tags._parent_id', 'm.Added.x._parent_id'})
+
+        # migrating to the same schema does nothing
+        self.assertEqual(generate_migration_script(self.new, self.new), '')
+
+    def test_renamed_child_table(self) -> None:
+        old = _build_messages({'A': [('xs', 1, FieldDescriptor.TYPE_INT32, _REPEATED, '')]})
+        new = _build_messages({'A': [('ys', 1, FieldDescriptor.TYPE_INT32, _REPEATED, '')]})
+        connection = sqlite3.connect(':memory:')
+        connection.executescript(generate_sqlite_script(old))
+        connection.execute('INSERT INTO "m.A" VALUES (1)')
+        connection.execute('INSERT INTO "m.A.xs" VALUES (1, 1, 0, 4)')
+        connection.executescript(generate_migration_script(old, new))
+        self.assertEqual(connection.execute('SELECT * FROM "m.A.ys"').fetchall(), [(1, 1, 0, 4)])
+        indexes = [row[0] for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'")]
+        self.assertEqual(indexes, ['m.A.ys._parent_id'])
+
+    def test_fingerprint_cache(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'fingerprints.json'
+            cache = FingerprintCache(path)
+            fingerprint = cache.get(td.ComplexMessage.DESCRIPTOR)
+            self.assertEqual(fingerprint, descriptor_fingerprint(td.ComplexMessage.DESCRIPTOR))
+            cache.save()
+
+            loaded = FingerprintCache(path)
+            self.assertEqual(loaded.get(td.ComplexMessage.DESCRIPTOR), fingerprint)
+            self.assertFalse(loaded._changed)
+            diff = diff_descriptors(self.old, self.new, loaded)
+            self.assertEqual(diff.unchanged, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import asyncio
+from pathlib import Path
+import tempfile
+from typing import List, Tuple
+from unittest import TestCase
+import unittest
+
+import test_data as td
+
+from protobuf_utility.logger.rotation import RotatingSegmentWriter
+from protobuf_utility.logger.segment import LogRecord
+from protobuf_utility.playback.engine import PlaybackEngine
+from protobuf_utility.playback.engine import play
+from protobuf_utility.playback.engine import play_log
+from protobuf_utility.playback.sinks import QueueSink
+from protobuf_utility.playback.sinks import Sink
+from protobuf_utility.playback.sinks import TcpSink
+from protobuf_utility.playback.sinks import UdpSink
+from protobuf_utility.playback.sinks import decode_frame
+from protobuf_utility.playback.sinks import read_frames
+
+
+class _ListSink(Sink):
+    # sink that keeps every published record
+    def __init__(self) -> None:
+        self.records: List[LogRecord] = []
+
+    async def publish(self, records: List[LogRecord]) -> None:
+        self.records.extend(records)
+
+
+class TestPlayback(TestCase):
+
+    def setUp(self) -> None:
+        # one record every 10ms
+        self.records = [
+            LogRecord(obj.DESCRIPTOR.full_name, idx * 10_000_000, obj.SerializeToString(), idx)
+            for idx, obj in enumerate((td.raw_msg, td.n4, td.test_types) * 4)
+        ]
+
+    def test_unthrottled_filter(self) -> None:
+        sink = _ListSink()
+        stats = play(self.records, [sink], rate=None, type_names=['N4', 'TestTypes'])
+        self.assertEqual(stats.published, 8)
+        self.assertEqual(stats.skipped, 4)
+        self.assertEqual(
+            sink.records,
+            [record for record in self.records if record.type_name != 'common.RawMsg'])
+        self.assertLess(stats.elapsed, 0.11)
+
+    def test_rate(self) -> None:
+        # 110ms of records replayed twice as fast
+        sink = _ListSink()
+        stats = play(self.records, [sink], rate=2.0)
+        self.assertEqual(sink.records, self.records)
+        self.assertGreaterEqual(stats.elapsed, 0.055)
+        self.assertLess(stats.elapsed, 0.5)
+
+    def test_play_log(self) -> None:
+        log_dir = Path(tempfile.mkdtemp())
+        with RotatingSegmentWriter(log_dir, max_bytes=256) as writer:
+            for record in self.records:
+                writer.write(record.type_name, record.payload, record.timestamp)
+        sink = _ListSink()
+        stats = play_log(
+            log_dir, [sink], rate=None, type_names=['N4'], start_timestamp=20_000_000)
+        self.assertEqual(stats.published, 3)
+        self.assertEqual(
+            [record.timestamp for record in sink.records], [40_000_000, 70_000_000, 100_000_000])
+
+    def test_invalid_rate(self) -> None:
+        self.assertRaises(ValueError, PlaybackEngine, self.records, [], rate=0)
+
+    def test_queue_sink(self) -> None:
+        async def main() -> Tuple[int, List[LogRecord]]:
+            queue: asyncio.Queue = asyncio.Queue(2)
+            engine = PlaybackEngine(self.records, [QueueSink(queue)], rate=None, batch_size=5)
+            playback = asyncio.ensure_future(engine.run())
+            received = []
+            while True:
+                record = await queue.get()
+                if record is None:
+                    break
+                received.append(record)
+            return (await playback).published, received
+
+        published, received = asyncio.run(main())
+        self.assertEqual(published, len(self.records))
+        self.assertEqual(received, self.records)
+
+    def test_tcp_sink(self) -> None:
+        async def main() -> list:
+            received = []
+            done = asyncio.Event()
+
+            async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+                async for frame in read_frames(reader):
+                    received.append(frame)
+                writer.close()
+                done.set()
+
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            await PlaybackEngine(self.records, [TcpSink('127.0.0.1', port)], rate=None).run()
+            await done.wait()
+            server.close()
+            return received
+
+        received = asyncio.run(main())
+        self.assertEqual(
+            received,
+            [(record.type_name, record.timestamp, record.payload) for record in self.records])
+
+    def test_udp_sink(self) -> None:
+        class Receiver(asyncio.DatagramProtocol):
+            def __init__(self) -> None:
+                self.frames: list = []
+
+            def datagram_received(self, data: bytes, addr: tuple) -> None:
+                self.frames.append(decode_frame(data))
+
+        async def main() -> list:
+            loop = asyncio.get_running_loop()
+            transport, receiver = await loop.create_datagram_endpoint(
+                Receiver, local_addr=('127.0.0.1', 0))
+            port = transport.get_extra_info('sockname')[1]
+            await PlaybackEngine(self.records[:3], [UdpSink('127.0.0.1', port)], rate=None).run()
+            for _ in range(100):
+                if len(receiver.frames) == 3:
+                    break
+                await asyncio.sleep(0.01)
+            transport.close()
+            return receiver.frames
+
+        self.assertEqual(
+            asyncio.run(main()),
+            [(record.type_name, record.timestamp, record.payload) for record in self.records[:3]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+from pathlib import Path
+import tempfile
+from unittest import TestCase
+import unittest
+
+import test_data as td
+
+from protobuf_utility.logger.async_writer import AsyncSegmentWriter
+from protobuf_utility.logger.rotation import RotatingSegmentWriter
+from protobuf_utility.logger.rotation import list_segments
+from protobuf_utility.logger.rotation import read_segment_messages
+from protobuf_utility.logger.rotation import read_segments
+from protobuf_utility.logger.segment import SegmentReader
+from protobuf_utility.transforms.csv_transformer import flatten_mixed_proto_stream_to_csv
+
+
+class TestRotation(TestCase):
+
+    def setUp(self) -> None:
+        self.directory = Path(tempfile.mkdtemp())
+        self.stream = (td.raw_msg, td.n4, td.complex_msg, td.test_types) * 10
+
+    def test_rotate_by_size(self) -> None:
+        with RotatingSegmentWriter(
+                self.directory, max_bytes=512, compression='zlib', block_size=128) as writer:
+            for timestamp, obj in enumerate(self.stream):
+                writer.log(obj, timestamp=timestamp)
+        paths = list_segments(self.directory)
+        self.assertEqual(paths, writer.paths)
+        self.assertGreater(len(paths), 1)
+        self.assertEqual(list(read_segment_messages(self.directory)), list(self.stream))
+        # types seen in earlier segments are stored in the header of the next ones
+        with SegmentReader(paths[-1]) as reader:
+            self.assertEqual(
+                reader.header_types, ['common.RawMsg', 'N4', 'ComplexMessage', 'TestTypes'])
+
+    def test_rotate_by_time(self) -> None:
+        with RotatingSegmentWriter(self.directory, max_seconds=0) as writer:
+            for obj in self.stream[:3]:
+                writer.log(obj)
+        self.assertEqual(len(list_segments(self.directory)), 3)
+
+    def test_rotate_after_deleted_segments(self) -> None:
+        with RotatingSegmentWriter(self.directory, max_seconds=0) as writer:
+            for obj in self.stream[:3]:
+                writer.log(obj)
+        # retention deleted the oldest segment, new segments must not reuse existing numbers
+        writer.paths[0].unlink()
+        with RotatingSegmentWriter(self.directory) as writer:
+            writer.log(td.raw_msg)
+        self.assertEqual(writer.paths[0].name, 'segment-00000003.pblog')
+        self.assertEqual(
+            list(read_segment_messages(self.directory)), [*self.stream[1:3], td.raw_msg])
+
+    def test_read_segments_from_timestamp(self) -> None:
+        with RotatingSegmentWriter(self.directory, max_bytes=256) as writer:
+            for timestamp, obj in enumerate(self.stream):
+                writer.log(obj, timestamp=timestamp)
+        records = read_segments(self.directory, start_timestamp=25)
+        timestamps = [record.timestamp for record in records]
+        self.assertEqual(timestamps, list(range(25, len(self.stream))))
+
+    def test_async_rotating_writer_feeds_csv_transformer(self) -> None:
+        writer = RotatingSegmentWriter(self.directory, max_bytes=1024, compression='lzma')
+        with AsyncSegmentWriter(writer, fsync_every=10) as async_writer:
+            for obj in self.stream:
+                async_writer.log(obj)
+        output_dir = Path(tempfile.mkdtemp())
+        flatten_mixed_proto_stream_to_csv(read_segment_messages(self.directory), output_dir)
+        self.assertEqual(
+            sorted(path.name for path in output_dir.glob('*.csv')),
+            ['ComplexMessage.csv', 'N4.csv', 'TestTypes.csv', 'common.RawMsg.csv'])
+
+
+if __name__ == "__main__":
+    unittest.main()
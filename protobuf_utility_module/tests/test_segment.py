@@ -0,0 +1,140 @@
+from pathlib import Path
+import tempfile
+from unittest import TestCase
+import unittest
+
+import test_data as td
+
+from protobuf_utility.logger.segment import SegmentReader
+from protobuf_utility.logger.segment import SegmentWriter
+from protobuf_utility.transforms.csv_transformer import flatten_mixed_proto_stream_to_csv
+
+
+class TestSegment(TestCase):
+
+    def setUp(self) -> None:
+        self.stream = (td.raw_msg, td.n4, td.complex_msg, td.test_types, td.n4_2, td.raw_msg)
+        self.path = Path(tempfile.mkdtemp()) / 'test.pblog'
+
+    def _write(self, close: bool = True, **options) -> SegmentWriter:
+        writer = SegmentWriter(self.path, types=['N4'], index_interval=2, **options)
+        for timestamp, obj in enumerate(self.stream):
+            writer.log(obj, timestamp=timestamp * 10)
+        if close:
+            writer.close()
+        else:
+            writer.sync()
+        return writer
+
+    def test_round_trip(self) -> None:
+        self._write()
+        with SegmentReader(self.path) as reader:
+            self.assertTrue(reader.complete)
+            self.assertEqual(reader.header_types, ['N4'])
+            self.assertEqual(
+                reader.type_names, ['N4', 'common.RawMsg', 'ComplexMessage', 'TestTypes'])
+            records = list(reader)
+            self.assertEqual(
+                [record.type_name for record in records],
+                [obj.DESCRIPTOR.full_name for obj in self.stream])
+            self.assertEqual([record.timestamp for record in records], [0, 10, 20, 30, 40, 50])
+            self.assertTrue(all(isinstance(record.payload, memoryview) for record in records))
+            self.assertEqual(
+                [bytes(record.payload) for record in records],
+                [obj.SerializeToString() for obj in self.stream])
+            self.assertEqual(list(reader.messages()), list(self.stream))
+            del records
+
+    def test_incomplete_segment(self) -> None:
+        # a segment that was not closed has no footer and is read up to its last record
+        writer = self._write(close=False)
+        try:
+            with SegmentReader(self.path) as reader:
+                self.assertFalse(reader.complete)
+                records = list(reader)
+                self.assertEqual(len(records), len(self.stream))
+                resumed = list(reader.records(records[3].offset))
+                self.assertEqual(
+                    [record.type_name for record in resumed],
+                    ['TestTypes', 'N4', 'common.RawMsg'])
+                del records, resumed
+        finally:
+            writer.close()
+
+    def test_find_offset(self) -> None:
+        self._write()
+        with SegmentReader(self.path) as reader:
+            self.assertEqual(len(reader.index), 3)
+            timestamps = [record.timestamp for record in reader.records(reader.find_offset(35))]
+            self.assertEqual(timestamps, [20, 30, 40, 50])
+            timestamps = [record.timestamp for record in reader.records(reader.find_offset(0))]
+            self.assertEqual(timestamps, [0, 10, 20, 30, 40, 50])
+
+    def test_feed_csv_transformer(self) -> None:
+        self._write()
+        output_dir = Path(tempfile.mkdtemp())
+        with SegmentReader(self.path) as reader:
+            flatten_mixed_proto_stream_to_csv(reader.messages(), output_dir)
+        self.assertEqual(
+            sorted(path.name for path in output_dir.glob('*.csv')),
+            ['ComplexMessage.csv', 'N4.csv', 'TestTypes.csv', 'common.RawMsg.csv'])
+
+    def test_compressed_round_trip(self) -> None:
+        for compression in ('zlib', 'lzma'):
+            self._write(compression=compression, block_size=64)
+            with SegmentReader(self.path) as reader:
+                self.assertTrue(reader.complete)
+                self.assertEqual(reader.compression, compression)
+                self.assertGreater(len(reader.index), 1)
+                records = list(reader)
+                self.assertEqual(
+                    [bytes(record.payload) for record in records],
+                    [obj.SerializeToString() for obj in self.stream])
+                self.assertEqual([record.timestamp for record in records], [0, 10, 20, 30, 40, 50])
+                # offsets are record offsets in the uncompressed stream
+                compressed_offsets = [record.offset - records[0].offset for record in records]
+                del records
+            self._write()
+            with SegmentReader(self.path) as reader:
+                records = list(reader)
+                self.assertEqual(
+                    [record.offset - records[0].offset for record in records], compressed_offsets)
+                del records
+
+    def test_compressed_seek(self) -> None:
+        self._write(compression='zlib', block_size=64)
+        with SegmentReader(self.path) as reader:
+            offsets = [record.offset for record in reader]
+            timestamps = [record.timestamp for record in reader.records(reader.find_offset(35))]
+            self.assertEqual(timestamps[-3:], [30, 40, 50])
+            self.assertLess(len(timestamps), len(self.stream))
+            timestamps = [record.timestamp for record in reader.records(offsets[4])]
+            self.assertEqual(timestamps, [40, 50])
+
+    def test_compressed_incomplete_segment(self) -> None:
+        writer = self._write(close=False, compression='zlib', block_size=64)
+        try:
+            with SegmentReader(self.path) as reader:
+                self.assertFalse(reader.complete)
+                records = list(reader)
+                self.assertEqual(
+                    [record.type_name for record in records],
+                    [obj.DESCRIPTOR.full_name for obj in self.stream])
+                resumed = list(reader.records(records[3].offset))
+                self.assertEqual(
+                    [record.type_name for record in resumed],
+                    ['TestTypes', 'N4', 'common.RawMsg'])
+                del records, resumed
+        finally:
+            writer.close()
+
+    def test_unknown_compression(self) -> None:
+        self.assertRaises(ValueError, SegmentWriter, self.path, compression='snappy')
+
+    def test_not_a_segment(self) -> None:
+        self.path.write_bytes(b'not a segment')
+        self.assertRaises(ValueError, SegmentReader, self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import sqlite3
+from unittest import TestCase
+import unittest
+
+from google.protobuf import descriptor_pb2
+from google.protobuf import descriptor_pool
+from google.protobuf.descriptor import FieldDescriptor
+
+import test_data as td
+
+from protobuf_utility.schema.sqlite_schema import TABLE_MAP
+from protobuf_utility.schema.sqlite_schema import TABLE_MESSAGE
+from protobuf_utility.schema.sqlite_schema import TABLE_REPEATED
+from protobuf_utility.schema.sqlite_schema import create_table_statement
+from protobuf_utility.schema.sqlite_schema import generate_sqlite_ddl
+from protobuf_utility.schema.sqlite_schema import generate_sqlite_script
+from protobuf_utility.schema.sqlite_schema import get_table_schemas
+
+
+class TestSqliteSchema(TestCase):
+
+    def test_table_schemas(self) -> None:
+        tables = get_table_schemas(td.N4.DESCRIPTOR)
+        self.assertEqual(
+            [(table.name, table.kind, table.parent, table.path) for table in tables],
+            [
+                ('N4', TABLE_MESSAGE, None, ()),
+                ('N4.raw_msgs', TABLE_REPEATED, 'N4', ('raw_msgs',)),
+                ('N4.raw_msgs_by_id', TABLE_MAP, 'N4', ('raw_msgs_by_id',)),
+            ])
+        self.assertEqual(
+            [column.name for column in tables[2].columns],
+            ['_id', '_parent_id', '_key', 'id', 'timestamp', 'data'])
+        self.assertIs(get_table_schemas(td.N4.DESCRIPTOR), tables)
+
+    def test_create_table_statement(self) -> None:
+        tables = get_table_schemas(td.TestTypes.DESCRIPTOR)
+        self.assertEqual(create_table_statement(tables[2]), '''\
+CREATE TABLE IF NOT EXISTS "TestTypes.val19" (
+    "_id" INTEGER PRIMARY KEY,
+    "_parent_id" INTEGER NOT NULL REFERENCES "TestTypes"("_id") ON DELETE CASCADE,
+    "_index" INTEGER NOT NULL,
+    "val1" INTEGER,
+    "val2" INTEGER
+)''')
+        # scalars and nested singular messages are columns of the message table
+        self.assertEqual(
+            [(column.name, column.sql_type) for column in tables[0].columns[-5:]],
+            [
+                ('val14', 'TEXT'),
+                ('val15', 'BLOB'),
+                ('val16', 'INTEGER'),
+                ('val17.val1', 'INTEGER'),
+                ('val17.val2', 'INTEGER'),
+            ])
+
+    def test_scalar_children(self) -> None:
+        tables = get_table_schemas(td.TestSpecials.DESCRIPTOR)
+        self.assertEqual(
+            [[column.name for column in table.columns] for table in tables],
+            [
+                ['_id', 'fault1', 'fault2'],
+                ['_id', '_parent_id', '_index', 'value'],
+                ['_id', '_parent_id', '_key', 'value'],
+            ])
+
+    def test_generate_sqlite_ddl(self) -> None:
+        descriptors = [
+            td.ComplexMessage.DESCRIPTOR,
+            td.TestTypes.DESCRIPTOR,
+            td.TestSpecials.DESCRIPTOR,
+            td.TestNested.DESCRIPTOR,
+        ]
+        table_statements, index_statements = generate_sqlite_ddl(descriptors)
+        self.assertEqual(len(table_statements), 17)
+        self.assertEqual(len(index_statements), 13)
+        self.assertTrue(all(
+            statement.startswith('CREATE INDEX IF NOT EXISTS') for statement in index_statements))
+
+        connection = sqlite3.connect(':memory:')
+        connection.executescript(generate_sqlite_script(descriptors))
+        tables = [row[0] for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'")]
+        self.assertIn('ComplexMessage.n4s.raw_msgs_by_id', tables)
+
+    def test_recursive_message(self) -> None:
+        file_proto = descriptor_pb2.FileDescriptorProto(
+            name='recursive.proto', package='recursive', syntax='proto3')
+        node = file_proto.message_type.add(name='Node')
+        node.field.add(
+            name='name', number=1, type=FieldDescriptor.TYPE_STRING,
+            label=FieldDescriptor.LABEL_OPTIONAL)
+        node.field.add(
+            name='parent', number=2, type=FieldDescriptor.TYPE_MESSAGE,
+            type_name='.recursive.Node', label=FieldDescriptor.LABEL_OPTIONAL)
+        node.field.add(
+            name='children', number=3, type=FieldDescriptor.TYPE_MESSAGE,
+            type_name='.recursive.Node', label=FieldDescriptor.LABEL_REPEATED)
+        pool = descriptor_pool.DescriptorPool()
+        pool.Add(file_proto)
+
+        tables = get_table_schemas(pool.FindMessageTypeByName('recursive.Node'))
+        # messages recursing into a type being flattened are stored serialized
+        self.assertEqual(
+            [[(column.name, column.sql_type) for column in table.columns] for table in tables],
+            [
+                [('_id', 'INTEGER'), ('name', 'TEXT'), ('parent', 'BLOB')],
+                [('_id', 'INTEGER'), ('_parent_id', 'INTEGER'), ('_index', 'INTEGER'),
+                 ('value', 'BLOB')],
+            ])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import sqlite3
+from unittest import TestCase
+import unittest
+
+import test_data as td
+
+from protobuf_utility.transforms.sqlite_transformer import load_protos_to_sqlite
+
+
+class TestSqliteTransformer(TestCase):
+
+    def setUp(self) -> None:
+        self.connection = sqlite3.connect(':memory:')
+
+    def tearDown(self) -> None:
+        self.connection.close()
+
+    def _select(self, table: str, columns: str = '*') -> list:
+        return self.connection.execute(f'SELECT {columns} FROM "{table}" ORDER BY _id').fetchall()
+
+    def test_load_protos_to_sqlite(self) -> None:
+        stats = load_protos_to_sqlite(
+            (td.n4, td.raw_msg, td.test_specials, td.n4_2), self.connection, batch_size=2)
+        self.assertEqual(stats.messages, 4)
+        self.assertEqual(stats.tables['N4'].rows, 2)
+        self.assertEqual(stats.tables['N4.raw_msgs'].rows, 5)
+        self.assertGreater(stats.tables['N4.raw_msgs'].rows_per_second, 0)
+
+        self.assertEqual(self._select('N4'), [(1, 23), (2, 23)])
+        self.assertEqual(
+            self._select('N4.raw_msgs'),
+            [
+                (1, 1, 0, 10, 23432, 'data'),
+                (2, 1, 1, 11, 23432, 'data'),
+                (3, 2, 0, 10, 23432, 'data'),
+                (4, 2, 1, 11, 23432, 'data'),
+                (5, 2, 2, 10, 23432, 'data'),
+            ])
+        self.assertEqual(
+            sorted(self._select('N4.raw_msgs_by_id', '_parent_id, _key, id')),
+            [(1, 'msg0', 10), (1, 'msg1', 11), (2, 'a', 10), (2, 'msg0', 10)])
+        self.assertEqual(self._select('common.RawMsg'), [(1, 10, 23432, 'data')])
+        self.assertEqual(
+            self._select('TestSpecials.list1', '_parent_id, _index, value'),
+            [(1, idx, value) for idx, value in enumerate(td.test_specials.list1)])
+        self.assertEqual(
+            sorted(self._select('TestSpecials.map1', '_key, value')),
+            sorted(td.test_specials.map1.items()))
+
+        indexes = [row[0] for row in self.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'")]
+        self.assertIn('N4.raw_msgs._parent_id', indexes)
+
+    def test_ids_continue(self) -> None:
+        load_protos_to_sqlite((td.n4,), self.connection)
+        stats = load_protos_to_sqlite((td.n4,), self.connection)
+        self.assertEqual(stats.tables['N4'].rows, 1)
+        self.assertEqual(
+            self._select('N4.raw_msgs', '_id, _parent_id'), [(1, 1), (2, 1), (3, 2), (4, 2)])
+
+    def test_types(self) -> None:
+        obj = td.TestTypes()
+        obj.CopyFrom(td.test_types)
+        obj.val6 = 2**63 + 5
+        load_protos_to_sqlite((obj,), self.connection, create_indexes=False)
+        row = self._select('TestTypes')[0]
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info("TestTypes")')]
+        values = dict(zip(columns, row))
+        # uint64 values are stored in two's complement
+        self.assertEqual(values['val6'] & 0xFFFFFFFFFFFFFFFF, 2**63 + 5)
+        self.assertEqual(values['val15'], obj.val15)
+        self.assertEqual(values['val17.val1'], obj.val17.val1)
+        indexes = self.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()
+        self.assertEqual(indexes, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
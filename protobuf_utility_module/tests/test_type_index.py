@@ -0,0 +1,117 @@
+from pathlib import Path
+import tempfile
+from unittest import TestCase
+import unittest
+
+import test_data as td
+
+from protobuf_utility.logger.rotation import RotatingSegmentWriter
+from protobuf_utility.logger.rotation import index_segments
+from protobuf_utility.logger.rotation import read_segments
+from protobuf_utility.logger.segment import SegmentWriter
+from protobuf_utility.logger.type_index import TypeIndex
+from protobuf_utility.logger.type_index import index_path
+from protobuf_utility.logger.type_index import select_records
+from protobuf_utility.logger.type_index import update_index
+
+
+class TestTypeIndex(TestCase):
+
+    def setUp(self) -> None:
+        self.directory = Path(tempfile.mkdtemp())
+        self.path = self.directory / 'test.pblog'
+        # timestamps 0, 10, 20, ...
+        self.stream = (td.raw_msg, td.n4, td.test_types) * 5
+
+    def _write(self, writer: SegmentWriter, objs: tuple, first: int = 0) -> None:
+        for idx, obj in enumerate(objs, first):
+            writer.log(obj, timestamp=idx * 10)
+
+    def test_find(self) -> None:
+        with SegmentWriter(self.path) as writer:
+            self._write(writer, self.stream)
+        index = update_index(self.path)
+        self.assertTrue(index_path(self.path).exists())
+        self.assertTrue(index.complete)
+        self.assertEqual(index.type_names, ['common.RawMsg', 'N4', 'TestTypes'])
+        self.assertEqual(len(index), len(self.stream))
+        self.assertEqual(index.time_range('N4'), (10, 130))
+        self.assertIsNone(index.time_range('N6'))
+
+        timestamps, offsets = index.find('N4', 40, 100)
+        self.assertEqual(list(timestamps), [40, 70])
+        self.assertEqual(len(offsets), 2)
+        self.assertEqual(len(index.find('N6')[0]), 0)
+
+        loaded = TypeIndex.load(self.path)
+        self.assertEqual(loaded.type_names, index.type_names)
+        self.assertEqual(loaded.find('N4', 40, 100), (timestamps, offsets))
+        self.assertFalse(loaded.update())
+
+    def test_incremental_update(self) -> None:
+        writer = SegmentWriter(self.path, compression='zlib', block_size=64)
+        self._write(writer, self.stream[:4])
+        writer.sync()
+        index = update_index(self.path)
+        self.assertFalse(index.complete)
+        self.assertEqual(len(index), 4)
+
+        self._write(writer, self.stream[4:], first=4)
+        writer.close()
+        index = update_index(self.path)
+        self.assertTrue(index.complete)
+        self.assertEqual(len(index), len(self.stream))
+        self.assertEqual(list(index.find('common.RawMsg')[0]), [0, 30, 60, 90, 120])
+
+    def test_select_records(self) -> None:
+        for compression in (None, 'zlib'):
+            with SegmentWriter(self.path, compression=compression, block_size=64) as writer:
+                self._write(writer, self.stream)
+            if index_path(self.path).exists():
+                index_path(self.path).unlink()
+
+            records = list(select_records(self.path, ['TestTypes', 'N4'], 40, 110))
+            self.assertEqual(
+                [(record.type_name, record.timestamp) for record in records],
+                [('N4', 40), ('TestTypes', 50), ('N4', 70), ('TestTypes', 80), ('N4', 100)])
+            self.assertEqual(bytes(records[0].payload), td.n4.SerializeToString())
+            del records
+
+            records = list(select_records(self.path, start_timestamp=100, end_timestamp=120))
+            self.assertEqual([record.timestamp for record in records], [100, 110])
+            del records
+
+    def test_rebuild_replaced_segment(self) -> None:
+        with SegmentWriter(self.path) as writer:
+            self._write(writer, self.stream)
+        update_index(self.path)
+        with SegmentWriter(self.path) as writer:
+            self._write(writer, self.stream[:2])
+        self.assertEqual(len(update_index(self.path)), 2)
+
+    def test_read_segments_filters(self) -> None:
+        with RotatingSegmentWriter(self.directory, max_bytes=256) as writer:
+            self._write(writer, self.stream)
+        self.assertGreater(len(index_segments(self.directory)), 1)
+        records = read_segments(
+            self.directory, start_timestamp=20, end_timestamp=90, type_names=['N4'])
+        self.assertEqual([record.timestamp for record in records], [40, 70])
+
+    def test_read_only_directory(self) -> None:
+        with RotatingSegmentWriter(self.directory, max_bytes=256) as writer:
+            self._write(writer, self.stream)
+        self.directory.chmod(0o555)
+        try:
+            records = read_segments(self.directory, start_timestamp=20, type_names=['N4'])
+            self.assertEqual([record.timestamp for record in records], [40, 70, 100, 130])
+        finally:
+            self.directory.chmod(0o755)
+        # filtered reads leave no index behind unless asked to
+        self.assertEqual(list(self.directory.glob('*.idx*')), [])
+        path = next(self.directory.glob('*.pblog'))
+        list(select_records(path, ['N4'], persist=True))
+        self.assertTrue(index_path(path).exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
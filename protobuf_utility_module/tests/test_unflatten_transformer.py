@@ -0,0 +1,91 @@
+from pathlib import Path
+import tempfile
+from unittest import TestCase
+import unittest
+
+from google.protobuf import empty_pb2
+
+import test_data as td
+
+from protobuf_utility.transforms.csv_transformer import flatten_proto_to_csv
+from protobuf_utility.transforms.csv_transformer import flatten_same_proto_stream_to_csv
+from protobuf_utility.transforms.list_transformer import flatten_proto_to_list
+from protobuf_utility.transforms.unflatten_transformer import unflatten_csv_to_proto
+from protobuf_utility.transforms.unflatten_transformer import unflatten_csv_to_protos
+from protobuf_utility.transforms.unflatten_transformer import unflatten_list_to_proto
+
+
+class TestUnflattenTransformer(TestCase):
+
+    def test_unflatten_csv_to_proto(self) -> None:
+        objs = [
+            td.raw_msg,
+            td.n4,
+            td.n4_2,
+            td.complex_msg,
+            td.n6,
+            td.test_nested,
+            td.test_specials,
+            td.n3,
+            td.test_types,
+        ]
+        for obj in objs:
+            attrs, values = flatten_proto_to_csv(obj)
+            self.assertEqual(unflatten_csv_to_proto(attrs, values, type(obj)), obj)
+
+    def test_unflatten_list_to_proto(self) -> None:
+        attrs, values = flatten_proto_to_list(td.test_types)
+        self.assertEqual(unflatten_list_to_proto(attrs, values, td.TestTypes), td.test_types)
+
+    def test_unflatten_values(self) -> None:
+        obj = unflatten_csv_to_proto(
+            'val13,val15,val16,val19[1].val1',
+            "true,b'\\x00ab',type2,5",
+            td.TestTypes)
+        self.assertTrue(obj.val13)
+        self.assertEqual(obj.val15, b'\x00ab')
+        self.assertEqual(obj.val16, td.TYPES.type2)
+        # missing elements before a present one are kept as empty messages
+        self.assertEqual([element.val1 for element in obj.val19], [0, 5])
+
+        obj = unflatten_csv_to_proto(
+            'list1[0],list1[2],fault1,fault2', ',7,True,False', td.TestSpecials)
+        self.assertEqual(list(obj.list1), ['', '', '7'])
+        self.assertEqual(obj.WhichOneof('test_oneof'), 'fault1')
+
+        with self.assertRaises(ValueError):
+            unflatten_csv_to_proto('val17.missing', '1', td.TestTypes)
+        with self.assertRaises(ValueError):
+            unflatten_csv_to_proto('val19.val1', '1', td.TestTypes)
+        with self.assertRaises(ValueError):
+            unflatten_csv_to_proto('val19[0', '1', td.TestTypes)
+        # a bytes literal cut at a comma
+        with self.assertRaisesRegex(ValueError, "'val15'"):
+            unflatten_csv_to_proto('val15,val16', "b'a,b',type2", td.TestTypes)
+
+    def test_unflatten_csv_to_protos_comma(self) -> None:
+        objs = [td.test_specials, td.TestSpecials(list1=['a,b', 'c'], map1={'k': 'v'})]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = flatten_same_proto_stream_to_csv(iter(objs), Path(temp_dir) / 's.csv')
+            rows = unflatten_csv_to_protos(file_path, td.TestSpecials)
+            self.assertEqual(next(rows), td.test_specials)
+            with self.assertRaisesRegex(ValueError, 'Line 3 '):
+                next(rows)
+
+    def test_unflatten_empty(self) -> None:
+        attrs, values = flatten_proto_to_csv(empty_pb2.Empty())
+        self.assertEqual(unflatten_csv_to_proto(attrs, values, empty_pb2.Empty), empty_pb2.Empty())
+
+    def test_unflatten_csv_to_protos(self) -> None:
+        # rows with fewer repeated elements are padded with empty cells
+        objs = [td.n4_2, td.n4, td.n4_3, td.n4]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = flatten_same_proto_stream_to_csv(iter(objs), Path(temp_dir) / 'n4.csv')
+            self.assertEqual(list(unflatten_csv_to_protos(file_path, td.N4)), objs)
+            self.assertEqual(
+                list(unflatten_csv_to_protos(file_path, td.N4, serialized=True)),
+                [obj.SerializeToString() for obj in objs])
+
+
+if __name__ == "__main__":
+    unittest.main()
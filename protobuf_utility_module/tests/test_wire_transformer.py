@@ -0,0 +1,77 @@
+import mmap
+import tempfile
+from unittest import TestCase
+import unittest
+
+import test_data as td
+
+from protobuf_utility.transforms.list_transformer import flatten_proto_to_list
+from protobuf_utility.transforms.wire_transformer import flatten_wire_to_list
+
+
+class TestWireTransformer(TestCase):
+
+    def test_flatten_wire_to_list_matches_flatten_proto_to_list(self) -> None:
+        # message map entries are listed in wire order which can differ from the iteration order
+        # of a parsed map, so compare those messages as sets of attributes and values
+        for obj in (
+                td.raw_msg,
+                td.n4,
+                td.n4_2,
+                td.complex_msg,
+                td.n6,
+                td.n2,
+                td.test_nested,
+                td.test_specials,
+                td.n3,
+                td.test_types):
+            expected = flatten_proto_to_list(obj)
+            actual = flatten_wire_to_list(obj.SerializeToString(), obj.DESCRIPTOR)
+            self.assertEqual(
+                sorted(zip(*actual), key=str), sorted(zip(*expected), key=str),
+                obj.DESCRIPTOR.full_name)
+
+        for obj in (td.raw_msg, td.n6, td.test_nested, td.test_specials):
+            self.assertEqual(
+                flatten_wire_to_list(obj.SerializeToString(), obj.DESCRIPTOR),
+                flatten_proto_to_list(obj))
+
+    def test_flatten_wire_to_list_types(self) -> None:
+        # negative varints, zigzag encoding, fixed widths and missing fields
+        obj = td.TestTypes()
+        obj.val1 = 1.5
+        obj.val3 = -5
+        obj.val4 = -2**40
+        obj.val6 = 2**63 + 5
+        obj.val7 = -7
+        obj.val8 = -2**50
+        obj.val11 = -3
+        obj.val12 = -2**60
+        obj.val15 = b'\x00\xff'
+        self.assertEqual(
+            flatten_wire_to_list(obj.SerializeToString(), obj.DESCRIPTOR),
+            flatten_proto_to_list(obj))
+
+    def test_flatten_wire_to_list_memoryview_and_mmap(self) -> None:
+        data = td.n4.SerializeToString()
+        expected = flatten_wire_to_list(data, td.N4.DESCRIPTOR)
+        self.assertEqual(flatten_wire_to_list(memoryview(data), td.N4.DESCRIPTOR), expected)
+        with tempfile.TemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                self.assertEqual(flatten_wire_to_list(mapped, td.N4.DESCRIPTOR), expected)
+
+    def test_flatten_wire_to_list_projection(self) -> None:
+        projection = ['id', 'raw_msgs[1]', 'raw_msgs_by_id["msg1"].id']
+        self.assertEqual(
+            flatten_wire_to_list(td.n4.SerializeToString(), td.N4.DESCRIPTOR, projection),
+            flatten_proto_to_list(td.n4, projection))
+
+    def test_flatten_wire_to_list_truncated(self) -> None:
+        self.assertRaises(
+            ValueError, flatten_wire_to_list, td.n4.SerializeToString()[:-3], td.N4.DESCRIPTOR)
+
+
+if __name__ == "__main__":
+    unittest.main()